@@ -0,0 +1,46 @@
+# almacen_analisis.py - Almacén local de análisis ya calculados, indexado por analysis_id,
+# para generar el PDF después sin volver a subir la imagen ni repetir el trabajo de visión.
+# El almacén vive en la memoria del worker que atendió el análisis: los analysis_id solo son
+# válidos en ese worker (un único worker de gunicorn; el pool PROCESOS_CV no lo divide, solo calcula).
+# Un id de otro worker se reconoce por su prefijo y se responde con un error que lo explica
+import os
+
+from cache_analisis import CacheAnalisis
+from identificadores import nuevo_id
+
+# Cada análisis guarda la imagen en base64, así que el tamaño por defecto es moderado.
+# ALMACEN_ANALISIS_MAX=0 desactiva el almacén (los endpoints no devuelven analysis_id)
+MAX_ANALISIS_POR_DEFECTO = int(os.environ.get("ALMACEN_ANALISIS_MAX", 32))
+TTL_ANALISIS_POR_DEFECTO = float(os.environ.get("ALMACEN_ANALISIS_TTL", 1800))
+
+
+class AlmacenAnalisis:
+    """
+    Guarda el análisis completo (forma + medidas reales + tono) que se devolvió al cliente
+    y lo entrega por su analysis_id. Reutiliza la política LRU con caducidad de CacheAnalisis.
+    """
+
+    def __init__(self, max_entradas=MAX_ANALISIS_POR_DEFECTO, ttl_segundos=TTL_ANALISIS_POR_DEFECTO):
+        self._cache = CacheAnalisis(max_entradas=max_entradas, ttl_segundos=ttl_segundos)
+
+    @property
+    def activo(self):
+        return self._cache.max_entradas > 0
+
+    def registrar(self, analisis):
+        """Guardar el análisis y devolver su analysis_id (None si el almacén está desactivado)"""
+        if not self.activo:
+            return None
+        analysis_id = nuevo_id()
+        self._cache.guardar(analysis_id, analisis)
+        return analysis_id
+
+    def obtener(self, analysis_id):
+        """Devolver una copia del análisis, o None si el id no existe o ya caducó"""
+        if not isinstance(analysis_id, str):
+            return None
+        _, analisis = self._cache.obtener(analysis_id)
+        return analisis
+
+    def estadisticas(self):
+        return self._cache.estadisticas()
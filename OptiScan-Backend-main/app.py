@@ -1,26 +1,39 @@
 # ==================== IMPORTS ====================
 import os
+import io
 import base64
-import tempfile
 import json
 import cv2
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Forzar backend no interactivo
-import matplotlib.pyplot as plt
-import traceback
+import time
 
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, jsonify, request, send_file, g, Response
 from flask_cors import CORS
 
 # Tus módulos personalizados
-from mm import analizar_imagen_con_medidas_reales, PDFReportGeneratorExtendido
 from main_pdf import AnalizadorFormaRostroPDF
 from pdf import PDFReportGenerator
 
 # IMPORTACIONES DIRECTAS (sin subprocess)
-from main import analizar_imagen_archivo  # Función que retorna el análisis facial
-from tonos import analizar_tono_imagen     # Función que retorna el análisis de tono
+from pipeline import PipelineAnalisisCompleto, ERROR_DECODIFICACION  # Forma + tono + medidas con una sola detección
+from entrada_imagen import decodificar_imagen
+from almacen_analisis import AlmacenAnalisis
+from identificadores import creado_en_otro_proceso
+from ejecucion_procesos import EjecutorCV
+from trabajos_pdf import ColaTrabajosPDF, ColaLlena, COMPLETADO
+from calentamiento import Calentamiento
+from metricas import metricas_solicitudes, exponer_prometheus
+from respuesta_ligera import aligerar, referencias_recursos, obtener_recurso, bytes_recurso_imagen, RECURSOS, RECURSOS_IMAGEN
+from registro import (obtener_logger, normalizar_id_solicitud, establecer_id_solicitud,
+                      restablecer_id_solicitud, id_solicitud_actual, CABECERA_ID_SOLICITUD)
+
+logger = obtener_logger('app')
+
+# Espera máxima de una consulta de larga duración (long-poll) a /pdf-jobs/<job_id>
+ESPERA_MAXIMA_TRABAJO = 30
+
+# Tipos de contenido con los bytes del archivo de imagen directamente en el cuerpo
+TIPOS_IMAGEN_BINARIA = ('application/octet-stream', 'image/jpeg', 'image/png')
 
 # ==================== CONFIGURACIÓN ====================
 app = Flask(__name__)
@@ -30,23 +43,222 @@ CORS(app)  # En producción puedes limitar orígenes
 analizador = AnalizadorFormaRostroPDF()
 pdf_generator = PDFReportGenerator(analizador)
 
+# Pipelines unificados (una decodificación y una detección por solicitud)
+pipeline_completo = PipelineAnalisisCompleto()
+pipeline_pdf = PipelineAnalisisCompleto(analizador_forma=analizador)
+
+# Análisis y PDFs en el hilo de la solicitud o en un pool de procesos (PROCESOS_CV)
+ejecutor_cv = EjecutorCV(
+    pipeline_completo=pipeline_completo,
+    pipeline_pdf=pipeline_pdf,
+    generador_pdf=pdf_generator,
+    cache=pipeline_completo.cache
+)
+
+# Análisis devueltos al cliente, para generar el PDF por analysis_id sin re-subir la imagen
+almacen_analisis = AlmacenAnalisis()
+
+# Generación de PDFs en segundo plano (los hilos arrancan con el primer trabajo)
+cola_pdf = ColaTrabajosPDF()
+
+# Precalentamiento de modelos por proceso; /ready responde 200 solo cuando termina
+calentamiento = Calentamiento()
+
+# ==================== FUNCIONES AUXILIARES ====================
+def imagen_de_solicitud():
+    """
+    Imagen y demás campos de la solicitud, en cualquiera de los formatos admitidos:
+    - application/octet-stream (o image/jpeg, image/png): bytes del archivo en el cuerpo
+    - multipart/form-data: archivo en el campo 'image' (el resto de campos, como datos)
+    - JSON {"image": "<base64>", ...}: formato original, por compatibilidad
+    Los bytes se decodifican después con np.frombuffer, sin pasar por base64.
+    Devuelve (imagen, datos); imagen es None si la solicitud no la incluye
+    """
+    if request.mimetype in TIPOS_IMAGEN_BINARIA:
+        return request.get_data(cache=False) or None, {}
+    if request.mimetype == 'multipart/form-data':
+        datos = request.form.to_dict()
+        archivo = request.files.get('image')
+        return (archivo.read() if archivo else datos.get('image')) or None, datos
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict):
+        return None, {}
+    return datos.get('image') or None, datos
+
+def respuesta_ligera_solicitada():
+    """Modo ligero: ?slim=true o cabecera 'Prefer: return=minimal'"""
+    return (request.args.get('slim', '').lower() in ('1', 'true', 'si', 'sí')
+            or 'return=minimal' in request.headers.get('Prefer', ''))
+
+def respuesta_analisis(datos, analisis_guardado=None, **campos):
+    """
+    JSON de éxito de los endpoints de análisis. En modo ligero omite imágenes y landmarks
+    y, si hay analysis_id, añade 'recursos' con la URL de cada uno
+    """
+    if not respuesta_ligera_solicitada():
+        return jsonify({"success": True, "data": datos, **campos})
+    cuerpo = {"success": True, "data": aligerar(datos), **campos}
+    if analisis_guardado is not None:
+        cuerpo['recursos'] = referencias_recursos(analisis_guardado, campos.get('analysis_id'))
+    respuesta = jsonify(cuerpo)
+    respuesta.headers['Preference-Applied'] = 'return=minimal'
+    return respuesta
+
+def decodificar_imagen_request(imagen):
+    """Decodificar la imagen de la solicitud (base64 o bytes) directamente en memoria"""
+    try:
+        return decodificar_imagen(imagen)
+    except Exception as e:
+        logger.warning("Error decodificando imagen: %s", e)
+        return None
+
+def registrar_analisis(analisis):
+    """Guardar el análisis para el PDF y devolver su analysis_id (None si no se puede)"""
+    try:
+        return almacen_analisis.registrar(analisis)
+    except Exception as e:
+        logger.warning("No se pudo registrar el análisis: %s", e)
+        return None
+
+def analisis_pdf_desde_imagen(imagen):
+    """
+    Forma (analizador específico para PDF) + medidas reales + tono con una sola detección.
+    Devuelve (analisis_result, None) o (None, mensaje de error)
+    """
+    # Landmarks, tono y cuadrado de referencia salen de caché si la captura ya se analizó
+    resultados = ejecutor_cv.analizar(imagen, pdf=True)
+    if resultados.get('error') == ERROR_DECODIFICACION:
+        return None, 'Error procesando imagen: no se pudo decodificar'
+    analisis_result = resultados.get('forma_rostro')
+
+    if analisis_result and 'medidas_convertidas' in analisis_result:
+        logger.debug("Medidas reales integradas exitosamente")
+
+    # Combinar resultados si el análisis de tono fue exitoso
+    if analisis_result and 'tono_piel' in resultados:
+        analisis_result['tono_piel'] = resultados['tono_piel']
+        logger.debug("Análisis de tono de piel agregado al reporte")
+
+    if not analisis_result or analisis_result.get('estado') == 'error':
+        return None, 'Error en análisis facial'
+    return analisis_result, None
+
+def respuesta_pdf(analisis_result):
+    """Renderizar el PDF del análisis en memoria y devolverlo como descarga"""
+    logger.debug("Generando PDF completo con PDFReportGenerator...")
+    pdf_bytes = ejecutor_cv.generar_pdf(analisis_result)
+
+    if pdf_bytes is None:
+        logger.error("No se pudo generar el PDF")
+        return jsonify({'success': False, 'error': 'Error generando PDF report'}), 500
+
+    # Verificar tamaño del PDF
+    logger.debug("PDF generado en memoria (%s bytes)", len(pdf_bytes))
+    if len(pdf_bytes) == 0:
+        logger.error("PDF generado está vacío")
+        return jsonify({'success': False, 'error': 'PDF vacío generado'}), 500
+
+    # Se sirve desde memoria: no hay archivo temporal que limpiar
+    return send_file(
+        io.BytesIO(pdf_bytes),
+        as_attachment=True,
+        download_name='analisis_facial_optiscan.pdf',
+        mimetype='application/pdf'
+    )
+
+def respuesta_id_no_encontrado(campo, identificador):
+    """
+    404 de un analysis_id o job_id desconocido. Si el id lo creó otro proceso, el error lo dice:
+    los almacenes están en la memoria de cada worker y la consulta llegó a uno que no lo tiene
+    """
+    if creado_en_otro_proceso(identificador):
+        logger.warning("%s de otro worker: %s", campo, identificador)
+        error = (f"{campo} creado por otro worker del servidor (o por uno ya reiniciado): solo es válido "
+                 "en el worker que lo creó. Desplegar con un único worker (WEB_CONCURRENCY=1)")
+    else:
+        logger.warning("%s desconocido o caducado: %s", campo, identificador)
+        error = f"{campo} no encontrado o caducado"
+    return jsonify({'success': False, 'error': error}), 404
+
+def respuesta_pdf_almacenado(analysis_id):
+    """Renderizar el PDF de un análisis guardado: solo maquetación, sin trabajo de visión"""
+    analisis_result = almacen_analisis.obtener(analysis_id)
+    if analisis_result is None:
+        return respuesta_id_no_encontrado('analysis_id', analysis_id)
+    logger.debug("Análisis %s recuperado del almacén", analysis_id)
+    return respuesta_pdf(analisis_result)
+
+def iniciar_calentamiento():
+    """
+    Precalentar FaceMesh, forma, tono, referencia y PDF en segundo plano (una vez por proceso).
+    Se llama al arrancar el servidor o el worker de gunicorn, y desde /ready si aún no empezó
+    """
+    calentamiento.iniciar_en_segundo_plano(lambda: ejecutor_cv.calentar(calentamiento))
+
+def precargar_recursos():
+    """
+    Importar y preparar los recursos de solo lectura antes de crear los workers (gunicorn.conf.py).
+    Los workers creados por fork los comparten copy-on-write. FaceMesh, los hilos de la cola
+    de PDFs y el pool de procesos NO se crean aquí: cada worker los crea al primer uso.
+    """
+    # Módulos que el resto del código importa al primer uso
+    import mediapipe.python.solutions.face_mesh  # noqa: F401
+    import matplotlib.figure  # noqa: F401
+    from matplotlib import font_manager
+    from pdf import clase_fpdf_memoria
+    from recomendaciones import imagenes_marcos
+    clase_fpdf_memoria()
+    imagenes_marcos()  # imágenes de los marcos (bytes y base64), leídas una vez para todos los workers
+    font_manager.findfont('DejaVu Sans')  # caché de fuentes de la figura de /debug-figure
+    logger.info("Recursos precargados en el proceso maestro")
+
+# ==================== MÉTRICAS E ID DE SOLICITUDES ====================
+@app.before_request
+def iniciar_medicion_solicitud():
+    g.inicio_solicitud = time.perf_counter()
+    # Id de correlación de los logs: el de la cabecera X-Request-ID (proxy/cliente) o uno nuevo
+    g.token_id_solicitud = establecer_id_solicitud(
+        normalizar_id_solicitud(request.headers.get(CABECERA_ID_SOLICITUD)))
+
+@app.after_request
+def registrar_medicion_solicitud(respuesta):
+    # Se etiqueta por regla de ruta (/pdf-jobs/<job_id>), no por URL, para no crear una serie por id
+    inicio = g.pop('inicio_solicitud', None)
+    if inicio is not None and request.url_rule is not None and request.method != 'OPTIONS':
+        metricas_solicitudes.registrar(request.url_rule.rule, time.perf_counter() - inicio,
+                                       error=respuesta.status_code >= 500)
+    respuesta.headers[CABECERA_ID_SOLICITUD] = id_solicitud_actual()
+    return respuesta
+
+@app.teardown_request
+def finalizar_id_solicitud(_error=None):
+    # El hilo del servidor se reutiliza para otras solicitudes: no debe conservar este id
+    token = g.pop('token_id_solicitud', None)
+    if token is not None:
+        restablecer_id_solicitud(token)
+
 # ==================== FUNCIONES AUXILIARES (desde appdf.py) ====================
 def crear_figura_directamente(analisis):
     """Crear la figura de matplotlib directamente para debug"""
+    # matplotlib solo se necesita aquí: se importa al primer uso
+    import matplotlib
+    matplotlib.use('Agg')  # Forzar backend no interactivo
+    from matplotlib.figure import Figure
+
     try:
-        print("🎨 Creando figura directamente...")
+        logger.debug("Creando figura directamente...")
         
         if analisis is None:
-            print("❌ No hay análisis para crear figura")
+            logger.error("No hay análisis para crear figura")
             return None
         
         # Verificar que tenemos los datos necesarios
         if 'imagen_base64' not in analisis:
-            print("❌ No hay imagen_base64 en el análisis")
+            logger.error("No hay imagen_base64 en el análisis")
             return None
             
         if 'puntos_referencia' not in analisis:
-            print("❌ No hay puntos_referencia en el análisis")
+            logger.error("No hay puntos_referencia en el análisis")
             return None
         
         # Convertir base64 a imagen OpenCV
@@ -55,10 +267,10 @@ def crear_figura_directamente(analisis):
             nparr = np.frombuffer(image_data, np.uint8)
             imagen = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             if imagen is None:
-                print("❌ No se pudo decodificar la imagen base64")
+                logger.error("No se pudo decodificar la imagen base64")
                 return None
         except Exception as e:
-            print(f"❌ Error procesando imagen base64: {e}")
+            logger.error("Error procesando imagen base64: %s", e)
             return None
             
         puntos = analisis['puntos_referencia']
@@ -69,7 +281,7 @@ def crear_figura_directamente(analisis):
             cv2.rectangle(imagen, (x, y), (x+w, y+h), (0, 255, 0), 2)
         else:
             # Calcular rectángulo aproximado si no está disponible
-            print("⚠️ No hay rect_rostro, calculando uno aproximado...")
+            logger.warning("No hay rect_rostro, calculando uno aproximado...")
             todos_puntos = list(puntos.values())
             xs = [p[0] for p in todos_puntos]
             ys = [p[1] for p in todos_puntos]
@@ -152,24 +364,23 @@ def crear_figura_directamente(analisis):
             cv2.putText(imagen, f"FORMA: {forma}", (50, 50), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
         
-        # Crear la figura de matplotlib
-        plt.figure(figsize=(14, 10))
-        plt.imshow(cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB))
-        plt.title(f"ANÁLISIS DE FORMA FACIAL - {forma}", fontsize=16, weight='bold')
-        plt.axis('off')
+        # Crear la figura de matplotlib (API orientada a objetos, sin estado global de pyplot)
+        fig = Figure(figsize=(14, 10))
+        ax = fig.add_subplot()
+        ax.imshow(cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB))
+        ax.set_title(f"ANÁLISIS DE FORMA FACIAL - {forma}", fontsize=16, weight='bold')
+        ax.axis('off')
         
-        # Guardar la figura en un archivo temporal
-        temp_path = "temp_direct_figure.png"
-        plt.tight_layout()
-        plt.savefig(temp_path, dpi=150, bbox_inches='tight', facecolor='white')
-        plt.close()  # Cerrar la figura para liberar memoria
+        # Rasterizar la figura en memoria (cada solicitud tiene su propio buffer)
+        buffer = io.BytesIO()
+        fig.tight_layout()
+        fig.savefig(buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
         
-        print(f"✅ Figura directa guardada en: {temp_path}")
-        return temp_path
+        logger.debug("Figura directa generada en memoria (%s bytes)", buffer.tell())
+        return buffer.getvalue()
         
     except Exception as e:
-        print(f"❌ Error creando figura directa: {e}")
-        print(f"🔍 Traceback: {traceback.format_exc()}")
+        logger.exception("Error creando figura directa: %s", e)
         return None
 
 # ==================== ENDPOINTS DE ANÁLISIS (con imports directos) ====================
@@ -183,44 +394,25 @@ def check_camera():
 def analyze_face():
     """Endpoint para ejecutar el análisis facial con imagen capturada (incluye medidas reales)"""
     try:
-        data = request.get_json()
-        if not data or 'image' not in data:
+        imagen, _ = imagen_de_solicitud()
+        if imagen is None:
             return jsonify({"success": False, "error": "No se proporcionó imagen"}), 400
 
-        image_base64 = data['image']
-
-        # Guardar la imagen temporalmente
-        try:
-            image_bytes = base64.b64decode(image_base64.split(',')[-1])
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                temp_path = temp_file.name
-                temp_file.write(image_bytes)
-            print(f">>> Imagen temporal guardada en: {temp_path}")
-        except Exception as e:
-            return jsonify({"success": False, "error": f"Error al guardar imagen: {str(e)}"}), 400
-
-        # Llamada directa a la función de main (análisis de forma)
-        analysis_result = analizar_imagen_archivo(temp_path)
-
-        # Si el análisis de forma fue exitoso, agregar medidas reales y tono de piel
-        if analysis_result and analysis_result.get('estado') == 'exitoso':
-            # 1. Integrar medidas reales (píxeles a cm)
-            analysis_result = analizar_imagen_con_medidas_reales(image_base64, analysis_result)
-            
-            # 2. Agregar análisis de tono de piel (opcional pero recomendado)
-            tono_result = analizar_tono_imagen(temp_path)
-            if tono_result and tono_result.get('estado') == 'exitoso':
-                analysis_result['tono_piel'] = tono_result
-
-        # Limpiar archivo temporal
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        # Forma + medidas reales (píxeles a cm) + tono de piel con una sola detección
+        # (la imagen se decodifica en memoria y solo si el resultado no está en caché)
+        resultados = ejecutor_cv.analizar(imagen)
+        if resultados.get('error') == ERROR_DECODIFICACION:
+            return jsonify({"success": False, "error": "Error al decodificar imagen"}), 400
+        analysis_result = resultados.get('forma_rostro')
 
         if analysis_result and analysis_result.get('estado') == 'exitoso':
-            return jsonify({"success": True, "data": analysis_result})
+            if 'tono_piel' in resultados:
+                analysis_result['tono_piel'] = resultados['tono_piel']
+            # Con el analysis_id el cliente puede pedir el PDF sin volver a subir la imagen
+            analysis_id = registrar_analisis(analysis_result)
+            return respuesta_analisis(analysis_result, analysis_result, analysis_id=analysis_id)
         else:
-            error_msg = analysis_result.get('error', 'Error en análisis') if analysis_result else 'Análisis fallido'
-            return jsonify({"success": False, "error": error_msg}), 500
+            return jsonify({"success": False, "error": resultados.get('error', 'Error en análisis')}), 500
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -230,33 +422,20 @@ def analyze_face():
 def analyze_skin_tone():
     """Endpoint para análisis de tono de piel"""
     try:
-        data = request.get_json()
-        if not data or 'image' not in data:
+        imagen, _ = imagen_de_solicitud()
+        if imagen is None:
             return jsonify({"success": False, "error": "No se proporcionó imagen"}), 400
 
-        image_base64 = data['image']
-
-        # Guardar la imagen temporalmente
-        try:
-            image_bytes = base64.b64decode(image_base64.split(',')[-1])
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                temp_path = temp_file.name
-                temp_file.write(image_bytes)
-            print(f">>> Imagen temporal para tono guardada en: {temp_path}")
-        except Exception as e:
-            return jsonify({"success": False, "error": f"Error al guardar imagen: {str(e)}"}), 400
-
-        # Llamada directa a la función de tonos
-        analysis_result = analizar_tono_imagen(temp_path)
-
-        # Limpiar archivo temporal
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        # Solo la etapa de tono del pipeline (comparte caché con /analyze-face y /analyze-complete)
+        resultados = ejecutor_cv.analizar(imagen, forma=False, medidas_reales=False)
+        if resultados.get('error') == ERROR_DECODIFICACION:
+            return jsonify({"success": False, "error": "Error al decodificar imagen"}), 400
+        analysis_result = resultados.get('tono_piel')
 
         if analysis_result and analysis_result.get('estado') == 'exitoso':
-            return jsonify({"success": True, "data": analysis_result})
+            return respuesta_analisis(analysis_result)
         else:
-            return jsonify({"success": False, "error": analysis_result.get('error', 'Error en análisis')}), 500
+            return jsonify({"success": False, "error": resultados.get('error', 'Error en análisis')}), 500
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -266,41 +445,24 @@ def analyze_skin_tone():
 def analyze_complete():
     """Endpoint para análisis completo (forma + tono) con medidas reales"""
     try:
-        data = request.get_json()
-        if not data or 'image' not in data:
+        imagen, _ = imagen_de_solicitud()
+        if imagen is None:
             return jsonify({"success": False, "error": "No se proporcionó imagen"}), 400
 
-        image_base64 = data['image']
-
-        # Guardar la imagen temporalmente
-        try:
-            image_bytes = base64.b64decode(image_base64.split(',')[-1])
-            with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-                temp_path = temp_file.name
-                temp_file.write(image_bytes)
-            print(f">>> Imagen temporal para análisis completo: {temp_path}")
-        except Exception as e:
-            return jsonify({"success": False, "error": f"Error al guardar imagen: {str(e)}"}), 400
-
-        resultados = {}
-
-        # Análisis de forma (directo)
-        forma_data = analizar_imagen_archivo(temp_path)
-        if forma_data and forma_data.get('estado') == 'exitoso':
-            forma_data = analizar_imagen_con_medidas_reales(image_base64, forma_data)
-            resultados['forma_rostro'] = forma_data
-
-        # Análisis de tono (directo)
-        tono_data = analizar_tono_imagen(temp_path)
-        if tono_data and tono_data.get('estado') == 'exitoso':
-            resultados['tono_piel'] = tono_data
-
-        # Limpiar archivo temporal
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-
-        if resultados:
-            return jsonify({"success": True, "data": resultados})
+        # Una sola decodificación y una sola pasada de landmarks para forma, tono y medidas reales
+        resultados = ejecutor_cv.analizar(imagen)
+        if resultados.get('error') == ERROR_DECODIFICACION:
+            return jsonify({"success": False, "error": "Error al decodificar imagen"}), 400
+
+        if 'forma_rostro' in resultados or 'tono_piel' in resultados:
+            # El PDF necesita el análisis de forma; el tono va anidado como en /generate-pdf-report
+            analysis_id = analisis_pdf = None
+            if 'forma_rostro' in resultados:
+                analisis_pdf = dict(resultados['forma_rostro'])
+                if 'tono_piel' in resultados:
+                    analisis_pdf['tono_piel'] = resultados['tono_piel']
+                analysis_id = registrar_analisis(analisis_pdf)
+            return respuesta_analisis(resultados, analisis_pdf, analysis_id=analysis_id)
         else:
             return jsonify({"success": False, "error": "No se pudieron procesar los análisis"}), 500
 
@@ -308,118 +470,207 @@ def analyze_complete():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/analysis/<analysis_id>/<recurso>', methods=['GET'])
+def recurso_analisis(analysis_id, recurso):
+    """
+    Recursos que el modo ligero omite, servidos por referencia desde el análisis guardado:
+    imagen, imagen_tono e imagen_referencia como JPEG; puntos_faciales como JSON
+    """
+    if recurso not in RECURSOS:
+        return jsonify({"success": False, "error": f"Recurso desconocido: {recurso}"}), 404
+    analisis = almacen_analisis.obtener(analysis_id)
+    if analisis is None:
+        return respuesta_id_no_encontrado('analysis_id', analysis_id)
+    valor = obtener_recurso(analisis, recurso)
+    if not valor:
+        return jsonify({"success": False, "error": f"El análisis no contiene {recurso}"}), 404
+
+    if recurso in RECURSOS_IMAGEN:
+        return send_file(io.BytesIO(bytes_recurso_imagen(valor)), mimetype='image/jpeg')
+    return jsonify({"success": True, "data": valor})
+
+
+@app.route('/live', methods=['GET'])
+def liveness():
+    """Liveness: el proceso responde (no comprueba los modelos)"""
+    return jsonify({"status": "alive"})
+
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness: 200 solo cuando el precalentamiento terminó bien; 503 mientras tanto o si falló"""
+    iniciar_calentamiento()
+    estado = calentamiento.estado_dict()
+    return jsonify({"ready": calentamiento.listo, "calentamiento": estado}), 200 if calentamiento.listo else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latencias por etapa y por endpoint (cuenta, p50/p95/p99, errores) en formato de texto de Prometheus"""
+    cache = pipeline_completo.cache.estadisticas()
+    cola = cola_pdf.estadisticas()
+    texto = exponer_prometheus({
+        'optiscan_ready': ('Precalentamiento completado (1) o no (0)', int(calentamiento.listo)),
+        'optiscan_cache_aciertos': ('Aciertos de la cache de analisis', cache['aciertos']),
+        'optiscan_cache_fallos': ('Fallos de la cache de analisis', cache['fallos']),
+        'optiscan_cache_entradas': ('Entradas en la cache de analisis', cache['entradas']),
+        'optiscan_pdf_cola_profundidad': ('Trabajos de PDF en espera', cola['profundidad_cola']),
+        'optiscan_pdf_en_proceso': ('Trabajos de PDF en ejecucion', cola['en_proceso']),
+        'optiscan_pdf_rechazados': ('Trabajos de PDF rechazados por cola llena', cola['rechazados']),
+    })
+    return Response(texto, mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Endpoint para verificar el estado del servidor (versión combinada)"""
     return jsonify({
         "status": "healthy",
         "service": "OptiScan Backend Unificado (sin subprocess)",
-        "pdf_generator_initialized": pdf_generator is not None
+        "pdf_generator_initialized": pdf_generator is not None,
+        "ready": calentamiento.listo,
+        "calentamiento": calentamiento.estado_dict(),
+        "cache_analisis": pipeline_completo.cache.estadisticas(),
+        "ejecucion_cv": ejecutor_cv.estadisticas(),
+        "almacen_analisis": almacen_analisis.estadisticas(),
+        "trabajos_pdf": cola_pdf.estadisticas()
     })
 
 
 # ==================== ENDPOINTS DE PDF (desde appdf.py) ====================
 @app.route('/generate-pdf-report', methods=['POST', 'OPTIONS'])
 def generate_pdf_report():
-    """Endpoint para generar PDF del análisis facial"""
+    """
+    Endpoint para generar PDF del análisis facial.
+    Acepta {"analysis_id": ...} de un análisis previo (solo renderizado) o {"image": ...} (análisis completo)
+    """
     if request.method == 'OPTIONS':
         return '', 200
 
     try:
-        print("📨 Recibiendo solicitud para generar PDF...")
-        data = request.get_json()
-        
-        if not data or 'image' not in data:
-            print("❌ No se proporcionó imagen en la solicitud")
-            return jsonify({'success': False, 'error': 'No image data provided'}), 400
+        logger.debug("Recibiendo solicitud para generar PDF...")
+        imagen, data = imagen_de_solicitud()
         
-        base64_image = data['image']
-        print(f"📷 Imagen recibida (longitud base64: {len(base64_image)})")
-        
-        # Crear archivo temporal PDF
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-            temp_pdf_path = temp_file.name
-        
-        # Guardar imagen temporal
-        temp_img_path = "temp_pdf_analysis.jpg"
-        try:
-            if ',' in base64_image:
-                base64_image_clean = base64_image.split(',')[1]
-            else:
-                base64_image_clean = base64_image
-                
-            image_bytes = base64.b64decode(base64_image_clean)
-            with open(temp_img_path, 'wb') as f:
-                f.write(image_bytes)
-        except Exception as e:
-            return jsonify({'success': False, 'error': f'Error procesando imagen: {str(e)}'}), 400
+        if data.get('analysis_id'):
+            return respuesta_pdf_almacenado(data['analysis_id'])
         
-        # Analizar forma de rostro (con el analizador específico para PDF)
-        analisis_result = analizador.analizar_rostro(temp_img_path)
-        
-        # --- INTEGRAR MEDIDAS REALES ---
-        if analisis_result and analisis_result.get('estado') == 'exitoso':
-            print("🔄 Integrando medidas reales...")
-            analisis_result = analizar_imagen_con_medidas_reales(base64_image, analisis_result)
-            
-            if 'medidas_convertidas' in analisis_result:
-                print("✅ Medidas reales integradas exitosamente")
-            else:
-                print("⚠️ No se pudieron integrar medidas reales")
-        
-        # Analizar tono de piel (llamada directa)
-        tono_result = analizar_tono_imagen(temp_img_path)
-        
-        # Combinar resultados si el análisis de tono fue exitoso
-        if tono_result and tono_result.get('estado') == 'exitoso':
-            analisis_result['tono_piel'] = tono_result
-            print("✅ Análisis de tono de piel agregado al reporte")
+        if imagen is None:
+            logger.warning("No se proporcionó imagen en la solicitud")
+            return jsonify({'success': False, 'error': 'No image data provided'}), 400
         
-        # Limpiar imagen temporal
-        if os.path.exists(temp_img_path):
-            os.remove(temp_img_path)
+        logger.debug("Imagen recibida (%s %s)", len(imagen), 'caracteres base64' if isinstance(imagen, str) else 'bytes')
         
-        if not analisis_result or analisis_result.get('estado') == 'error':
-            return jsonify({'success': False, 'error': 'Error en análisis facial'}), 400
+        analisis_result, error = analisis_pdf_desde_imagen(imagen)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
 
-        print("📄 Generando PDF completo con PDFReportGenerator...")
-        pdf_path = pdf_generator.generar_pdf(analisis_result, temp_pdf_path)
-        
-        if pdf_path and os.path.exists(pdf_path):
-            # Verificar tamaño del PDF
-            file_size = os.path.getsize(pdf_path)
-            print(f"✅ PDF generado: {pdf_path} ({file_size} bytes)")
-            
-            if file_size == 0:
-                print("❌ PDF generado está vacío")
-                return jsonify({'success': False, 'error': 'PDF vacío generado'}), 500
-            
-            response = send_file(
-                pdf_path,
-                as_attachment=True,
-                download_name='analisis_facial_optiscan.pdf', 
-                mimetype='application/pdf'
-            )
-            
-            @response.call_on_close
-            def cleanup():
-                try:
-                    if os.path.exists(pdf_path):
-                        os.remove(pdf_path)
-                        print("🧹 PDF temporal limpiado")
-                except Exception as e:
-                    print(f"⚠️ Error limpiando archivo temporal: {e}")
+        return respuesta_pdf(analisis_result)
             
-            return response
+    except Exception as e:
+        logger.exception("Error crítico en generate-pdf-report")
+        return jsonify({'success': False, 'error': f'Error interno: {str(e)}'}), 500
+
+
+@app.route('/pdf-report/<analysis_id>', methods=['GET'])
+def pdf_report(analysis_id):
+    """Descargar el PDF de un análisis previo por su analysis_id (sin re-subir la imagen)"""
+    try:
+        return respuesta_pdf_almacenado(analysis_id)
+    except Exception as e:
+        logger.exception("Error crítico en pdf-report")
+        return jsonify({'success': False, 'error': f'Error interno: {str(e)}'}), 500
+
+
+# ==================== TRABAJOS DE PDF EN SEGUNDO PLANO ====================
+def trabajo_pdf_desde_imagen(imagen):
+    """Función ejecutada por la cola: análisis completo de la imagen + renderizado"""
+    def generar():
+        analisis_result, error = analisis_pdf_desde_imagen(imagen)
+        if error:
+            raise ValueError(error)
+        return ejecutor_cv.generar_pdf(analisis_result)
+    return generar
+
+
+@app.route('/pdf-jobs', methods=['POST', 'OPTIONS'])
+def crear_trabajo_pdf():
+    """
+    Encolar la generación de un PDF y devolver el job_id al instante (202).
+    Acepta {"analysis_id": ...} (solo renderizado) o {"image": ...} (análisis + renderizado)
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    try:
+        imagen, data = imagen_de_solicitud()
+        if data.get('analysis_id'):
+            analisis_result = almacen_analisis.obtener(data['analysis_id'])
+            if analisis_result is None:
+                return respuesta_id_no_encontrado('analysis_id', data['analysis_id'])
+            funcion = lambda: ejecutor_cv.generar_pdf(analisis_result)
+        elif imagen is not None:
+            funcion = trabajo_pdf_desde_imagen(imagen)
         else:
-            print("❌ No se pudo generar el PDF")
-            return jsonify({'success': False, 'error': 'Error generando PDF report'}), 500
-            
+            return jsonify({'success': False, 'error': 'Se requiere analysis_id o image'}), 400
+
+        try:
+            trabajo = cola_pdf.enviar(funcion)
+        except ColaLlena as e:
+            logger.warning("%s", e)
+            respuesta = jsonify({'success': False, 'error': str(e)})
+            respuesta.headers['Retry-After'] = '5'
+            return respuesta, 503
+
+        logger.debug("Trabajo PDF %s encolado", trabajo.id)
+        return jsonify({
+            'success': True,
+            **trabajo.a_dict(),
+            'status_url': f"/pdf-jobs/{trabajo.id}",
+            'download_url': f"/pdf-jobs/{trabajo.id}/download"
+        }), 202
+
     except Exception as e:
-        print(f"💥 Error crítico en generate-pdf-report: {traceback.format_exc()}")
+        logger.exception("Error crítico en pdf-jobs")
         return jsonify({'success': False, 'error': f'Error interno: {str(e)}'}), 500
 
 
+@app.route('/pdf-jobs/<job_id>', methods=['GET'])
+def estado_trabajo_pdf(job_id):
+    """Estado del trabajo. Con ?wait=N espera hasta N segundos a que termine (long-poll)"""
+    trabajo = cola_pdf.obtener(job_id)
+    if trabajo is None:
+        return respuesta_id_no_encontrado('job_id', job_id)
+
+    espera = min(max(request.args.get('wait', 0, type=float), 0), ESPERA_MAXIMA_TRABAJO)
+    if espera and not trabajo.finalizado:
+        trabajo.esperar(espera)
+
+    return jsonify({'success': True, **trabajo.a_dict()})
+
+
+@app.route('/pdf-jobs/<job_id>/download', methods=['GET'])
+def descargar_trabajo_pdf(job_id):
+    """Descargar el PDF de un trabajo completado (409 mientras siga en cola o en proceso)"""
+    trabajo = cola_pdf.obtener(job_id)
+    if trabajo is None:
+        return respuesta_id_no_encontrado('job_id', job_id)
+    if trabajo.estado != COMPLETADO:
+        return jsonify({'success': False, **trabajo.a_dict()}), 409
+
+    return send_file(
+        io.BytesIO(trabajo.resultado),
+        as_attachment=True,
+        download_name='analisis_facial_optiscan.pdf',
+        mimetype='application/pdf'
+    )
+
+
+@app.route('/pdf-jobs/metrics', methods=['GET'])
+def metricas_trabajos_pdf():
+    """Profundidad de cola y duración de los trabajos, para dimensionar PDF_TRABAJADORES"""
+    return jsonify(cola_pdf.estadisticas())
+
+
 @app.route('/debug-figure', methods=['POST', 'OPTIONS'])
 def debug_figure():
     """Endpoint solo para debug de la figura"""
@@ -427,40 +678,31 @@ def debug_figure():
         return '', 200
 
     try:
-        print("🐛 DEBUG: Probando creación de figura...")
-        data = request.get_json()
+        logger.debug("Probando creación de figura...")
+        imagen, _ = imagen_de_solicitud()
         
-        if not data or 'image' not in data:
+        if imagen is None:
             return jsonify({'success': False, 'error': 'No image'}), 400
         
-        base64_image = data['image']
-        
-        temp_img_path = "temp_debug.jpg"
-        if ',' in base64_image:
-            base64_image_clean = base64_image.split(',')[1]
-        else:
-            base64_image_clean = base64_image
-                
-        with open(temp_img_path, 'wb') as f:
-            f.write(base64.b64decode(base64_image_clean))
+        # Decodificar imagen en memoria (sin archivo temporal compartido entre solicitudes)
+        imagen = decodificar_imagen_request(imagen)
+        if imagen is None:
+            return jsonify({'success': False, 'error': 'No se pudo decodificar la imagen'}), 400
         
-        analisis_result = analizador.analizar_rostro(temp_img_path)
-        os.remove(temp_img_path)
+        analisis_result = analizador.analizar_rostro(imagen)
         
         if not analisis_result:
             return jsonify({'success': False, 'error': 'No se pudo analizar'}), 400
         
-        figura_path = crear_figura_directamente(analisis_result)
-        if figura_path and os.path.exists(figura_path):
-            with open(figura_path, "rb") as f:
-                figura_base64 = base64.b64encode(f.read()).decode('utf-8')
-            os.remove(figura_path)
+        figura_png = crear_figura_directamente(analisis_result)
+        if figura_png:
+            figura_base64 = base64.b64encode(figura_png).decode('utf-8')
             return jsonify({'success': True, 'figura': f"data:image/png;base64,{figura_base64}", 'forma': analisis_result.get('forma')})
         else:
             return jsonify({'success': False, 'error': 'No se pudo crear figura'}), 500
             
     except Exception as e:
-        print(f"💥 Error en debug: {traceback.format_exc()}")
+        logger.exception("Error en debug")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -470,7 +712,8 @@ def health_pdf():
     return jsonify({
         "status": "healthy", 
         "service": "OptiScan PDF Generator",
-        "pdf_generator": "active"
+        "pdf_generator": "active" if calentamiento.listo else calentamiento.estado,
+        "calentamiento_pdf_segundos": calentamiento.tiempos.get('pdf')
     })
 
 
@@ -479,4 +722,5 @@ if __name__ == '__main__':
     print(">>> Iniciando servidor Flask unificado para OptiScan (sin subprocess)...")
     port = int(os.environ.get("PORT", 5000))
     debug_mode = os.environ.get("FLASK_DEBUG", "False").lower() == "true"
+    iniciar_calentamiento()
     app.run(host='0.0.0.0', port=port, debug=debug_mode)
\ No newline at end of file
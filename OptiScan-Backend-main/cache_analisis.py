@@ -0,0 +1,94 @@
+# cache_analisis.py - Caché LRU con caducidad (TTL) de resultados de análisis, indexada por contenido de imagen
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Tamaño y caducidad de la caché (configurables por entorno). CACHE_ANALISIS_MAX=0 la desactiva
+MAX_ENTRADAS_POR_DEFECTO = int(os.environ.get("CACHE_ANALISIS_MAX", 64))
+TTL_POR_DEFECTO = float(os.environ.get("CACHE_ANALISIS_TTL", 600))
+
+
+class CacheAnalisis:
+    """
+    Caché thread-safe de resultados intermedios y finales del análisis.
+    Los valores se copian al guardar y al leer, así que quien los recibe puede
+    modificarlos (p. ej. anidar el tono en la forma) sin alterar la caché.
+    """
+
+    def __init__(self, max_entradas=MAX_ENTRADAS_POR_DEFECTO, ttl_segundos=TTL_POR_DEFECTO):
+        self.max_entradas = max(0, int(max_entradas))
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()  # clave -> (instante_guardado, valor)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        """Devolver (encontrado, valor). Las entradas caducadas cuentan como fallo"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and time.monotonic() - entrada[0] > self.ttl_segundos:
+                del self._entradas[clave]
+                entrada = None
+
+            if entrada is None:
+                self.fallos += 1
+                return False, None
+
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            valor = entrada[1]
+
+        return True, copy.deepcopy(valor)
+
+    def guardar(self, clave, valor):
+        """Guardar un valor, expulsando las entradas menos usadas si se supera el tamaño"""
+        if self.max_entradas == 0:
+            return
+        valor = copy.deepcopy(valor)
+        with self._lock:
+            self._entradas[clave] = (time.monotonic(), valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def obtener_o_calcular(self, clave, calcular):
+        """Devolver el valor en caché o calcularlo y guardarlo (también se guardan resultados None)"""
+        encontrado, valor = self.obtener(clave)
+        if encontrado:
+            return valor
+        valor = calcular()
+        self.guardar(clave, valor)
+        return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """Contadores de aciertos/fallos y ocupación para /health"""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / total, 3) if total else 0.0,
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'ttl_segundos': self.ttl_segundos,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache():
+    """Obtener (creándola la primera vez) la caché de análisis compartida por todo el proceso"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheAnalisis()
+    return _cache
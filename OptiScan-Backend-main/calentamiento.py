@@ -0,0 +1,147 @@
+# calentamiento.py - Precalentamiento de modelos al arrancar y estado de disponibilidad (readiness)
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from registro import obtener_logger
+
+logger = obtener_logger('calentamiento')
+
+# CALENTAMIENTO=false omite el precalentamiento (el proceso se declara listo al instante)
+CALENTAMIENTO_ACTIVO = os.environ.get("CALENTAMIENTO", "true").lower() == "true"
+
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+LISTO = 'listo'
+ERROR = 'error'
+
+
+def imagen_sintetica(ancho=640, alto=480):
+    """
+    Imagen BGR artificial para el calentamiento: fondo gris, óvalo color piel
+    y el cuadrado verde de referencia (no contiene un rostro real)
+    """
+    imagen = np.full((alto, ancho, 3), 190, dtype=np.uint8)
+    cv2.ellipse(imagen, (ancho // 2, alto // 2), (ancho // 6, alto // 3), 0, 0, 360, (140, 170, 215), -1)
+    lado = alto // 8
+    cv2.rectangle(imagen, (20, 20), (20 + lado, 20 + lado), (40, 180, 40), -1)
+    return imagen
+
+
+def landmarks_sinteticos(num_puntos=478, semilla=0):
+    """Landmarks normalizados (float32 (N, 3), como PoolFaceMesh.detectar) repartidos dentro del óvalo de imagen_sintetica()"""
+    rng = np.random.default_rng(semilla)
+    angulos = rng.uniform(0, 2 * np.pi, num_puntos)
+    radios = np.sqrt(rng.uniform(0.05, 1.0, num_puntos))
+    return np.column_stack((0.5 + radios * np.cos(angulos) / 6, 0.5 + radios * np.sin(angulos) / 3,
+                            np.zeros(num_puntos))).astype(np.float32)
+
+
+class Calentamiento:
+    """
+    Ejecuta una vez por proceso cada etapa real (FaceMesh, forma, referencia, medidas reales,
+    tono y PDF) con una imagen sintética, para que el primer usuario no pague la inicialización
+    del grafo de MediaPipe ni las importaciones diferidas. Guarda el tiempo de cada etapa.
+    """
+
+    def __init__(self, activo=CALENTAMIENTO_ACTIVO):
+        self.activo = activo
+        self.estado = PENDIENTE if activo else LISTO
+        self.tiempos = {}
+        self.errores = {}
+        self.detalles = {}  # resultado de las etapas adicionales (p. ej. tiempos de cada proceso del pool)
+        self.inicio = None
+        self.fin = None
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    @property
+    def listo(self):
+        return self.estado == LISTO
+
+    def iniciar_en_segundo_plano(self, funcion):
+        """Lanzar funcion() (que llama a ejecutar) en un hilo, una sola vez por proceso"""
+        with self._lock:
+            if self._hilo is not None or self.estado != PENDIENTE:
+                return
+            self._hilo = threading.Thread(target=funcion, name="calentamiento", daemon=True)
+            self._hilo.start()
+
+    def _etapa(self, nombre, funcion):
+        t0 = time.perf_counter()
+        try:
+            return funcion()
+        except Exception as e:
+            logger.error("Calentamiento: etapa '%s' fallida: %s", nombre, e)
+            self.errores[nombre] = str(e)
+            return None
+        finally:
+            self.tiempos[nombre] = round(time.perf_counter() - t0, 3)
+
+    def ejecutar(self, pipelines=(), generador_pdf=None, etapas=None):
+        """
+        Pasar la imagen sintética por las etapas de cada pipeline y renderizar un PDF.
+        etapas: {nombre: funcion} adicionales (p. ej. esperar al calentamiento del pool de procesos)
+        """
+        from mm import analizar_medidas_reales_imagen, detectar_referencia_imagen
+
+        self.estado = EN_CURSO
+        self.inicio = time.time()
+        logger.info("Calentamiento: iniciando...")
+
+        imagen = imagen_sintetica()
+        imagen_rgb = cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB)
+        landmarks = landmarks_sinteticos()
+        analisis = None
+
+        for i, pipeline in enumerate(pipelines):
+            sufijo = f"_{i}" if i else ""
+            self._etapa(f"facemesh{sufijo}", lambda: pipeline.detectar_landmarks(imagen_rgb))
+            if pipeline.config_face_mesh_tono != pipeline.config_face_mesh:
+                self._etapa(f"facemesh_tono{sufijo}",
+                            lambda: pipeline.detectar_landmarks(imagen_rgb, pipeline.config_face_mesh_tono))
+            puntos_espejo = pipeline.landmarks_a_pixeles(landmarks, imagen.shape, espejo=True)
+            forma = self._etapa(f"forma{sufijo}",
+                                lambda: pipeline.analizador_forma.analizar_puntos(cv2.flip(imagen, 1), puntos_espejo))
+            puntos = pipeline.landmarks_a_pixeles(landmarks, imagen.shape)
+            tono = self._etapa(f"tono{sufijo}",
+                               lambda: pipeline.analizador_tono.analizar_tono_puntos(imagen_rgb, puntos))
+            if forma:
+                analisis = forma
+                if tono:
+                    analisis['tono_piel'] = tono
+
+        if pipelines:
+            deteccion = self._etapa("referencia", lambda: detectar_referencia_imagen(imagen))
+        if analisis is not None:
+            analisis = self._etapa(
+                "medidas_reales", lambda: analizar_medidas_reales_imagen(imagen, analisis, deteccion)) or analisis
+            if generador_pdf is not None:
+                self._etapa("pdf", lambda: generador_pdf(analisis))
+
+        for nombre, funcion in (etapas or {}).items():
+            resultado = self._etapa(nombre, funcion)
+            if resultado is not None:
+                self.detalles[nombre] = resultado
+
+        self.fin = time.time()
+        self.estado = ERROR if self.errores else LISTO
+        logger.info("Calentamiento: %s en %.2fs %s", self.estado, self.fin - self.inicio, self.tiempos)
+        return self.estado_dict()
+
+    def estado_dict(self):
+        datos = {
+            'estado': self.estado,
+            'activo': self.activo,
+            'tiempos_segundos': dict(self.tiempos),
+        }
+        if self.inicio is not None and self.fin is not None:
+            datos['duracion_segundos'] = round(self.fin - self.inicio, 3)
+        if self.detalles:
+            datos['detalles'] = dict(self.detalles)
+        if self.errores:
+            datos['errores'] = dict(self.errores)
+        return datos
@@ -0,0 +1,216 @@
+# clasificacion_forma.py - Clasificación de la forma del rostro con una tabla de reglas (intervalos
+# por medida y prioridad) compilada a un evaluador vectorizado: una fila de medidas o millones a la vez
+import json
+import os
+import threading
+
+import numpy as np
+
+from registro import obtener_logger
+
+logger = obtener_logger('clasificacion_forma')
+
+# Archivo JSON con reglas que sustituyen a las integradas (mismo formato que REGLAS_POR_DEFECTO)
+RUTA_REGLAS = os.environ.get("REGLAS_FORMA", "")
+
+# Filas evaluadas por bloque en los lotes: acota la memoria temporal en lotes muy grandes
+FILAS_POR_BLOQUE = 1 << 20
+
+# Cada regla exige que todas sus medidas caigan en su intervalo [min, max] (null = sin límite).
+# Un intervalo también puede escribirse {"min": a, "max": b, "min_exclusivo": bool, "max_exclusivo": bool}.
+# Gana la regla que se cumple con menor prioridad; si no se cumple ninguna, 'por_defecto'.
+REGLAS_POR_DEFECTO = {
+    'reglas': [
+        {'forma': 'Cuadrado', 'descripcion': 'Rostro con estructura angular y mandibula definida',
+         'prioridad': 10,
+         'condiciones': {'R_AA': [1.60, 1.80], 'R_BC': [2.5, 2.7], 'R_BD': [0.85, 0.90],
+                         'angulo_mandibula': [122, 128], 'curvatura': [6.0, 20.0]}},
+        {'forma': 'Diamante', 'descripcion': 'Rostro con pomulos anchos y estructura angular',
+         'prioridad': 20,
+         'condiciones': {'R_AA': [1.55, 1.75], 'R_BC': [2.3, 2.5], 'R_BD': [0.88, 0.93],
+                         'angulo_mandibula': [135, 140], 'curvatura': [4.0, 15.0]}},
+        {'forma': 'Ovalado', 'descripcion': 'Rostro con proporciones equilibradas y contornos suaves',
+         'prioridad': 30,
+         'condiciones': {'R_AA': [1.5, 1.8], 'R_BC': [2.0, 2.6], 'R_BD': [0.90, 1.05],
+                         'angulo_mandibula': [128, 135], 'curvatura': [None, 12.0]}},
+        {'forma': 'Oblongo', 'descripcion': 'Rostro muy alargado',
+         'prioridad': 40,
+         'condiciones': {'R_AA': [1.85, None], 'R_BD': [None, 0.85]}},
+        {'forma': 'Oblongo', 'descripcion': 'Rostro alargado con estructura definida',
+         'prioridad': 41,
+         'condiciones': {'R_AA': [1.80, None], 'R_BC': [2.3, 2.8], 'R_BD': [0.80, 0.85],
+                         'angulo_mandibula': [125, 140]}},
+        {'forma': 'Redondo', 'descripcion': 'Rostro con contornos curvos y proporciones balanceadas',
+         'prioridad': 50,
+         'condiciones': {'R_AA': [1.5, 1.7], 'R_BC': [2.4, 2.8], 'R_BD': [0.85, 0.92],
+                         'angulo_mandibula': [122, 128], 'curvatura': [3.8, None]}},
+        # Respaldo: criterios parciales cuando ninguna forma cumple todos sus rangos
+        {'forma': 'Cuadrado', 'descripcion': 'Rostro cuadrado (estructura angular)',
+         'prioridad': 100,
+         'condiciones': {'R_BD': [0.85, 0.90], 'angulo_mandibula': [122, 128]}},
+        {'forma': 'Diamante', 'descripcion': 'Rostro diamante (pomulos prominentes)',
+         'prioridad': 110,
+         'condiciones': {'R_BD': [0.88, 0.93], 'angulo_mandibula': [135, 140]}},
+        {'forma': 'Ovalado', 'descripcion': 'Rostro ovalado (proporciones balanceadas)',
+         'prioridad': 120,
+         'condiciones': {'R_BD': [0.90, 1.05], 'angulo_mandibula': [128, 135]}},
+        {'forma': 'Oblongo', 'descripcion': 'Rostro oblongo',
+         'prioridad': 130,
+         'condiciones': {'R_AA': [1.80, None], 'R_BD': [None, 0.85]}},
+        {'forma': 'Redondo', 'descripcion': 'Rostro redondeado',
+         'prioridad': 140,
+         'condiciones': {'R_AA': {'max': 1.2, 'max_exclusivo': True}}},
+    ],
+    'por_defecto': {'forma': 'Ovalado', 'descripcion': 'Rostro con proporciones equilibradas'},
+}
+
+
+def _leer_intervalo(regla, medida, intervalo):
+    """
+    Límites incluidos (min, max) de una condición; None en un extremo = sin límite.
+    Un extremo exclusivo se sustituye por el float siguiente (x > a equivale a x >= nextafter(a, inf))
+    """
+    if isinstance(intervalo, dict):
+        minimo, maximo = intervalo.get('min'), intervalo.get('max')
+        min_exclusivo, max_exclusivo = intervalo.get('min_exclusivo', False), intervalo.get('max_exclusivo', False)
+    elif isinstance(intervalo, (list, tuple)) and len(intervalo) == 2:
+        (minimo, maximo), min_exclusivo, max_exclusivo = intervalo, False, False
+    else:
+        raise ValueError(f"Regla '{regla}': intervalo de {medida} no válido: {intervalo!r}")
+    minimo = -np.inf if minimo is None else float(minimo)
+    maximo = np.inf if maximo is None else float(maximo)
+    if min_exclusivo:
+        minimo = float(np.nextafter(minimo, np.inf))
+    if max_exclusivo:
+        maximo = float(np.nextafter(maximo, -np.inf))
+    if minimo > maximo:
+        raise ValueError(f"Regla '{regla}': intervalo de {medida} vacío ({intervalo!r})")
+    return minimo, maximo
+
+
+class ClasificadorForma:
+    """
+    Tabla de reglas compilada para evaluar una fila o millones con el mismo resultado.
+    Por cada medida, los extremos de todas sus condiciones parten la recta en tramos y cada
+    tramo guarda una máscara de bits con las reglas que lo admiten (bit i = regla i por prioridad).
+    En un lote, cada columna se convierte en su tramo con searchsorted, las máscaras de las
+    medidas se combinan con AND y la regla ganadora es el bit más bajo que queda encendido.
+    """
+
+    MAX_REGLAS = 64  # bits de la máscara (uint64)
+
+    def __init__(self, tabla=REGLAS_POR_DEFECTO):
+        reglas = tabla.get('reglas')
+        por_defecto = tabla.get('por_defecto')
+        if not reglas or not isinstance(por_defecto, dict) or 'forma' not in por_defecto:
+            raise ValueError("La tabla de reglas necesita 'reglas' y 'por_defecto' con 'forma'")
+        if len(reglas) > self.MAX_REGLAS:
+            raise ValueError(f"Como máximo {self.MAX_REGLAS} reglas (hay {len(reglas)})")
+
+        # Orden de evaluación: prioridad y, a igual prioridad, orden en la tabla
+        reglas = sorted(reglas, key=lambda r: r.get('prioridad', 0))
+        self._condiciones = []
+        medidas = []
+        for regla in reglas:
+            if 'forma' not in regla or not regla.get('condiciones'):
+                raise ValueError(f"Regla sin 'forma' o sin 'condiciones': {regla!r}")
+            self._condiciones.append(tuple(
+                (medida, *_leer_intervalo(regla['forma'], medida, intervalo))
+                for medida, intervalo in regla['condiciones'].items()))
+            medidas += [m for m in regla['condiciones'] if m not in medidas]
+        self.medidas = tuple(medidas)
+
+        # Tramos por medida: (bordes, máscara de cada tramo, máscara para NaN = reglas sin esa medida)
+        self._tramos = []
+        for medida in self.medidas:
+            limites = {i: (minimo, maximo) for i, condiciones in enumerate(self._condiciones)
+                       for m, minimo, maximo in condiciones if m == medida}
+            libres = sum(1 << i for i in range(len(reglas)) if i not in limites)
+            # Tramo k = [bordes[k-1], bordes[k]); un intervalo [a, b] empieza en a y acaba en nextafter(b)
+            bordes = np.array(sorted({v for a, b in limites.values()
+                                      for v in (a, float(np.nextafter(b, np.inf))) if np.isfinite(v)}))
+            izquierdas = np.concatenate(([-np.inf], bordes))
+            mascaras = np.full(len(izquierdas), libres, dtype=np.uint64)
+            for i, (minimo, maximo) in limites.items():
+                mascaras[(minimo <= izquierdas) & (izquierdas <= maximo)] |= np.uint64(1 << i)
+            self._tramos.append((bordes, mascaras, np.uint64(libres)))
+        self._todas = np.uint64((1 << len(reglas)) - 1)
+
+        # Resultados posibles: uno por regla y el de por_defecto al final
+        self.resultados = [(r['forma'], r.get('descripcion', '')) for r in reglas]
+        self.resultados.append((por_defecto['forma'], por_defecto.get('descripcion', '')))
+        # Arrays de objetos: el lote copia referencias a los mismos str, no el texto de cada fila
+        self._formas = np.array([forma for forma, _ in self.resultados], dtype=object)
+        self._descripciones = np.array([descripcion for _, descripcion in self.resultados], dtype=object)
+
+    @classmethod
+    def desde_archivo(cls, ruta):
+        """Cargar la tabla de reglas desde un archivo JSON"""
+        with open(ruta, encoding='utf-8') as archivo:
+            return cls(json.load(archivo))
+
+    def clasificar(self, medidas):
+        """(forma, descripcion) para un diccionario de medidas (el de calcular_medidas_faciales)"""
+        for indice, condiciones in enumerate(self._condiciones):
+            for medida, minimo, maximo in condiciones:
+                if not minimo <= medidas[medida] <= maximo:
+                    break
+            else:
+                return self.resultados[indice]
+        return self.resultados[-1]
+
+    def indices_lote(self, medidas):
+        """
+        Índice en self.resultados de cada fila. medidas puede ser {medida: array} (p. ej. la salida
+        de medidas_faciales.calcular_medidas_lote) o un array (filas, len(self.medidas)) con las
+        columnas en el orden de self.medidas
+        """
+        if isinstance(medidas, dict):
+            columnas = [np.asarray(medidas[m], dtype=np.float64).ravel() for m in self.medidas]
+        else:
+            valores = np.asarray(medidas, dtype=np.float64)
+            if valores.ndim != 2 or valores.shape[1] != len(self.medidas):
+                raise ValueError(f"Se esperaba un array (filas, {len(self.medidas)}) y se recibió {valores.shape}")
+            columnas = list(valores.T)
+        filas = len(columnas[0])
+        if any(len(columna) != filas for columna in columnas):
+            raise ValueError("Todas las medidas deben tener el mismo número de filas")
+
+        indices = np.empty(filas, dtype=np.intp)
+        for inicio in range(0, filas, FILAS_POR_BLOQUE):
+            fin = min(inicio + FILAS_POR_BLOQUE, filas)
+            cumple = np.full(fin - inicio, self._todas)
+            for (bordes, mascaras, libres), columna in zip(self._tramos, columnas):
+                columna = columna[inicio:fin]
+                mascara = mascaras[np.searchsorted(bordes, columna, side='right')]
+                mascara[np.isnan(columna)] = libres  # NaN no cumple ningún intervalo
+                cumple &= mascara
+            # Bit más bajo encendido = primera regla por prioridad; ninguno -> por_defecto
+            bit_bajo = cumple & (~cumple + np.uint64(1))
+            primera = np.frexp(bit_bajo.astype(np.float64))[1] - 1
+            indices[inicio:fin] = np.where(cumple == 0, len(self.resultados) - 1, primera)
+        return indices
+
+    def clasificar_lote(self, medidas):
+        """Formas y descripciones (arrays de str) de muchas filas a la vez (mismas entradas que indices_lote)"""
+        indices = self.indices_lote(medidas)
+        return self._formas[indices], self._descripciones[indices]
+
+
+_clasificador = None
+_lock_clasificador = threading.Lock()
+
+
+def obtener_clasificador():
+    """Clasificador del proceso: reglas del archivo REGLAS_FORMA si está definido, o las integradas"""
+    global _clasificador
+    if _clasificador is None:
+        with _lock_clasificador:
+            if _clasificador is None:
+                if RUTA_REGLAS:
+                    _clasificador = ClasificadorForma.desde_archivo(RUTA_REGLAS)
+                    logger.info("Reglas de forma cargadas de %s (%s reglas)", RUTA_REGLAS,
+                                len(_clasificador.resultados) - 1)
+                else:
+                    _clasificador = ClasificadorForma()
+    return _clasificador
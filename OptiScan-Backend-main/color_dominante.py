@@ -0,0 +1,112 @@
+# color_dominante.py - Estimación del color dominante de un conjunto de píxeles de piel
+import os
+
+import numpy as np
+
+from metricas import medir_etapa
+from registro import obtener_logger
+
+logger = obtener_logger('color_dominante')
+
+# Estimador usado por defecto: "kmeans" (NumPy, sin dependencias) o "sklearn" (opcional)
+ESTIMADOR_POR_DEFECTO = os.environ.get("TONO_ESTIMADOR_COLOR", "kmeans")
+
+
+def _distancias_cuadradas(colores, centros):
+    """Matriz (N, k) de distancias euclídeas al cuadrado entre colores y centros"""
+    # |x - c|^2 = |x|^2 - 2 x·c + |c|^2 (un producto matricial en vez de un tensor N x k x 3)
+    return (np.einsum('ij,ij->i', colores, colores)[:, None]
+            - 2.0 * colores @ centros.T
+            + np.einsum('ij,ij->i', centros, centros)[None, :])
+
+
+def _semillas_kmeans_pp(colores, n_clusters, rng):
+    """Elegir centros iniciales con k-means++ (cada nuevo centro lejos de los anteriores)"""
+    centros = colores[[rng.integers(len(colores))]]
+    for _ in range(1, n_clusters):
+        # Recortar a 0 los residuos negativos de redondeo antes de usarlas como probabilidades
+        distancias = np.maximum(_distancias_cuadradas(colores, centros).min(axis=1), 0)
+        total = distancias.sum()
+        if total == 0:
+            siguiente = rng.integers(len(colores))
+        else:
+            siguiente = rng.choice(len(colores), p=distancias / total)
+        centros = np.vstack([centros, colores[siguiente]])
+    return centros
+
+
+def kmeans_numpy(colores, n_clusters=3, n_inicios=4, max_iter=30, semilla=42):
+    """
+    K-means determinista en NumPy con siembra k-means++.
+    Devuelve (centros, etiquetas) de la inicialización con menor inercia.
+    """
+    colores = np.asarray(colores, dtype=np.float64)
+    rng = np.random.default_rng(semilla)
+    mejor = None
+
+    for _ in range(n_inicios):
+        centros = _semillas_kmeans_pp(colores, n_clusters, rng)
+
+        for _ in range(max_iter):
+            etiquetas = _distancias_cuadradas(colores, centros).argmin(axis=1)
+
+            # Nuevos centros = media de cada cluster (un cluster vacío conserva su centro)
+            conteos = np.bincount(etiquetas, minlength=n_clusters)
+            sumas = np.stack([np.bincount(etiquetas, weights=colores[:, c], minlength=n_clusters)
+                              for c in range(colores.shape[1])], axis=1)
+            nuevos = np.where(conteos[:, None] > 0, sumas / np.maximum(conteos, 1)[:, None], centros)
+
+            if np.allclose(nuevos, centros):
+                break
+            centros = nuevos
+
+        distancias = _distancias_cuadradas(colores, centros)
+        etiquetas = distancias.argmin(axis=1)
+        inercia = distancias[np.arange(len(colores)), etiquetas].sum()
+        if mejor is None or inercia < mejor[0]:
+            mejor = (inercia, centros, etiquetas)
+
+    return mejor[1], mejor[2]
+
+
+def kmeans_sklearn(colores, n_clusters=3, semilla=42):
+    """K-means de scikit-learn (n_init=10), el comportamiento original; requiere sklearn instalado"""
+    from sklearn.cluster import KMeans
+
+    kmeans = KMeans(n_clusters=n_clusters, random_state=semilla, n_init=10)
+    etiquetas = kmeans.fit_predict(colores)
+    return kmeans.cluster_centers_, etiquetas
+
+
+ESTIMADORES = {
+    'kmeans': kmeans_numpy,
+    'sklearn': kmeans_sklearn,
+}
+
+
+def obtener_estimador(nombre=None):
+    """Obtener la función de clustering por nombre, con respaldo a NumPy si sklearn no está disponible"""
+    nombre = nombre or ESTIMADOR_POR_DEFECTO
+    if nombre not in ESTIMADORES:
+        logger.warning("Estimador de color desconocido '%s', usando 'kmeans'", nombre)
+        return kmeans_numpy
+    if nombre == 'sklearn':
+        try:
+            import sklearn  # noqa: F401
+        except ImportError:
+            logger.warning("scikit-learn no está instalado, usando el estimador 'kmeans' de NumPy")
+            return kmeans_numpy
+    return ESTIMADORES[nombre]
+
+
+@medir_etapa('kmeans')
+def color_dominante(colores, n_clusters=3, estimador=None):
+    """
+    Agrupar los colores y devolver (centro del cluster más grande, colores de ese cluster)
+    """
+    colores = np.asarray(colores)
+    n_clusters = min(n_clusters, len(colores))
+    centros, etiquetas = obtener_estimador(estimador)(colores, n_clusters=n_clusters)
+
+    cluster_principal = np.bincount(etiquetas, minlength=n_clusters).argmax()
+    return centros[cluster_principal], colores[etiquetas == cluster_principal]
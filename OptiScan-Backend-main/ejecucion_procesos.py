@@ -0,0 +1,206 @@
+# ejecucion_procesos.py - Ejecución de las etapas de visión y del PDF en un pool de procesos,
+# para repartir el trabajo (mucho Python puro que retiene el GIL) entre todos los núcleos
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from entrada_imagen import bytes_imagen, huella_imagen
+from metricas import metricas_etapas
+from registro import obtener_logger, contexto_solicitud, id_solicitud_actual
+
+logger = obtener_logger('ejecucion_procesos')
+
+# Procesos de análisis. 0 = ejecutar en el hilo de la solicitud (comportamiento original)
+PROCESOS_POR_DEFECTO = int(os.environ.get("PROCESOS_CV", 0))
+# Método de arranque de los procesos: 'spawn' no hereda hilos ni grafos de MediaPipe del proceso padre
+INICIO_POR_DEFECTO = os.environ.get("PROCESOS_CV_INICIO", "spawn")
+
+# Analizadores del proceso trabajador, creados una vez por _inicializar_trabajador
+_trabajador = {}
+
+
+def crear_analizadores():
+    """Pipelines de análisis (general y para PDF) y generador de PDF de un proceso"""
+    from main_pdf import AnalizadorFormaRostroPDF
+    from pdf import PDFReportGenerator
+    from pipeline import PipelineAnalisisCompleto
+
+    analizador_pdf = AnalizadorFormaRostroPDF()
+    return {
+        'completo': PipelineAnalisisCompleto(),
+        'pdf': PipelineAnalisisCompleto(analizador_forma=analizador_pdf),
+        'generador_pdf': PDFReportGenerator(analizador_pdf),
+    }
+
+
+def _inicializar_trabajador():
+    """Crear los analizadores y precalentar todas las etapas una sola vez por proceso trabajador"""
+    from calentamiento import Calentamiento
+    from pool_facemesh import obtener_pool
+
+    _trabajador.update(crear_analizadores())
+    obtener_pool(**_trabajador['completo'].config_face_mesh)
+    obtener_pool(**_trabajador['completo'].config_face_mesh_tono)
+    calentamiento = Calentamiento()
+    if calentamiento.activo:
+        calentamiento.ejecutar([_trabajador['completo'], _trabajador['pdf']],
+                               _trabajador['generador_pdf'].generar_pdf_bytes)
+    _trabajador['calentamiento'] = calentamiento.estado_dict()
+    logger.info("Proceso de análisis %s listo", os.getpid())
+
+
+def _tarea_calentamiento():
+    return os.getpid(), _trabajador.get('calentamiento', {})
+
+
+# Las tareas devuelven también las latencias por etapa medidas en el proceso trabajador,
+# para que /metrics del proceso principal las incluya, y registran con el id de la solicitud
+def _tarea_analizar(id_solicitud, tipo, datos, opciones):
+    with contexto_solicitud(id_solicitud), metricas_etapas.capturar() as muestras:
+        resultado = _trabajador[tipo].analizar(datos, **opciones)
+    return resultado, muestras
+
+
+def _tarea_generar_pdf(id_solicitud, analisis):
+    with contexto_solicitud(id_solicitud), metricas_etapas.capturar() as muestras:
+        resultado = _trabajador['generador_pdf'].generar_pdf_bytes(analisis)
+    return resultado, muestras
+
+
+class EjecutorCV:
+    """
+    Punto único de ejecución de análisis y PDFs para los endpoints.
+    Con procesos=0 llama a los pipelines del propio proceso; con procesos>0 envía el trabajo
+    a un ProcessPoolExecutor cuyos procesos tienen sus analizadores ya inicializados,
+    y Flask solo hace E/S y despacho. Los resultados del pool se guardan en la caché
+    del proceso principal para que los reenvíos de la misma imagen no salgan de él.
+    """
+
+    def __init__(self, procesos=PROCESOS_POR_DEFECTO, metodo_inicio=INICIO_POR_DEFECTO,
+                 pipeline_completo=None, pipeline_pdf=None, generador_pdf=None, cache=None):
+        self.procesos = max(0, int(procesos))
+        self.metodo_inicio = metodo_inicio
+        self._locales = {
+            'completo': pipeline_completo,
+            'pdf': pipeline_pdf,
+            'generador_pdf': generador_pdf,
+        }
+        self.cache = cache
+        self._pool = None
+        self._lock = threading.Lock()
+        self.tareas_enviadas = 0
+        self.reinicios = 0
+        # Un worker creado por fork no hereda los procesos del pool: crea el suyo al primer uso
+        os.register_at_fork(after_in_child=self._reiniciar_tras_fork)
+
+    def _reiniciar_tras_fork(self):
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def en_procesos(self):
+        return self.procesos > 0
+
+    def _local(self, nombre):
+        """Analizador del propio proceso (se crean al primer uso si no se inyectaron)"""
+        if self._locales[nombre] is None:
+            with self._lock:
+                if self._locales[nombre] is None:
+                    self._locales.update(
+                        {k: v for k, v in crear_analizadores().items() if self._locales[k] is None})
+        return self._locales[nombre]
+
+    def _obtener_pool(self):
+        # El pool se crea al primer uso: importar este módulo en un proceso hijo no arranca otro pool
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.procesos,
+                    mp_context=multiprocessing.get_context(self.metodo_inicio),
+                    initializer=_inicializar_trabajador
+                )
+                logger.info("Pool de procesos de análisis iniciado (%s procesos, %s)", self.procesos, self.metodo_inicio)
+            return self._pool
+
+    def _ejecutar(self, funcion, *args):
+        """Ejecutar la tarea en el pool y esperar su resultado; si un proceso muere, el pool se recrea"""
+        pool = self._obtener_pool()
+        with self._lock:
+            self.tareas_enviadas += 1
+        try:
+            resultado, muestras = pool.submit(funcion, id_solicitud_actual(), *args).result()
+            metricas_etapas.incorporar(muestras)
+            return resultado
+        except BrokenProcessPool:
+            logger.error("Un proceso de análisis terminó inesperadamente, se recreará el pool")
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+                    self.reinicios += 1
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def analizar(self, imagen, pdf=False, **opciones):
+        """Equivalente a PipelineAnalisisCompleto.analizar (pdf=True usa el analizador de forma del PDF)"""
+        tipo = 'pdf' if pdf else 'completo'
+        if not self.en_procesos:
+            return self._local(tipo).analizar(imagen, **opciones)
+
+        from pipeline import ERROR_DECODIFICACION, VERSION_ANALISIS
+
+        # Solo viajan los bytes del archivo (sin base64) al proceso trabajador
+        try:
+            datos = bytes_imagen(imagen)
+            huella = huella_imagen(datos)
+        except Exception as e:
+            logger.warning("No se pudo leer la imagen: %s", e)
+            return {'error': ERROR_DECODIFICACION}
+
+        if self.cache is None:
+            return self._ejecutar(_tarea_analizar, tipo, datos, opciones)
+
+        clave = ('resultado', tipo, huella, tuple(sorted(opciones.items())), VERSION_ANALISIS)
+        return self.cache.obtener_o_calcular(clave, lambda: self._ejecutar(_tarea_analizar, tipo, datos, opciones))
+
+    def generar_pdf(self, analisis):
+        """Bytes del PDF del análisis (maquetación en el pool si está activo)"""
+        if not self.en_procesos:
+            return self._local('generador_pdf').generar_pdf_bytes(analisis)
+        return self._ejecutar(_tarea_generar_pdf, analisis)
+
+    def calentar(self, calentamiento):
+        """
+        Precalentar donde se ejecutará el trabajo: los pipelines locales, o bien arrancar
+        el pool y esperar a que cada proceso termine el calentamiento de su inicializador
+        """
+        if not self.en_procesos:
+            return calentamiento.ejecutar([self._local('completo'), self._local('pdf')],
+                                          self._local('generador_pdf').generar_pdf_bytes)
+        return calentamiento.ejecutar(etapas={'procesos_cv': self._calentar_procesos})
+
+    def _calentar_procesos(self):
+        # Una tarea por proceso: el pool arranca todos sus procesos y cada uno se calienta al iniciar
+        pool = self._obtener_pool()
+        estados = {str(pid): estado for pid, estado in (futuro.result() for futuro in
+                   [pool.submit(_tarea_calentamiento) for _ in range(self.procesos)])}
+        fallidos = {pid: e for pid, e in estados.items() if e.get('estado') != 'listo'}
+        if fallidos:
+            raise RuntimeError(f"Calentamiento fallido en procesos {sorted(fallidos)}")
+        return estados
+
+    def cerrar(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def estadisticas(self):
+        return {
+            'procesos': self.procesos,
+            'metodo_inicio': self.metodo_inicio if self.en_procesos else None,
+            'pool_activo': self._pool is not None,
+            'tareas_enviadas': self.tareas_enviadas,
+            'reinicios': self.reinicios,
+        }
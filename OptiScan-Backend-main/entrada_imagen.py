@@ -0,0 +1,185 @@
+# entrada_imagen.py - Decodificación en memoria de las imágenes recibidas (sin archivos temporales)
+import base64
+import hashlib
+import io
+import os
+import struct
+import zlib
+
+import cv2
+import numpy as np
+
+# Lado mayor mínimo (px) de la imagen de trabajo sobre la que se detectan landmarks, se
+# analiza el tono y se codifican las imágenes de la respuesta. 0 = resolución original
+RESOLUCION_TRABAJO_POR_DEFECTO = int(os.environ.get("RESOLUCION_TRABAJO", 960))
+
+# Factores de reducción que cv2.imdecode aplica al decodificar un JPEG (escalado en el dominio DCT)
+LECTURA_REDUCIDA = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+
+def decodificar_bytes(image_bytes):
+    """Decodificar bytes JPEG/PNG a imagen BGR usando una vista np.frombuffer (sin copia)"""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def decodificar_base64(imagen_base64):
+    """Decodificar string base64 (con o sin prefijo data:image/...;base64,) a imagen BGR"""
+    return decodificar_bytes(base64.b64decode(imagen_base64.split(',')[-1]))
+
+
+def decodificar_imagen(fuente):
+    """
+    Obtener imagen BGR desde cualquier formato de entrada soportado:
+    ndarray ya decodificado, bytes crudos del archivo o string base64
+    """
+    if isinstance(fuente, np.ndarray):
+        return fuente
+    if isinstance(fuente, (bytes, bytearray, memoryview)):
+        return decodificar_bytes(fuente)
+    if isinstance(fuente, str):
+        return decodificar_base64(fuente)
+    raise TypeError(f"Tipo de imagen no soportado: {type(fuente).__name__}")
+
+
+def info_jpeg(datos):
+    """Leer dimensiones y espacio de color de un JPEG en memoria (mismo criterio que FPDF._parsejpg)"""
+    f = io.BytesIO(datos)
+    while True:
+        marker_high, marker_low = struct.unpack('BB', f.read(2))
+        if marker_high != 0xFF or marker_low < 0xC0:
+            raise ValueError('No se encontró marcador JPEG')
+        elif marker_low == 0xDA:  # SOS
+            raise ValueError('No se encontró marcador SOF en el JPEG')
+        elif (marker_low == 0xC8 or
+              0xD0 <= marker_low <= 0xD9 or
+              0xF0 <= marker_low <= 0xFD):
+            continue
+        tamano, = struct.unpack('>H', f.read(2))
+        segmento = f.read(tamano - 2)
+        if marker_low in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                          0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            bpc, alto, ancho, capas = struct.unpack_from('>BHHB', segmento)
+            colspace = 'DeviceRGB' if capas == 3 else ('DeviceCMYK' if capas == 4 else 'DeviceGray')
+            return {'w': ancho, 'h': alto, 'cs': colspace, 'bpc': bpc, 'f': 'DCTDecode', 'data': datos}
+
+
+FIRMA_PNG = b'\x89PNG\r\n\x1a\n'
+
+
+def _flujo_png(canales):
+    """Filas (alto, ancho[, canales]) uint8 comprimidas con el byte de filtro PNG 'None' delante (Predictor 15)"""
+    filas = canales.reshape(canales.shape[0], -1)
+    return zlib.compress(np.hstack([np.zeros((len(filas), 1), np.uint8), filas]).tobytes())
+
+
+def info_png(datos):
+    """
+    Imagen FPDF (mismo formato que FPDF._parsepng) de un PNG en memoria: color RGB o gris
+    y, si el PNG tiene transparencia, el canal alfa como máscara suave
+    """
+    imagen = cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_UNCHANGED)
+    if imagen is None:
+        raise ValueError('No se pudo decodificar el PNG')
+    if imagen.dtype != np.uint8:  # 16 bits por canal
+        imagen = (imagen >> 8).astype(np.uint8)
+    alfa = None
+    if imagen.ndim == 3 and imagen.shape[2] == 4:
+        imagen, alfa = cv2.cvtColor(imagen, cv2.COLOR_BGRA2RGB), imagen[:, :, 3]
+    elif imagen.ndim == 3:
+        imagen = cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB)
+    alto, ancho = imagen.shape[:2]
+    colores = 1 if imagen.ndim == 2 else 3
+    info = {'w': ancho, 'h': alto, 'cs': 'DeviceGray' if colores == 1 else 'DeviceRGB', 'bpc': 8,
+            'f': 'FlateDecode', 'dp': f'/Predictor 15 /Colors {colores} /BitsPerComponent 8 /Columns {ancho}',
+            'pal': '', 'trns': '', 'data': _flujo_png(imagen)}
+    if alfa is not None:
+        info['smask'] = _flujo_png(alfa)
+    return info
+
+
+def factor_reduccion(ancho, alto, lado_objetivo=RESOLUCION_TRABAJO_POR_DEFECTO):
+    """Mayor factor (8, 4 o 2) que deja el lado mayor en al menos lado_objetivo; 1 = sin reducir"""
+    if lado_objetivo <= 0:
+        return 1
+    lado = max(ancho, alto)
+    for factor in LECTURA_REDUCIDA:
+        if lado / factor >= lado_objetivo:
+            return factor
+    return 1
+
+
+def _lectura_reducida_jpeg(datos, lado_objetivo):
+    """
+    Decodificar un JPEG directamente a 1/2, 1/4 o 1/8 de su tamaño.
+    Devuelve (imagen reducida, dimensiones originales (alto, ancho)) o None si no aplica
+    """
+    try:
+        info = info_jpeg(datos)
+    except (ValueError, struct.error):
+        return None  # no es un JPEG (PNG, etc.)
+    factor = factor_reduccion(info['w'], info['h'], lado_objetivo)
+    if factor == 1:
+        return None
+    reducida = cv2.imdecode(np.frombuffer(datos, np.uint8), LECTURA_REDUCIDA[factor])
+    if reducida is None:
+        return None
+    # imdecode aplica la orientación EXIF: las dimensiones del SOF pueden venir transpuestas
+    ancho_r, alto_r = -(-info['w'] // factor), -(-info['h'] // factor)
+    if reducida.shape[:2] == (alto_r, ancho_r):
+        return reducida, (info['h'], info['w'])
+    if reducida.shape[:2] == (ancho_r, alto_r):
+        return reducida, (info['w'], info['h'])
+    return None
+
+
+def decodificar_trabajo(fuente, lado_objetivo=RESOLUCION_TRABAJO_POR_DEFECTO):
+    """
+    Imagen de trabajo reducida por un factor entero (2, 4 u 8) y dimensiones originales.
+    Los JPEG se decodifican ya reducidos (IMREAD_REDUCED_*), sin pasar por la resolución
+    completa; el resto de formatos se decodifica y se reduce una vez con INTER_AREA.
+    Devuelve (imagen_trabajo, (alto, ancho) originales, imagen_completa o None si no se decodificó)
+    """
+    datos = bytes_imagen(fuente)
+    if isinstance(datos, bytes):
+        resultado = _lectura_reducida_jpeg(datos, lado_objetivo)
+        if resultado is not None:
+            return resultado[0], resultado[1], None
+
+    completa = decodificar_imagen(datos)
+    if completa is None:
+        return None, None, None
+    alto, ancho = completa.shape[:2]
+    factor = factor_reduccion(ancho, alto, lado_objetivo)
+    if factor == 1:
+        return completa, (alto, ancho), completa
+    trabajo = cv2.resize(completa, (-(-ancho // factor), -(-alto // factor)), interpolation=cv2.INTER_AREA)
+    return trabajo, (alto, ancho), completa
+
+
+def bytes_imagen(fuente):
+    """
+    Obtener los bytes crudos del archivo (JPEG/PNG) sin decodificar los píxeles.
+    Un ndarray ya decodificado se devuelve tal cual.
+    """
+    if isinstance(fuente, str):
+        return base64.b64decode(fuente.split(',')[-1])
+    if isinstance(fuente, (bytearray, memoryview)):
+        return bytes(fuente)
+    return fuente
+
+
+def huella_imagen(fuente):
+    """Hash del contenido de la imagen (bytes del archivo o píxeles), usado como clave de caché"""
+    fuente = bytes_imagen(fuente)
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(fuente, np.ndarray):
+        h.update(str(fuente.shape).encode())
+        h.update(np.ascontiguousarray(fuente).data)
+    else:
+        h.update(fuente)
+    return h.hexdigest()
@@ -0,0 +1,47 @@
+# gunicorn.conf.py - Servidor de producción: precarga en el proceso maestro y workers por fork
+#   gunicorn -c gunicorn.conf.py app:app
+# El maestro importa app.py y los módulos pesados (mediapipe, OpenCV, matplotlib, fpdf) una sola vez;
+# los workers se crean con fork y comparten esas páginas de solo lectura (copy-on-write),
+# así un worker nuevo arranca sin reimportar nada. FaceMesh se crea en cada worker al primer uso.
+# Un solo worker por defecto: los analysis_id y job_id viven en la memoria del worker que los creó,
+# y con varios workers una consulta que cae en otro responde 404. Se escala con hilos (GUNICORN_THREADS)
+# y, para la CPU, con el pool de procesos de análisis (PROCESOS_CV), que no divide esos almacenes.
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+# GUNICORN_PRELOAD=false vuelve al arranque clásico (cada worker importa la app por su cuenta)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def on_starting(server):
+    """Avisar si hay varios workers: cada uno tiene sus propios analysis_id y job_id"""
+    if server.cfg.workers > 1:
+        server.log.warning("%s workers: cada uno guarda sus propios analysis_id y job_id y las consultas "
+                           "que lleguen a otro worker no los encontrarán (escalar con PROCESOS_CV)",
+                           server.cfg.workers)
+
+
+def when_ready(server):
+    """Con la app ya importada (preload), precalentar recursos y congelar el heap antes del primer fork"""
+    if not preload_app:
+        return
+    from app import precargar_recursos
+    precargar_recursos()
+    # Los objetos ya creados quedan fuera del recolector: sus recorridos no tocan
+    # (ni copian) las páginas compartidas con los workers
+    gc.freeze()
+    server.log.info("Precarga completada: %d objetos congelados", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s creado (fork del maestro precargado)", worker.pid)
+
+
+def post_worker_init(worker):
+    """Precalentar los modelos del worker en segundo plano; /ready responde 200 al terminar"""
+    from app import iniciar_calentamiento
+    iniciar_calentamiento()
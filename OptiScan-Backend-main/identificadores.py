@@ -0,0 +1,20 @@
+# identificadores.py - Ids de los recursos guardados en memoria (analysis_id, job_id), marcados con
+# el proceso que los creó: una consulta que llega a otro worker sabe que el id no es suyo
+import os
+import uuid
+
+
+def nuevo_id():
+    """Id único con el pid del proceso creador como prefijo: '<pid hex>-<uuid hex>'"""
+    return f"{os.getpid():x}-{uuid.uuid4().hex}"
+
+
+def creado_en_otro_proceso(identificador):
+    """True si el id tiene formato válido y lo creó otro proceso (otro worker, o un worker reiniciado)"""
+    if not isinstance(identificador, str):
+        return False
+    prefijo, separador, _ = identificador.partition('-')
+    try:
+        return bool(separador) and int(prefijo, 16) != os.getpid()
+    except ValueError:
+        return False
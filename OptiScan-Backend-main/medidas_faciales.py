@@ -0,0 +1,103 @@
+# medidas_faciales.py - Núcleo vectorizado de medidas faciales: distancias, proporciones, ángulo
+# de la mandíbula y curvatura calculados con NumPy sobre el array de landmarks (uno o un lote)
+import numpy as np
+
+# Distancias lineales: nombre -> (landmark, landmark) de MediaPipe Face Mesh (imagen en espejo)
+PARES_DISTANCIA = {
+    'A': (10, 152),       # largo del rostro: frente_centro - barbilla
+    'B': (50, 280),       # ancho de los pómulos: pomulo_izquierdo_ext - pomulo_derecho_ext
+    'C': (109, 338),      # ancho de la frente: frente_izquierda - frente_derecha
+    'D': (172, 397),      # ancho de la mandíbula: mandibula_izquierda - mandibula_derecha
+    'E': (162, 389),      # ancho entre sienes: sien_izquierda - sien_derecha
+    'F': (468, 473),      # distancia entre ojos: centros del iris
+    'DNP_I': (168, 468),  # distancia nasopupilar izquierda: nariz_raiz - iris_izquierdo
+    'DNP_D': (168, 473),  # distancia nasopupilar derecha: nariz_raiz - iris_derecho
+}
+
+# Proporciones: nombre -> (numerador, denominador); 0 si el denominador es 0
+PROPORCIONES = {
+    'R_AA': ('A', 'B'),
+    'R_BC': ('B', 'C'),
+    'R_BD': ('B', 'D'),
+    'R_CD': ('C', 'D'),
+    'R_AE': ('A', 'E'),
+}
+
+# Ángulos de la mandíbula (pómulo, mandíbula como vértice, barbilla): izquierdo y derecho
+TRIOS_ANGULO = (
+    (116, 172, 152),
+    (345, 397, 152),
+)
+
+# Contorno del rostro (curvatura y dibujo del contorno en las figuras)
+CONTORNO_INDICES = (10, 338, 297, 332, 284, 251, 389, 356, 454, 323,
+                    361, 288, 397, 365, 379, 378, 400, 377, 152, 148,
+                    176, 149, 150, 136, 172, 58, 132, 93, 234, 127,
+                    162, 21, 54, 103, 67, 109)
+
+_NOMBRES_DISTANCIA = tuple(PARES_DISTANCIA)
+_PARES = np.array(tuple(PARES_DISTANCIA.values()))
+_TRIOS = np.array(TRIOS_ANGULO)
+_CONTORNO = np.array(CONTORNO_INDICES)
+_NUMERADORES = np.array([_NOMBRES_DISTANCIA.index(n) for n, _ in PROPORCIONES.values()])
+_DENOMINADORES = np.array([_NOMBRES_DISTANCIA.index(d) for _, d in PROPORCIONES.values()])
+
+
+def _normas(vectores):
+    """Norma euclídea sobre el último eje (einsum evita los temporales de np.linalg.norm)"""
+    return np.sqrt(np.einsum('...i,...i->...', vectores, vectores))
+
+
+def indices_contorno(num_puntos):
+    """Índices de CONTORNO_INDICES presentes en un array de num_puntos landmarks"""
+    return _CONTORNO[_CONTORNO < num_puntos]
+
+
+def calcular_medidas_lote(puntos):
+    """
+    Medidas de un lote de rostros: puntos (lote, N, 2) en píxeles -> {nombre: array (lote,)}.
+    Mismas claves y orden que AnalizadorFormaRostroAvanzado.calcular_medidas_faciales
+    """
+    puntos = np.asarray(puntos, dtype=np.float64)
+    if puntos.ndim != 3 or puntos.shape[-1] < 2:
+        raise ValueError(f"Se esperaba un array (lote, N, 2) y se recibió {puntos.shape}")
+    puntos = puntos[..., :2]
+
+    # Todas las distancias en una operación: (lote, pares)
+    distancias = _normas(puntos[:, _PARES[:, 0]] - puntos[:, _PARES[:, 1]])
+    medidas = dict(zip(_NOMBRES_DISTANCIA, distancias.T))
+    dip = medidas['DNP_I'] + medidas['DNP_D']
+    medidas['DIP'] = dip
+    medidas['diferencia_DIP'] = np.abs(dip - medidas['F'])
+
+    numeradores = distancias[:, _NUMERADORES]
+    denominadores = distancias[:, _DENOMINADORES]
+    proporciones = np.divide(numeradores, denominadores, out=np.zeros_like(numeradores),
+                             where=denominadores != 0)
+    medidas.update(zip(PROPORCIONES, proporciones.T))
+
+    # Ángulo en la mandíbula entre los vectores hacia el pómulo y hacia la barbilla: (lote, lados)
+    vertices = puntos[:, _TRIOS[:, 1]]
+    ba = puntos[:, _TRIOS[:, 0]] - vertices
+    bc = puntos[:, _TRIOS[:, 2]] - vertices
+    with np.errstate(invalid='ignore', divide='ignore'):
+        coseno = np.einsum('...i,...i->...', ba, bc) / (_normas(ba) * _normas(bc))
+    angulos = np.degrees(np.arccos(np.clip(coseno, -1.0, 1.0)))
+    medidas['angulo_mandibula'] = angulos.mean(axis=1)
+
+    # Curvatura: desviación típica de la distancia de cada punto del contorno a su centro
+    indices = indices_contorno(puntos.shape[1])
+    if len(indices) < 3:
+        medidas['curvatura'] = np.zeros(len(puntos))
+    else:
+        contorno = puntos[:, indices]
+        radios = _normas(contorno - contorno.sum(axis=1, keepdims=True) / len(indices))
+        desvios = radios - radios.sum(axis=1, keepdims=True) / len(indices)
+        medidas['curvatura'] = np.sqrt(np.einsum('ij,ij->i', desvios, desvios) / len(indices))
+    return medidas
+
+
+def calcular_medidas(puntos):
+    """Medidas de un rostro: puntos (N, 2) en píxeles -> {nombre: float} (serializable a JSON)"""
+    medidas = calcular_medidas_lote(np.asarray(puntos)[np.newaxis])
+    return {nombre: float(valor[0]) for nombre, valor in medidas.items()}
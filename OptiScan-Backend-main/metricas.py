@@ -0,0 +1,147 @@
+# metricas.py - Medición de latencia por etapa y exposición en formato de texto de Prometheus
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Muestras recientes por etapa usadas para los percentiles (ventana deslizante)
+VENTANA_MUESTRAS = int(os.environ.get("METRICAS_VENTANA", 1024))
+CUANTILES = (0.5, 0.95, 0.99)
+
+
+class SerieLatencias:
+    """Contador, suma, errores y ventana de las últimas duraciones de una etapa"""
+
+    def __init__(self, ventana=VENTANA_MUESTRAS):
+        self.cuenta = 0
+        self.errores = 0
+        self.suma = 0.0
+        self.muestras = deque(maxlen=ventana)
+
+    def registrar(self, duracion, error=False):
+        self.cuenta += 1
+        self.suma += duracion
+        self.muestras.append(duracion)
+        if error:
+            self.errores += 1
+
+    def cuantiles(self, cuantiles=CUANTILES):
+        if not self.muestras:
+            return {q: 0.0 for q in cuantiles}
+        ordenadas = sorted(self.muestras)
+        return {q: ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] for q in cuantiles}
+
+
+class RegistroMetricas:
+    """
+    Familia de latencias etiquetadas (p. ej. por etapa o por endpoint), thread-safe.
+    Se expone como un 'summary' de Prometheus más un contador de errores.
+    """
+
+    def __init__(self, nombre, ayuda, etiqueta):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self._series = {}
+        self._lock = threading.Lock()
+        self._captura = threading.local()
+
+    def registrar(self, valor_etiqueta, duracion, error=False):
+        with self._lock:
+            serie = self._series.get(valor_etiqueta)
+            if serie is None:
+                serie = self._series[valor_etiqueta] = SerieLatencias()
+            serie.registrar(duracion, error)
+        capturadas = getattr(self._captura, 'muestras', None)
+        if capturadas is not None:
+            capturadas.append((valor_etiqueta, duracion, error))
+
+    @contextmanager
+    def medir(self, valor_etiqueta):
+        """Medir el bloque 'with'; si lanza una excepción se cuenta como error"""
+        inicio = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.registrar(valor_etiqueta, time.perf_counter() - inicio, error)
+
+    @contextmanager
+    def capturar(self):
+        """
+        Acumular además las muestras del hilo actual durante el bloque, para enviarlas
+        desde un proceso del pool al proceso principal (ver ejecucion_procesos)
+        """
+        anteriores = getattr(self._captura, 'muestras', None)
+        self._captura.muestras = muestras = []
+        try:
+            yield muestras
+        finally:
+            self._captura.muestras = anteriores
+
+    def incorporar(self, muestras):
+        """Registrar muestras capturadas en otro proceso"""
+        for valor_etiqueta, duracion, error in muestras:
+            self.registrar(valor_etiqueta, duracion, error)
+
+    def resumen(self):
+        """Diccionario {etiqueta: {cuenta, errores, media, p50, p95, p99}} (en segundos)"""
+        with self._lock:
+            return {
+                valor: {
+                    'cuenta': serie.cuenta,
+                    'errores': serie.errores,
+                    'media': round(serie.suma / serie.cuenta, 6) if serie.cuenta else 0.0,
+                    **{f"p{int(q * 100)}": round(v, 6) for q, v in serie.cuantiles().items()},
+                }
+                for valor, serie in sorted(self._series.items())
+            }
+
+    def exponer(self):
+        """Líneas en formato de texto de Prometheus"""
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} summary"]
+        errores = [f"# HELP {self.nombre}_errores_total Ejecuciones fallidas por {self.etiqueta}",
+                   f"# TYPE {self.nombre}_errores_total counter"]
+        with self._lock:
+            for valor, serie in sorted(self._series.items()):
+                etiqueta = f'{self.etiqueta}="{valor}"'
+                for q, v in serie.cuantiles().items():
+                    lineas.append(f'{self.nombre}{{{etiqueta},quantile="{q}"}} {v:.6f}')
+                lineas.append(f"{self.nombre}_sum{{{etiqueta}}} {serie.suma:.6f}")
+                lineas.append(f"{self.nombre}_count{{{etiqueta}}} {serie.cuenta}")
+                errores.append(f"{self.nombre}_errores_total{{{etiqueta}}} {serie.errores}")
+        return lineas + errores
+
+
+# Latencia de cada etapa del análisis y del PDF, y de cada endpoint HTTP
+metricas_etapas = RegistroMetricas(
+    'optiscan_etapa_segundos', 'Duracion de cada etapa del analisis y del PDF', 'etapa')
+metricas_solicitudes = RegistroMetricas(
+    'optiscan_solicitud_segundos', 'Duracion de cada solicitud HTTP por endpoint', 'endpoint')
+
+
+def medir_etapa(etapa):
+    """Decorador: medir cada llamada de la función como la etapa indicada"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with metricas_etapas.medir(etapa):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def exponer_prometheus(indicadores=None):
+    """
+    Texto completo para /metrics: latencias por etapa y por endpoint, más indicadores
+    puntuales {nombre: (ayuda, valor)} como gauges (profundidad de cola, caché...)
+    """
+    lineas = metricas_etapas.exponer() + metricas_solicitudes.exponer()
+    for nombre, (ayuda, valor) in (indicadores or {}).items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge", f"{nombre} {valor}"]
+    return "\n".join(lineas) + "\n"
@@ -1,9 +1,30 @@
 # mm.py - Versión mejorada con detección robusta de cuadrado verde
+import logging
 import cv2
 import numpy as np
 import base64
 import json
-import traceback
+
+from entrada_imagen import decodificar_imagen
+from metricas import medir_etapa, metricas_etapas
+from registro import obtener_logger
+
+logger = obtener_logger('mm')
+
+# Lado mayor (px) de la imagen sobre la que se buscan candidatos verdes. Los umbrales
+# de área del cuadrado están pensados para fotos de hasta 720x1280, así que las
+# imágenes más grandes se reducen a ese tamaño para la búsqueda gruesa
+LADO_MAXIMO_BUSQUEDA = 1280
+
+# Umbral HSV único que cubre los verdes claro, intermedio y oscuro del cuadrado
+VERDE_HSV_BAJO = np.array([35, 30, 30])
+VERDE_HSV_ALTO = np.array([85, 255, 255])
+
+# Lado real del cuadrado de referencia
+LADO_CUADRADO_CM = 5.0
+
+# Medidas verticales (el resto se miden en horizontal y usan la escala del eje x)
+MEDIDAS_VERTICALES = {'A'}
 
 class ConversorMedidasReales:
     """
@@ -14,108 +35,194 @@ class ConversorMedidasReales:
     def __init__(self):
         self.pixeles_por_cm = None
         self.pixeles_por_mm = None
+        self.pixeles_por_cm_x = None
+        self.pixeles_por_cm_y = None
         self.referencia_detectada = False
-        print("✅ ConversorMedidasReales inicializado")
+        logger.debug("ConversorMedidasReales inicializado")
     
     def cargar_imagen_desde_base64(self, imagen_base64):
         """
-        Cargar imagen desde string base64
+        Cargar imagen desde string base64, bytes crudos o ndarray BGR ya decodificado
         """
         try:
-            # Decodificar imagen base64
-            if ',' in imagen_base64:
-                # Remover prefijo data:image/...;base64,
-                imagen_base64 = imagen_base64.split(',')[1]
-            
-            image_data = base64.b64decode(imagen_base64)
-            nparr = np.frombuffer(image_data, np.uint8)
-            imagen = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            imagen = decodificar_imagen(imagen_base64)
             
             if imagen is None:
-                print("❌ No se pudo decodificar la imagen desde base64")
+                logger.error("No se pudo decodificar la imagen desde base64")
                 return None
             
             return imagen
             
         except Exception as e:
-            print(f"❌ Error cargando imagen desde base64: {e}")
+            logger.error("Error cargando imagen desde base64: %s", e)
             return None
     
+    def reducir_para_busqueda(self, imagen):
+        """
+        Reducir la imagen para la búsqueda gruesa de candidatos.
+        Devuelve (imagen_reducida, escala) con escala = tamaño reducido / tamaño original.
+        """
+        h, w = imagen.shape[:2]
+        escala = min(1.0, LADO_MAXIMO_BUSQUEDA / float(max(h, w)))
+        if escala >= 1.0:
+            return imagen, 1.0
+        # INTER_LINEAR basta para localizar una mancha de color sólido y es ~10x más rápido que INTER_AREA
+        reducida = cv2.resize(imagen, (int(round(w * escala)), int(round(h * escala))),
+                              interpolation=cv2.INTER_LINEAR)
+        return reducida, escala
+    
+    def mascara_verde(self, imagen, iteraciones=2):
+        """Máscara de píxeles verdes con un único umbral HSV y limpieza morfológica"""
+        hsv = cv2.cvtColor(imagen, cv2.COLOR_BGR2HSV)
+        mascara = cv2.inRange(hsv, VERDE_HSV_BAJO, VERDE_HSV_ALTO)
+        
+        kernel = np.ones((3, 3), np.uint8)
+        mascara = cv2.morphologyEx(mascara, cv2.MORPH_CLOSE, kernel, iterations=iteraciones)
+        mascara = cv2.morphologyEx(mascara, cv2.MORPH_OPEN, kernel, iterations=iteraciones)
+        return mascara
+    
+    def refinar_candidato(self, imagen, contorno_reducido, escala):
+        """
+        Refinar un candidato encontrado en la imagen reducida: volver a segmentar
+        solo su ventana a resolución completa y devolver (contorno, aproximacion)
+        en coordenadas de la imagen original
+        """
+        h, w = imagen.shape[:2]
+        x, y, ancho, alto = cv2.boundingRect(contorno_reducido)
+        
+        # Ventana a resolución completa con margen de unos píxeles de la imagen reducida
+        margen = int(np.ceil(4 / escala))
+        x0 = max(0, int(x / escala) - margen)
+        y0 = max(0, int(y / escala) - margen)
+        x1 = min(w, int((x + ancho) / escala) + margen)
+        y1 = min(h, int((y + alto) / escala) + margen)
+        
+        ventana = imagen[y0:y1, x0:x1]
+        mascara = self.mascara_verde(ventana, iteraciones=1)
+        contornos, _ = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contornos:
+            return None, None
+        
+        contorno = max(contornos, key=cv2.contourArea) + np.array([x0, y0], dtype=np.int32)
+        perimetro = cv2.arcLength(contorno, True)
+        aproximacion = cv2.approxPolyDP(contorno, 0.02 * perimetro, True)
+        return contorno, aproximacion
+    
+    def ordenar_esquinas(self, esquinas):
+        """Ordenar las 4 esquinas en sentido horario (en coordenadas de imagen) empezando por la superior izquierda"""
+        centro = esquinas.mean(axis=0)
+        angulos = np.arctan2(esquinas[:, 1] - centro[1], esquinas[:, 0] - centro[0])
+        esquinas = esquinas[np.argsort(angulos)]
+        inicio = np.argmin(esquinas.sum(axis=1))
+        return np.roll(esquinas, -inicio, axis=0)
+    
+    def refinar_esquinas_subpixel(self, imagen, esquinas):
+        """
+        Refinar las esquinas con cornerSubPix sobre la máscara verde (suavizada) de una
+        ventana alrededor del cuadrado: sin la textura del fondo que sí tiene la imagen en grises
+        """
+        h, w = imagen.shape[:2]
+        lado = np.mean(np.linalg.norm(esquinas - np.roll(esquinas, 1, axis=0), axis=1))
+        radio = int(np.clip(lado / 10.0, 2, 10))
+        
+        margen = radio * 2 + 2
+        x0 = max(0, int(esquinas[:, 0].min()) - margen)
+        y0 = max(0, int(esquinas[:, 1].min()) - margen)
+        x1 = min(w, int(esquinas[:, 0].max()) + margen + 1)
+        y1 = min(h, int(esquinas[:, 1].max()) + margen + 1)
+        mascara = self.mascara_verde(imagen[y0:y1, x0:x1], iteraciones=1)
+        mascara = cv2.GaussianBlur(mascara, (5, 5), 0)
+        
+        origen = np.array([x0, y0], dtype=np.float32)
+        refinadas = (esquinas - origen).reshape(-1, 1, 2).astype(np.float32)
+        criterio = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+        cv2.cornerSubPix(mascara, refinadas, (radio, radio), (-1, -1), criterio)
+        refinadas = refinadas.reshape(4, 2) + origen
+        
+        # Si alguna esquina se escapa de su ventana, conservar la estimación entera
+        desplazamiento = np.linalg.norm(refinadas - esquinas, axis=1)
+        return np.where((desplazamiento <= radio)[:, None], refinadas, esquinas)
+    
+    def calibrar_con_homografia(self, imagen, aproximacion):
+        """
+        Calibrar la escala con la homografía entre las esquinas (subpíxel) del cuadrado
+        y el cuadrado real de 5x5 cm. Devuelve escala por eje, escala combinada y confianza.
+        """
+        esquinas = self.ordenar_esquinas(aproximacion.reshape(4, 2).astype(np.float32))
+        esquinas = self.refinar_esquinas_subpixel(imagen, esquinas)
+        
+        # Homografía imagen (px) -> plano del cuadrado (cm)
+        cuadrado_cm = np.array([[0, 0], [LADO_CUADRADO_CM, 0],
+                                [LADO_CUADRADO_CM, LADO_CUADRADO_CM], [0, LADO_CUADRADO_CM]], dtype=np.float32)
+        homografia = cv2.getPerspectiveTransform(esquinas, cuadrado_cm)
+        
+        # Jacobiano (cm por px) de la homografía en el centro del cuadrado
+        cx, cy = esquinas.mean(axis=0)
+        fila_w = homografia[2]
+        w_centro = fila_w @ np.array([cx, cy, 1.0])
+        uv = (homografia[:2] @ np.array([cx, cy, 1.0])) / w_centro
+        jacobiano = (homografia[:2, :2] - np.outer(uv, fila_w[:2])) / w_centro
+        
+        # Escala por eje de la imagen: 1 px en x (o en y) equivale a |J e_x| cm (o |J e_y|)
+        pixeles_por_cm_x = 1.0 / np.linalg.norm(jacobiano[:, 0])
+        pixeles_por_cm_y = 1.0 / np.linalg.norm(jacobiano[:, 1])
+        # Escala combinada: media geométrica local (invariante a la rotación del cuadrado)
+        pixeles_por_cm = 1.0 / np.sqrt(abs(np.linalg.det(jacobiano)))
+        
+        # Confianza: regularidad de lados, ángulos rectos, poca distorsión y tamaño suficiente
+        lados = np.linalg.norm(esquinas - np.roll(esquinas, -1, axis=0), axis=1)
+        regularidad = lados.min() / lados.max()
+        angulos = []
+        for j in range(4):
+            v1 = esquinas[j - 1] - esquinas[j]
+            v2 = esquinas[(j + 1) % 4] - esquinas[j]
+            cos_angulo = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2) + 1e-5)
+            angulos.append(np.degrees(np.arccos(np.clip(cos_angulo, -1.0, 1.0))))
+        ortogonalidad = max(0.0, 1.0 - max(abs(a - 90.0) for a in angulos) / 45.0)
+        valores_singulares = np.linalg.svd(jacobiano, compute_uv=False)
+        isotropia = valores_singulares.min() / valores_singulares.max()
+        precision = lados.mean() / (lados.mean() + 20.0)  # Error de ~1 px pesa menos en cuadrados grandes
+        confianza = float(np.clip(regularidad * ortogonalidad * isotropia * precision, 0.0, 1.0))
+        
+        return {
+            'esquinas': esquinas,
+            'homografia': homografia,
+            'lado_px': float(lados.mean()),
+            'pixeles_por_cm': float(pixeles_por_cm),
+            'pixeles_por_cm_x': float(pixeles_por_cm_x),
+            'pixeles_por_cm_y': float(pixeles_por_cm_y),
+            'confianza': confianza,
+        }
+    
+    @medir_etapa('cuadrado_verde')
     def detectar_cuadrado_verde(self, imagen):
         """
         Detectar el cuadrado verde de referencia de 5x5 cm en la imagen - VERSIÓN MEJORADA
+        Búsqueda gruesa sobre la imagen reducida y refinamiento en ventanas a resolución completa
         """
         try:
-            print("🔍 Buscando cuadrado verde de referencia (5x5 cm)...")
-            
-            # Hacer una copia para procesar
-            img_original = imagen.copy()
-            
-            # 1. Preprocesamiento: mejorar contraste y reducir ruido
-            # Convertir a LAB para mejor manipulación de luminosidad
-            lab = cv2.cvtColor(img_original, cv2.COLOR_BGR2LAB)
-            l, a, b = cv2.split(lab)
+            logger.debug("Buscando cuadrado verde de referencia (5x5 cm)...")
             
-            # Aplicar CLAHE para mejorar contraste
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-            l = clahe.apply(l)
-            lab = cv2.merge([l, a, b])
-            img_processed = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+            # 1. BÚSQUEDA GRUESA: candidatos verdes sobre la imagen reducida
+            img_busqueda, escala = self.reducir_para_busqueda(imagen)
+            mascara = self.mascara_verde(img_busqueda)
             
-            # Suavizar un poco para reducir ruido
-            img_blur = cv2.GaussianBlur(img_processed, (3, 3), 0)
-            
-            # 2. DETECCIÓN MÚLTIPLE DE COLOR VERDE
-            # Convertir a HSV para mejor detección de color
-            hsv = cv2.cvtColor(img_blur, cv2.COLOR_BGR2HSV)
-            
-            # Definir MULTIPLES rangos para verde (más flexibles)
-            # Verde claro/brillante
-            verde_bajo1 = np.array([35, 50, 50])    # H más bajo, más saturado
-            verde_alto1 = np.array([85, 255, 255])  # H más alto
-            
-            # Verde oscuro
-            verde_bajo2 = np.array([35, 30, 30])    # Más oscuro, menos saturado
-            verde_alto2 = np.array([85, 255, 200])
-            
-            # Verde intermedio
-            verde_bajo3 = np.array([40, 40, 40])
-            verde_alto3 = np.array([80, 255, 255])
-            
-            # Crear máscaras combinadas
-            mascara1 = cv2.inRange(hsv, verde_bajo1, verde_alto1)
-            mascara2 = cv2.inRange(hsv, verde_bajo2, verde_alto2)
-            mascara3 = cv2.inRange(hsv, verde_bajo3, verde_alto3)
-            
-            # Combinar todas las máscaras
-            mascara = cv2.bitwise_or(mascara1, mascara2)
-            mascara = cv2.bitwise_or(mascara, mascara3)
-            
-            # 3. MEJORAR LA MÁSCARA
-            # Operaciones morfológicas para limpiar la máscara
-            kernel = np.ones((3, 3), np.uint8)
-            mascara = cv2.morphologyEx(mascara, cv2.MORPH_CLOSE, kernel, iterations=2)
-            mascara = cv2.morphologyEx(mascara, cv2.MORPH_OPEN, kernel, iterations=2)
-            
-            # Dilatar un poco para unir áreas cercanas
-            mascara = cv2.dilate(mascara, kernel, iterations=1)
-            
-            # 4. ENCONTRAR Y FILTRAR CONTORNOS
+            # 2. ENCONTRAR Y FILTRAR CONTORNOS
             contornos, _ = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
             if not contornos:
-                print("⚠️ No se encontraron contornos verdes")
+                logger.debug("No se encontraron contornos verdes")
                 return None
             
             # Ordenar contornos por área (de mayor a menor)
             contornos = sorted(contornos, key=cv2.contourArea, reverse=True)
             
-            # 5. BUSCAR EL MEJOR CUADRADO
+            # 3. BUSCAR EL MEJOR CUADRADO
             mejores_cuadrados = []
             
-            for i, contorno in enumerate(contornos[:5]):  # Analizar solo los 5 más grandes
-                # Calcular área
-                area = cv2.contourArea(contorno)
+            for i, contorno_reducido in enumerate(contornos[:5]):  # Analizar solo los 5 más grandes
+                # Calcular área (en la imagen de búsqueda)
+                area = cv2.contourArea(contorno_reducido)
                 
                 # Filtrar por área mínima (ajustable según resolución)
                 # En una imagen de 720x1280, un cuadrado de 5x5 cm debería tener al menos:
@@ -124,25 +231,34 @@ class ConversorMedidasReales:
                 if area < 200 or area > 15000:
                     continue
                 
-                # Aproximar contorno a polígono
-                perimetro = cv2.arcLength(contorno, True)
-                aproximacion = cv2.approxPolyDP(contorno, 0.02 * perimetro, True)
+                # Descartar pronto lo que ni siquiera en la imagen reducida es un cuadrilátero
+                perimetro = cv2.arcLength(contorno_reducido, True)
+                if len(cv2.approxPolyDP(contorno_reducido, 0.02 * perimetro, True)) != 4:
+                    continue
+                
+                # 4. REFINAR a resolución completa solo en la ventana del candidato
+                contorno, aproximacion = self.refinar_candidato(imagen, contorno_reducido, escala)
                 
                 # Si no tiene 4 vértices, no es un cuadrilátero
-                if len(aproximacion) != 4:
+                if aproximacion is None or len(aproximacion) != 4:
                     continue
                 
+                area = cv2.contourArea(contorno)
+                
                 # Obtener rectángulo delimitador
                 x, y, w, h = cv2.boundingRect(aproximacion)
                 
+                # Rectángulo mínimo girado: aspecto y solidez no dependen de la rotación del cuadrado
+                _, (ancho_girado, alto_girado), _ = cv2.minAreaRect(aproximacion)
+                
                 # Calcular relación de aspecto (debe ser cercana a 1 para un cuadrado)
-                relacion_aspecto = w / float(h) if h > 0 else 0
-                if h > 0 and (relacion_aspecto < 0.7 or relacion_aspecto > 1.3):
+                relacion_aspecto = ancho_girado / float(alto_girado) if alto_girado > 0 else 0
+                if alto_girado > 0 and (relacion_aspecto < 0.7 or relacion_aspecto > 1.3):
                     continue  # No es cuadrado
                 
                 # Calcular solidez (qué tan compacto es)
                 area_contorno = cv2.contourArea(contorno)
-                area_bbox = w * h
+                area_bbox = ancho_girado * alto_girado
                 if area_bbox > 0:
                     solidez = area_contorno / area_bbox
                 else:
@@ -193,55 +309,66 @@ class ConversorMedidasReales:
                 })
             
             if not mejores_cuadrados:
-                print("⚠️ No se encontraron cuadrados verdes válidos")
+                logger.debug("No se encontraron cuadrados verdes válidos")
                 return None
             
-            # 6. SELECCIONAR EL MEJOR CUADRADO
+            # 5. SELECCIONAR EL MEJOR CUADRADO
             # Ordenar por puntuación
             mejores_cuadrados.sort(key=lambda x: x['puntuacion'], reverse=True)
             mejor = mejores_cuadrados[0]
             
             x, y, w, h = mejor['bbox']
-            print(f"✅ Cuadrado verde detectado: {w}x{h} píxeles")
-            print(f"   Área: {mejor['area']:.0f} px, Puntuación: {mejor['puntuacion']:.2f}")
-            print(f"   Relación aspecto: {mejor['relacion_aspecto']:.2f}, Solidez: {mejor['solidez']:.2f}")
-            
-            # 7. CALCULAR FACTOR DE CONVERSIÓN
-            # El cuadrado mide 5x5 cm en la realidad
-            # Usar el promedio de ancho y alto para mayor robustez
-            pixeles_por_cm = (w + h) / 2.0 / 5.0
+            logger.debug("Cuadrado verde detectado: %sx%s píxeles", w, h)
+            logger.debug("Área: %.0f px, Puntuación: %.2f, Relación aspecto: %.2f, Solidez: %.2f",
+                         mejor['area'], mejor['puntuacion'], mejor['relacion_aspecto'], mejor['solidez'])
+            
+            # 6. CALCULAR FACTOR DE CONVERSIÓN
+            # El cuadrado mide 5x5 cm en la realidad: esquinas subpíxel + homografía
+            # (el rectángulo delimitador sobreestima la escala si el cuadrado está girado)
+            calibracion = self.calibrar_con_homografia(imagen, mejor['aproximacion'])
+            pixeles_por_cm = calibracion['pixeles_por_cm']
             pixeles_por_mm = pixeles_por_cm / 10.0
             
             self.pixeles_por_cm = pixeles_por_cm
             self.pixeles_por_mm = pixeles_por_mm
+            self.pixeles_por_cm_x = calibracion['pixeles_por_cm_x']
+            self.pixeles_por_cm_y = calibracion['pixeles_por_cm_y']
             self.referencia_detectada = True
             
-            # 8. CREAR IMAGEN DE DEBUG
-            debug_img = img_original.copy()
+            logger.debug("Escala: %.2f px/cm (x: %.2f, y: %.2f), confianza: %.2f",
+                         pixeles_por_cm, self.pixeles_por_cm_x, self.pixeles_por_cm_y, calibracion['confianza'])
+            
+            # 7. CREAR IMAGEN DE DEBUG (a la resolución de búsqueda, no a la original)
+            debug_img = img_busqueda.copy()
+            aproximacion_debug = np.round(mejor['aproximacion'] * escala).astype(np.int32)
+            dx, dy, dw, dh = (int(round(v * escala)) for v in (x, y, w, h))
             
-            # Dibujar contorno del cuadrado detectado
-            cv2.drawContours(debug_img, [mejor['aproximacion']], -1, (0, 0, 255), 3)
+            # Dibujar contorno del cuadrado detectado y sus esquinas refinadas
+            cv2.drawContours(debug_img, [aproximacion_debug], -1, (0, 0, 255), 3)
+            for ex, ey in calibracion['esquinas'] * escala:
+                cv2.circle(debug_img, (int(round(ex)), int(round(ey))), 4, (0, 255, 255), -1)
             
             # Dibujar rectángulo delimitador
-            cv2.rectangle(debug_img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+            cv2.rectangle(debug_img, (dx, dy), (dx + dw, dy + dh), (255, 0, 0), 2)
             
             # Etiqueta con información
             label = f"Referencia: {w}x{h}px = 5x5cm"
-            cv2.putText(debug_img, label, (x, y - 20), 
+            cv2.putText(debug_img, label, (dx, dy - 20), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
             
             factor_label = f"Factor: {pixeles_por_cm:.2f} px/cm"
-            cv2.putText(debug_img, factor_label, (x, y - 45), 
+            cv2.putText(debug_img, factor_label, (dx, dy - 45), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
             
             # Marcar centro
-            centro_x = x + w // 2
-            centro_y = y + h // 2
+            centro_x = dx + dw // 2
+            centro_y = dy + dh // 2
             cv2.circle(debug_img, (centro_x, centro_y), 5, (0, 255, 0), -1)
             
             # Convertir a base64 para mostrar en frontend si es necesario
-            _, buffer = cv2.imencode('.jpg', debug_img)
-            debug_base64 = base64.b64encode(buffer).decode('utf-8')
+            with metricas_etapas.medir('jpeg_base64_referencia'):
+                _, buffer = cv2.imencode('.jpg', debug_img)
+                debug_base64 = base64.b64encode(buffer).decode('utf-8')
             
             return {
                 'detectado': True,
@@ -249,14 +376,23 @@ class ConversorMedidasReales:
                 'dimensiones_px': {'ancho': int(w), 'alto': int(h)},
                 'pixeles_por_cm': float(pixeles_por_cm),
                 'pixeles_por_mm': float(pixeles_por_mm),
+                'pixeles_por_cm_x': calibracion['pixeles_por_cm_x'],
+                'pixeles_por_cm_y': calibracion['pixeles_por_cm_y'],
+                'confianza': calibracion['confianza'],
+                'esquinas_px': calibracion['esquinas'].round(2).tolist(),
+                'homografia': calibracion['homografia'].tolist(),
                 'imagen_debug': f"data:image/jpeg;base64,{debug_base64}",
                 'factor_conversion': {
                     'cm': float(pixeles_por_cm),
                     'mm': float(pixeles_por_mm),
+                    'cm_x': calibracion['pixeles_por_cm_x'],
+                    'cm_y': calibracion['pixeles_por_cm_y'],
+                    'confianza': calibracion['confianza'],
                     'descripcion': f"{pixeles_por_cm:.2f} píxeles por centímetro"
                 },
                 'info_adicional': {
                     'area_px': int(mejor['area']),
+                    'lado_px': calibracion['lado_px'],
                     'relacion_aspecto': float(mejor['relacion_aspecto']),
                     'solidez': float(mejor['solidez']),
                     'puntuacion': float(mejor['puntuacion'])
@@ -264,8 +400,7 @@ class ConversorMedidasReales:
             }
             
         except Exception as e:
-            print(f"❌ Error detectando cuadrado verde: {e}")
-            traceback.print_exc()
+            logger.exception("Error detectando cuadrado verde: %s", e)
             return None
     
     def convertir_medidas_px_a_real(self, medidas_px, factor_conversion=None):
@@ -279,12 +414,23 @@ class ConversorMedidasReales:
         
         if factor_conversion is None:
             if not self.referencia_detectada:
-                print(f"⚠️ No hay referencia detectada, usando valor ajustado ({FACTOR_POR_DEFECTO} px/cm)")
+                logger.debug("No hay referencia detectada, usando valor ajustado (%s px/cm)", FACTOR_POR_DEFECTO)
                 pixeles_por_cm = FACTOR_POR_DEFECTO
+                pixeles_por_cm_x = pixeles_por_cm_y = None
             else:
                 pixeles_por_cm = self.pixeles_por_cm
+                pixeles_por_cm_x, pixeles_por_cm_y = self.pixeles_por_cm_x, self.pixeles_por_cm_y
         else:
             pixeles_por_cm = factor_conversion.get('cm', FACTOR_POR_DEFECTO)
+            pixeles_por_cm_x = factor_conversion.get('cm_x')
+            pixeles_por_cm_y = factor_conversion.get('cm_y')
+        
+        # Escala por eje si la calibración la aporta (medidas horizontales con x, verticales con y)
+        pixeles_por_cm_x = pixeles_por_cm_x or pixeles_por_cm
+        pixeles_por_cm_y = pixeles_por_cm_y or pixeles_por_cm
+        
+        def escala_medida(clave):
+            return pixeles_por_cm_y if clave in MEDIDAS_VERTICALES else pixeles_por_cm_x
         
         pixeles_por_mm = pixeles_por_cm / 10.0
         
@@ -299,7 +445,7 @@ class ConversorMedidasReales:
                 valor_px = float(medidas_px[clave])
                 
                 # Convertir a cm
-                valor_cm = valor_px / pixeles_por_cm
+                valor_cm = valor_px / escala_medida(clave)
                 medidas_cm[f'{clave}_cm'] = valor_cm
                 
                 # Convertir a mm
@@ -309,9 +455,9 @@ class ConversorMedidasReales:
         # Calcular medidas útiles para gafas
         medidas_optometria = {}
         if 'DNP_I' in medidas_px and 'DNP_D' in medidas_px:
-            dnp_i_cm = medidas_px['DNP_I'] / pixeles_por_cm
-            dnp_d_cm = medidas_px['DNP_D'] / pixeles_por_cm
-            dip_cm = medidas_px.get('DIP', 0) / pixeles_por_cm
+            dnp_i_cm = medidas_px['DNP_I'] / escala_medida('DNP_I')
+            dnp_d_cm = medidas_px['DNP_D'] / escala_medida('DNP_D')
+            dip_cm = medidas_px.get('DIP', 0) / escala_medida('DIP')
             
             # Recomendación de puente basado en DIP
             if dip_cm < 5.5:
@@ -323,7 +469,7 @@ class ConversorMedidasReales:
             
             # Recomendación de calibre basado en ancho de pómulos
             if 'B' in medidas_px:
-                ancho_pomulos_cm = medidas_px['B'] / pixeles_por_cm
+                ancho_pomulos_cm = medidas_px['B'] / escala_medida('B')
                 calibre = round(ancho_pomulos_cm * 0.9 * 10, 1)  # Convertir cm a mm y ajustar
                 if calibre < 50:
                     rec_calibre = {"calibre": f"{calibre:.1f} mm", "rango": "Pequeño (48-52 mm)"}
@@ -350,13 +496,15 @@ class ConversorMedidasReales:
             'factor_conversion': {
                 'pixeles_por_cm': pixeles_por_cm,
                 'pixeles_por_mm': pixeles_por_mm,
+                'pixeles_por_cm_x': pixeles_por_cm_x,
+                'pixeles_por_cm_y': pixeles_por_cm_y,
                 'dpi_estimado': pixeles_por_cm * 2.54  # Convertir a DPI
             }
         }
     
     def procesar_imagen_base64(self, imagen_base64):
         """
-        Proceso completo: decodificar imagen, detectar cuadrado verde
+        Proceso completo: decodificar imagen (base64, bytes o ndarray), detectar cuadrado verde
         """
         try:
             # Cargar imagen
@@ -365,36 +513,46 @@ class ConversorMedidasReales:
             if imagen is None:
                 return {"error": "No se pudo cargar la imagen"}
             
-            print(f"📏 Dimensiones de imagen: {imagen.shape[1]}x{imagen.shape[0]} píxeles")
+            return self.procesar_imagen(imagen)
+            
+        except Exception as e:
+            return {"error": f"Error procesando imagen: {str(e)}"}
+    
+    def procesar_imagen(self, imagen):
+        """
+        Detectar cuadrado verde sobre una imagen BGR ya decodificada
+        """
+        try:
+            logger.debug("Dimensiones de imagen: %sx%s píxeles", imagen.shape[1], imagen.shape[0])
             
             # Detectar cuadrado verde
             deteccion = self.detectar_cuadrado_verde(imagen)
             
             if not deteccion or not deteccion['detectado']:
-                print("⚠️ No se detectó cuadrado verde. Revisando posibles problemas...")
+                logger.debug("No se detectó cuadrado verde. Revisando posibles problemas...")
                 
-                # Intentar diagnóstico
+                # Intentar diagnóstico (sobre la imagen reducida: los porcentajes no cambian)
                 # Convertir a HSV para ver distribución de color
-                hsv = cv2.cvtColor(imagen, cv2.COLOR_BGR2HSV)
+                img_busqueda, escala = self.reducir_para_busqueda(imagen)
+                hsv = cv2.cvtColor(img_busqueda, cv2.COLOR_BGR2HSV)
                 
                 # Contar píxeles en rangos de verde
                 verde_bajo = np.array([35, 40, 40])
                 verde_alto = np.array([85, 255, 255])
                 mascara = cv2.inRange(hsv, verde_bajo, verde_alto)
-                pixeles_verdes = np.sum(mascara > 0)
                 total_pixeles = imagen.shape[0] * imagen.shape[1]
-                porcentaje_verde = (pixeles_verdes / total_pixeles) * 100
+                porcentaje_verde = (np.count_nonzero(mascara) / mascara.size) * 100
+                pixeles_verdes = int(round(porcentaje_verde / 100 * total_pixeles))
                 
-                print(f"  - Píxeles verdes detectados: {pixeles_verdes} ({porcentaje_verde:.1f}%)")
+                logger.debug("Píxeles verdes detectados: %s (%.1f%%)", pixeles_verdes, porcentaje_verde)
                 
-                # Mostrar histograma HSV para diagnóstico
-                h_hist = cv2.calcHist([hsv], [0], None, [180], [0, 180])
-                s_hist = cv2.calcHist([hsv], [1], None, [256], [0, 256])
-                v_hist = cv2.calcHist([hsv], [2], None, [256], [0, 256])
-                
-                print(f"  - Canal H (tono): máximo en {np.argmax(h_hist)}°")
-                print(f"  - Canal S (saturación): máximo en {np.argmax(s_hist)}")
-                print(f"  - Canal V (valor): máximo en {np.argmax(v_hist)}")
+                # Histograma HSV para diagnóstico: tres calcHist que solo se calculan con nivel DEBUG
+                if logger.isEnabledFor(logging.DEBUG):
+                    h_hist = cv2.calcHist([hsv], [0], None, [180], [0, 180])
+                    s_hist = cv2.calcHist([hsv], [1], None, [256], [0, 256])
+                    v_hist = cv2.calcHist([hsv], [2], None, [256], [0, 256])
+                    logger.debug("Máximos del histograma HSV: H %s°, S %s, V %s",
+                                 np.argmax(h_hist), np.argmax(s_hist), np.argmax(v_hist))
                 
                 sugerencias = []
                 if porcentaje_verde < 0.1:
@@ -435,23 +593,46 @@ def analizar_imagen_con_medidas_reales(imagen_base64, analisis_existente):
     Función principal que integra la detección del cuadrado verde
     y la conversión de medidas con el análisis existente
     """
+    return _integrar_medidas_reales(analisis_existente, imagen_base64=imagen_base64)
+
+
+def analizar_medidas_reales_imagen(imagen, analisis_existente, deteccion_result=None):
+    """
+    Igual que analizar_imagen_con_medidas_reales pero sobre una imagen BGR
+    ya decodificada (evita decodificar el base64 otra vez).
+    Si se pasa deteccion_result (de detectar_referencia_imagen) no se vuelve a buscar el cuadrado.
+    """
+    return _integrar_medidas_reales(analisis_existente, imagen=imagen, deteccion_result=deteccion_result)
+
+
+def detectar_referencia_imagen(imagen):
+    """Buscar el cuadrado de referencia en una imagen BGR (resultado reutilizable entre análisis)"""
+    return ConversorMedidasReales().procesar_imagen(imagen)
+
+
+def _integrar_medidas_reales(analisis_existente, imagen_base64=None, imagen=None, deteccion_result=None):
     try:
-        print("🔄 Integrando medidas reales en el análisis...")
+        logger.debug("Integrando medidas reales en el análisis...")
         
         # Crear conversor
         conversor = ConversorMedidasReales()
         
         # Procesar imagen para detección
-        deteccion_result = conversor.procesar_imagen_base64(imagen_base64)
+        if deteccion_result is not None:
+            logger.debug("Usando detección de referencia ya calculada")
+        elif imagen is not None:
+            deteccion_result = conversor.procesar_imagen(imagen)
+        else:
+            deteccion_result = conversor.procesar_imagen_base64(imagen_base64)
         
         # Si no hay detección, usar valor por defecto
         factor_conversion = None
         if 'deteccion' in deteccion_result and deteccion_result['deteccion']:
             factor_conversion = deteccion_result['deteccion']['factor_conversion']
-            print(f"✅ Referencia detectada: {deteccion_result['deteccion']['dimensiones_px']}")
-            print(f"📏 Factor conversión: {factor_conversion['cm']:.2f} px/cm")
+            logger.debug("Referencia detectada: %s", deteccion_result['deteccion']['dimensiones_px'])
+            logger.debug("Factor conversión: %.2f px/cm", factor_conversion['cm'])
         else:
-            print("⚠️ Usando factor de conversión ajustado (26.2 px/cm)")
+            logger.warning("Usando factor de conversión ajustado (26.2 px/cm)")
         
         # Convertir medidas del análisis existente
         medidas_px = analisis_existente.get('medidas', {})
@@ -469,12 +650,11 @@ def analizar_imagen_con_medidas_reales(imagen_base64, analisis_existente):
             'deteccion_referencia': deteccion_result if 'deteccion' in deteccion_result else None
         }
         
-        print("✅ Medidas reales integradas exitosamente")
+        logger.debug("Medidas reales integradas exitosamente")
         return resultado
         
     except Exception as e:
-        print(f"❌ Error integrando medidas reales: {e}")
-        traceback.print_exc()
+        logger.exception("Error integrando medidas reales: %s", e)
         # Devolver el análisis original en caso de error
         return analisis_existente
 
@@ -487,7 +667,7 @@ class PDFReportGeneratorExtendido:
     
     def __init__(self, pdf_generator_original):
         self.pdf_generator = pdf_generator_original
-        print("✅ PDFReportGeneratorExtendido inicializado")
+        logger.info("PDFReportGeneratorExtendido inicializado")
     
     def agregar_seccion_medidas_reales(self, pdf, analisis):
         """
@@ -495,7 +675,7 @@ class PDFReportGeneratorExtendido:
         """
         try:
             if 'medidas_convertidas' not in analisis:
-                print("⚠️ No hay medidas convertidas para agregar al PDF")
+                logger.warning("No hay medidas convertidas para agregar al PDF")
                 return
             
             medidas_convertidas = analisis['medidas_convertidas']
@@ -654,8 +834,7 @@ class PDFReportGeneratorExtendido:
             return True
             
         except Exception as e:
-            print(f"❌ Error agregando sección de medidas reales: {e}")
-            traceback.print_exc()
+            logger.exception("Error agregando sección de medidas reales: %s", e)
             return False
     
     def generar_pdf_con_medidas(self, analisis, output_path="analisis_facial_con_medidas.pdf"):
@@ -692,11 +871,11 @@ class PDFReportGeneratorExtendido:
             if os.path.exists(temp_pdf_path):
                 os.remove(temp_pdf_path)
             
-            print(f"✅ PDF con medidas reales generado: {output_path}")
+            logger.debug("PDF con medidas reales generado: %s", output_path)
             return output_path
             
         except Exception as e:
-            print(f"❌ Error generando PDF con medidas: {e}")
+            logger.error("Error generando PDF con medidas: %s", e)
             return None
 
 
@@ -1,21 +1,114 @@
 import cv2
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from fpdf import FPDF
 import base64
-import os
+import functools
 from datetime import datetime
-import traceback
 import unicodedata
 from mm import ConversorMedidasReales
+from entrada_imagen import FIRMA_PNG, info_jpeg, info_png
+from metricas import medir_etapa, metricas_etapas
+from registro import obtener_logger
+
+logger = obtener_logger('pdf')
+
+
+@functools.lru_cache(maxsize=None)
+def clase_fpdf_memoria():
+    """Crear (una sola vez) la clase FPDFMemoria; fpdf se importa al generar el primer PDF"""
+    from fpdf import FPDF
+
+    class FPDFMemoria(FPDF):
+        """FPDF que además acepta imágenes JPEG y PNG en memoria (FPDF 1.7 solo admite rutas de archivo)"""
+
+        def imagen_jpeg(self, datos, x=None, y=None, w=0, h=0):
+            """Insertar un JPEG desde bytes sin escribirlo a disco"""
+            self._insertar_info(info_jpeg(datos), 'jpg', x, y, w, h)
+
+        def imagen_png(self, datos, x=None, y=None, w=0, h=0):
+            """Insertar un PNG desde bytes sin escribirlo a disco (la transparencia se conserva)"""
+            info = info_png(datos)
+            if 'smask' in info and self.pdf_version < '1.4':
+                self.pdf_version = '1.4'  # máscara suave, como en FPDF._parsepng
+            self._insertar_info(info, 'png', x, y, w, h)
+
+        def imagen_memoria(self, datos, x=None, y=None, w=0, h=0):
+            """Insertar una imagen JPEG o PNG desde bytes según su firma"""
+            if bytes(datos[:len(FIRMA_PNG)]) == FIRMA_PNG:
+                self.imagen_png(datos, x=x, y=y, w=w, h=h)
+            else:
+                self.imagen_jpeg(datos, x=x, y=y, w=w, h=h)
+
+        def _insertar_info(self, info, extension, x, y, w, h):
+            nombre = f"memoria_{len(self.images) + 1}.{extension}"
+            info['i'] = len(self.images) + 1
+            self.images[nombre] = info
+            self.image(nombre, x=x, y=y, w=w, h=h)
+
+    return FPDFMemoria
+
+
+def __getattr__(nombre):
+    # pdf.FPDFMemoria sigue disponible como atributo del módulo (se crea al pedirlo)
+    if nombre == 'FPDFMemoria':
+        return clase_fpdf_memoria()
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+# Tamaño de la figura en el PDF: se inserta en un hueco de 190x120 mm,
+# así que se renderiza con esa proporción a ~150 dpi (sin estirar la imagen)
+ANCHO_FIGURA_PX = 1140
+ALTO_FIGURA_PX = 720
+ALTO_TITULO_PX = 56
+CALIDAD_JPEG_FIGURA = 90
+
+
+def rectangulo_imagen(forma_imagen, ancho=ANCHO_FIGURA_PX, alto=ALTO_FIGURA_PX):
+    """(x, y, ancho, alto) de la imagen dentro de la figura: centrada bajo el título, sin deformar"""
+    alto_disponible = alto - ALTO_TITULO_PX
+    h, w = forma_imagen[:2]
+    factor = min(ancho / w, alto_disponible / h)
+    nuevo_w, nuevo_h = max(1, int(w * factor)), max(1, int(h * factor))
+    return (ancho - nuevo_w) // 2, ALTO_TITULO_PX + (alto_disponible - nuevo_h) // 2, nuevo_w, nuevo_h
+
+
+def componer_figura(imagen, titulo, ancho=ANCHO_FIGURA_PX, alto=ALTO_FIGURA_PX):
+    """
+    Componer la figura final directamente sobre un ndarray: franja blanca con el título
+    y la imagen anotada escalada y centrada debajo (sustituye al render con matplotlib)
+    """
+    lienzo = np.full((alto, ancho, 3), 255, dtype=np.uint8)
+
+    # Título centrado (cv2.putText solo admite ASCII)
+    fuente = cv2.FONT_HERSHEY_DUPLEX
+    escala, grosor = 0.9, 2
+    (ancho_texto, alto_texto), _ = cv2.getTextSize(titulo, fuente, escala, grosor)
+    if ancho_texto > ancho - 20:
+        escala *= (ancho - 20) / ancho_texto
+        (ancho_texto, alto_texto), _ = cv2.getTextSize(titulo, fuente, escala, grosor)
+    origen = ((ancho - ancho_texto) // 2, (ALTO_TITULO_PX + alto_texto) // 2)
+    cv2.putText(lienzo, titulo, origen, fuente, escala, (0, 0, 0), grosor, cv2.LINE_AA)
+
+    # Imagen escalada para caber en el área restante conservando la proporción
+    x0, y0, nuevo_w, nuevo_h = rectangulo_imagen(imagen.shape, ancho, alto)
+    interpolacion = cv2.INTER_AREA if nuevo_w < imagen.shape[1] else cv2.INTER_LINEAR
+    redimensionada = cv2.resize(imagen, (nuevo_w, nuevo_h), interpolation=interpolacion)
+    lienzo[y0:y0 + nuevo_h, x0:x0 + nuevo_w] = redimensionada
+    return lienzo
+
+
+def codificar_jpeg(imagen, calidad=CALIDAD_JPEG_FIGURA):
+    """Codificar una imagen BGR a bytes JPEG en memoria"""
+    ok, buffer = cv2.imencode('.jpg', imagen, [int(cv2.IMWRITE_JPEG_QUALITY), calidad])
+    if not ok:
+        raise ValueError('No se pudo codificar la figura a JPEG')
+    return buffer.tobytes()
+
 
 class PDFReportGenerator:
     def __init__(self, analizador):
         self.analizador = analizador
         self.conversor = ConversorMedidasReales()
-        print("✅ PDFReportGenerator con conversor de medidas inicializado")
+        logger.info("PDFReportGenerator con conversor de medidas inicializado")
         
     def texto_seguro(self, texto):
         """Convertir texto a formato seguro para FPDF - SIN ACENTOS"""
@@ -33,168 +126,177 @@ class PDFReportGenerator:
         
         return texto_seguro
         
+    @medir_etapa('figura_pdf')
     def crear_grafico_analisis(self, analisis):
         """Crear gráfico usando la figura generada por debug"""
         if analisis is None:
-            print("❌ No hay análisis para crear gráfico")
+            logger.error("No hay análisis para crear gráfico")
             return None
             
         try:
-            print("🎨 PDF: Generando figura para PDF...")
+            logger.debug("PDF: Generando figura para PDF...")
             
             # Usar la misma función que usa debug para generar la figura
-            figura_path = self.crear_figura_directamente(analisis)
+            figura_jpeg = self.crear_figura_directamente(analisis)
             
-            if figura_path and os.path.exists(figura_path):
-                file_size = os.path.getsize(figura_path)
-                print(f"✅ Figura para PDF generada: {figura_path} ({file_size} bytes)")
-                return figura_path
+            if figura_jpeg:
+                logger.debug("Figura para PDF generada en memoria (%s bytes)", len(figura_jpeg))
+                return figura_jpeg
             else:
-                print("❌ No se pudo generar la figura para el PDF")
+                logger.error("No se pudo generar la figura para el PDF")
                 return None
             
         except Exception as e:
-            print(f"❌ Error creando gráfico en PDF: {e}")
-            print(f"🔍 Traceback: {traceback.format_exc()}")
+            logger.exception("Error creando gráfico en PDF: %s", e)
             return None
 
-    def crear_figura_directamente(self, analisis):
-        """Crear la figura de matplotlib directamente"""
-        try:
-            print("🎨 Creando figura directamente...")
-            
-            if analisis is None:
-                print("❌ No hay análisis para crear figura")
-                return None
+    def imagen_anotada(self, analisis):
+        """
+        Imagen del análisis (BGR) con el rectángulo del rostro, el contorno, los puntos de referencia,
+        las líneas de medición y la forma dibujados con OpenCV; None si faltan datos
+        """
+        if analisis is None:
+            logger.error("No hay análisis para crear figura")
+            return None
+        
+        # Verificar que tenemos los datos necesarios
+        if 'imagen_base64' not in analisis:
+            logger.error("No hay imagen_base64 en el análisis")
+            return None
             
-            # Verificar que tenemos los datos necesarios
-            if 'imagen_base64' not in analisis:
-                print("❌ No hay imagen_base64 en el análisis")
-                return None
-                
-            if 'puntos_referencia' not in analisis:
-                print("❌ No hay puntos_referencia en el análisis")
+        if 'puntos_referencia' not in analisis:
+            logger.error("No hay puntos_referencia en el análisis")
+            return None
+        
+        # Convertir base64 a imagen OpenCV
+        try:
+            image_data = base64.b64decode(analisis['imagen_base64'])
+            nparr = np.frombuffer(image_data, np.uint8)
+            imagen = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if imagen is None:
+                logger.error("No se pudo decodificar la imagen base64")
                 return None
+        except Exception as e:
+            logger.error("Error procesando imagen base64: %s", e)
+            return None
             
-            # Convertir base64 a imagen OpenCV
-            try:
-                image_data = base64.b64decode(analisis['imagen_base64'])
-                nparr = np.frombuffer(image_data, np.uint8)
-                imagen = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                if imagen is None:
-                    print("❌ No se pudo decodificar la imagen base64")
-                    return None
-            except Exception as e:
-                print(f"❌ Error procesando imagen base64: {e}")
-                return None
-                
-            puntos = analisis['puntos_referencia']
+        # Los puntos están en píxeles originales; imagen_base64 puede ser la imagen de trabajo reducida
+        escala = analisis.get('escala_imagen', 1.0)
+        puntos = {nombre: (int(p[0] * escala), int(p[1] * escala))
+                  for nombre, p in analisis['puntos_referencia'].items()}
+        rect_rostro = None
+        if 'rect_rostro' in analisis:
+            rect_rostro = [int(v * escala) for v in analisis['rect_rostro']]
+        
+        # Dibujar rectángulo del rostro
+        if rect_rostro is not None:
+            x, y, w, h = rect_rostro
+            cv2.rectangle(imagen, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        else:
+            logger.warning("No hay rect_rostro, calculando uno aproximado...")
+            todos_puntos = list(puntos.values())
+            xs = [p[0] for p in todos_puntos]
+            ys = [p[1] for p in todos_puntos]
+            x, y = min(xs), min(ys)
+            w, h = max(xs) - x, max(ys) - y
+            cv2.rectangle(imagen, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        
+        # Dibujar contorno facial
+        if 'puntos_faciales' in analisis and analisis['puntos_faciales'] is not None:
+            puntos_array = np.array(analisis['puntos_faciales'])
+            contorno = self.analizador.calcular_contorno_rostro(puntos_array) * escala
+            for i in range(len(contorno)):
+                cv2.circle(imagen, tuple(contorno[i].astype(int)), 2, (255, 0, 255), -1)
+                if i > 0:
+                    cv2.line(imagen, tuple(contorno[i-1].astype(int)), tuple(contorno[i].astype(int)), (255, 0, 255), 1)
+        
+        # Colores para diferentes puntos
+        colores = {
+            'barbilla': (0, 255, 255),
+            'frente': (255, 0, 0),
+            'sien': (128, 0, 128),
+            'mandibula': (0, 0, 255),
+            'pomulo': (0, 165, 255),
+            'ojo': (0, 255, 0),
+            'nariz': (255, 255, 0),
+            'ceja': (255, 0, 255),
+            'boca': (255, 255, 255)
+        }
+        
+        # Dibujar puntos de referencia
+        for nombre, punto in puntos.items():
+            px, py = punto
             
-            # Dibujar rectángulo del rostro
-            if 'rect_rostro' in analisis:
-                x, y, w, h = analisis['rect_rostro']
-                cv2.rectangle(imagen, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            if 'sien' in nombre:
+                color = colores['sien']
+            elif 'mandibula' in nombre:
+                color = colores['mandibula']
+            elif 'pomulo' in nombre:
+                color = colores['pomulo']
+            elif 'ojo' in nombre:
+                color = colores['ojo']
+            elif 'barbilla' in nombre:
+                color = colores['barbilla']
+            elif 'frente' in nombre:
+                color = colores['frente']
+            elif 'nariz' in nombre:
+                color = colores['nariz']
+            elif 'ceja' in nombre:
+                color = colores['ceja']
+            elif 'boca' in nombre:
+                color = colores['boca']
             else:
-                print("⚠️ No hay rect_rostro, calculando uno aproximado...")
-                todos_puntos = list(puntos.values())
-                xs = [p[0] for p in todos_puntos]
-                ys = [p[1] for p in todos_puntos]
-                x, y = min(xs), min(ys)
-                w, h = max(xs) - x, max(ys) - y
-                cv2.rectangle(imagen, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            
-            # Dibujar contorno facial
-            if 'puntos_faciales' in analisis and analisis['puntos_faciales'] is not None:
-                puntos_array = np.array(analisis['puntos_faciales'])
-                contorno = self.analizador.calcular_contorno_rostro(puntos_array)
-                for i in range(len(contorno)):
-                    cv2.circle(imagen, tuple(contorno[i].astype(int)), 2, (255, 0, 255), -1)
-                    if i > 0:
-                        cv2.line(imagen, tuple(contorno[i-1].astype(int)), tuple(contorno[i].astype(int)), (255, 0, 255), 1)
-            
-            # Colores para diferentes puntos
-            colores = {
-                'barbilla': (0, 255, 255),
-                'frente': (255, 0, 0),
-                'sien': (128, 0, 128),
-                'mandibula': (0, 0, 255),
-                'pomulo': (0, 165, 255),
-                'ojo': (0, 255, 0),
-                'nariz': (255, 255, 0),
-                'ceja': (255, 0, 255),
-                'boca': (255, 255, 255)
-            }
-            
-            # Dibujar puntos de referencia
-            for nombre, punto in puntos.items():
-                px, py = punto
-                
-                if 'sien' in nombre:
-                    color = colores['sien']
-                elif 'mandibula' in nombre:
-                    color = colores['mandibula']
-                elif 'pomulo' in nombre:
-                    color = colores['pomulo']
-                elif 'ojo' in nombre:
-                    color = colores['ojo']
-                elif 'barbilla' in nombre:
-                    color = colores['barbilla']
-                elif 'frente' in nombre:
-                    color = colores['frente']
-                elif 'nariz' in nombre:
-                    color = colores['nariz']
-                elif 'ceja' in nombre:
-                    color = colores['ceja']
-                elif 'boca' in nombre:
-                    color = colores['boca']
-                else:
-                    color = (255, 255, 255)
-                
-                cv2.circle(imagen, (px, py), 6, color, -1)
-                cv2.putText(imagen, nombre.split('_')[0], (px-30, py-15), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
-            
-            # Dibujar líneas de medición
-            if 'frente_centro' in puntos and 'barbilla' in puntos:
-                cv2.line(imagen, tuple(puntos['frente_centro']), tuple(puntos['barbilla']), (0, 255, 255), 2)
-            
-            if 'pomulo_izquierdo_ext' in puntos and 'pomulo_derecho_ext' in puntos:
-                cv2.line(imagen, tuple(puntos['pomulo_izquierdo_ext']), tuple(puntos['pomulo_derecho_ext']), (0, 165, 255), 2)
+                color = (255, 255, 255)
             
-            if 'frente_izquierda' in puntos and 'frente_derecha' in puntos:
-                cv2.line(imagen, tuple(puntos['frente_izquierda']), tuple(puntos['frente_derecha']), (128, 0, 128), 2)
-            
-            if 'mandibula_izquierda' in puntos and 'mandibula_derecha' in puntos:
-                cv2.line(imagen, tuple(puntos['mandibula_izquierda']), tuple(puntos['mandibula_derecha']), (0, 0, 255), 2)
+            cv2.circle(imagen, (px, py), 6, color, -1)
+            cv2.putText(imagen, nombre.split('_')[0], (px-30, py-15), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+        
+        # Dibujar líneas de medición
+        if 'frente_centro' in puntos and 'barbilla' in puntos:
+            cv2.line(imagen, tuple(puntos['frente_centro']), tuple(puntos['barbilla']), (0, 255, 255), 2)
+        
+        if 'pomulo_izquierdo_ext' in puntos and 'pomulo_derecho_ext' in puntos:
+            cv2.line(imagen, tuple(puntos['pomulo_izquierdo_ext']), tuple(puntos['pomulo_derecho_ext']), (0, 165, 255), 2)
+        
+        if 'frente_izquierda' in puntos and 'frente_derecha' in puntos:
+            cv2.line(imagen, tuple(puntos['frente_izquierda']), tuple(puntos['frente_derecha']), (128, 0, 128), 2)
+        
+        if 'mandibula_izquierda' in puntos and 'mandibula_derecha' in puntos:
+            cv2.line(imagen, tuple(puntos['mandibula_izquierda']), tuple(puntos['mandibula_derecha']), (0, 0, 255), 2)
+        
+        # Información de forma
+        forma = analisis.get('forma', 'Desconocida')
+        if rect_rostro is not None:
+            x, y, w, h = rect_rostro
+            cv2.putText(imagen, f"FORMA: {forma}", (x, y-20), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        else:
+            cv2.putText(imagen, f"FORMA: {forma}", (50, 50), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        
+        return imagen
+    
+    def crear_figura_directamente(self, analisis):
+        """Crear la figura anotada directamente con OpenCV (devuelve los bytes JPEG, sin archivos temporales)"""
+        try:
+            logger.debug("Creando figura directamente...")
             
-            # Información de forma
+            imagen = self.imagen_anotada(analisis)
+            if imagen is None:
+                return None
             forma = analisis.get('forma', 'Desconocida')
-            if 'rect_rostro' in analisis:
-                x, y, w, h = analisis['rect_rostro']
-                cv2.putText(imagen, f"FORMA: {forma}", (x, y-20), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            else:
-                cv2.putText(imagen, f"FORMA: {forma}", (50, 50), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            
-            # Crear figura con matplotlib
-            plt.figure(figsize=(14, 10))
-            plt.imshow(cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB))
-            plt.title(f"ANALISIS DE FORMA FACIAL - {forma}", fontsize=16, weight='bold')
-            plt.axis('off')
             
-            # Guardar figura temporal
-            temp_path = "temp_direct_figure.png"
-            plt.tight_layout()
-            plt.savefig(temp_path, dpi=150, bbox_inches='tight', facecolor='white')
-            plt.close()
+            # Título y composición final directamente sobre el ndarray, ya al tamaño del PDF
+            titulo = self.texto_seguro(f"ANALISIS DE FORMA FACIAL - {forma}")
+            figura = componer_figura(imagen, titulo)
+            figura_jpeg = codificar_jpeg(figura)
             
-            print(f"✅ Figura directa guardada en: {temp_path}")
-            return temp_path
+            logger.debug("Figura directa generada en memoria (%s bytes)", len(figura_jpeg))
+            return figura_jpeg
             
         except Exception as e:
-            print(f"❌ Error creando figura directa: {e}")
-            print(f"🔍 Traceback: {traceback.format_exc()}")
+            logger.exception("Error creando figura directa: %s", e)
             return None
 
     def hex_to_rgb(self, hex_color):
@@ -257,14 +359,14 @@ class PDFReportGenerator:
             
             return True
         except Exception as e:
-            print(f"⚠️ Error dibujando círculo color {hex_color}: {e}")
+            logger.warning("Error dibujando círculo color %s: %s", hex_color, e)
             return False
         
     def generar_seccion_medidas_reales(self, pdf, analisis):
         """Generar sección de medidas reales (cm/mm) en el PDF - VERSIÓN CORREGIDA"""
         try:
             if 'medidas_convertidas' not in analisis:
-                print("⚠️ No hay medidas convertidas para mostrar")
+                logger.warning("No hay medidas convertidas para mostrar")
                 return
             
             # Verificar si necesitamos nueva página
@@ -440,16 +542,14 @@ class PDFReportGenerator:
             pdf.set_text_color(0, 0, 0)
             
         except Exception as e:
-            print(f"❌ Error en generar_seccion_medidas_reales: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error en generar_seccion_medidas_reales: %s", e)
 
     def generar_seccion_tono_piel(self, pdf, tono_piel):
         """Generar sección de análisis de tono de piel con círculos de color mejorados - SIN BULLETS"""
         if not tono_piel or tono_piel.get('estado') != 'exitoso':
             return
         
-        print("🎨 PDF: Agregando sección de tono de piel con círculos de color...")
+        logger.debug("PDF: Agregando sección de tono de piel con círculos de color...")
         
         # Agregar página para el análisis de tono
         pdf.add_page()
@@ -953,6 +1053,8 @@ class PDFReportGenerator:
         """
         # --- RECOMENDACIONES OPTICAS PERSONALIZADAS ---
         if recomendaciones:
+            from recomendaciones import bytes_marcos
+
             pdf.set_font('Arial', 'B', 18)
             pdf.cell(0, 15, self.texto_seguro('RECOMENDACIONES OPTICAS PERSONALIZADAS'), 0, 1, 'L')
             pdf.ln(8)
@@ -968,14 +1070,16 @@ class PDFReportGenerator:
                 pdf.set_font('Arial', 'I', 11)
                 pdf.cell(0, 8, self.texto_seguro(f"Estilo: {rec.get('style', 'No especificado')}"), 0, 1, 'L')
                 
+                # Imagen del marco desde la caché del proceso (bytes leídos una vez, sin acceder al disco)
                 image_path = rec.get('local_image')
+                imagen_marco = bytes_marcos().get(image_path) if image_path else None
                 image_added = False
-                if image_path and os.path.exists(image_path):
+                if imagen_marco:
                     try:
-                        pdf.image(image_path, x=140, y=start_y, w=60, h=45)
+                        pdf.imagen_memoria(imagen_marco, x=140, y=start_y, w=60, h=45)
                         image_added = True
                     except Exception as e:
-                        print(f"⚠️ No se pudo cargar imagen {image_path}: {e}")
+                        logger.warning("No se pudo cargar imagen %s: %s", image_path, e)
                 
                 pdf.set_font('Arial', '', 10)
                 razon_segura = self.texto_seguro(rec.get('reason', 'No disponible'))
@@ -1017,114 +1121,122 @@ class PDFReportGenerator:
     def generar_pdf(self, analisis, output_path="analisis_facial.pdf"):
         """Generar PDF con el análisis completo"""
         try:
-            print(f"📄 PDF: Iniciando generación de PDF: {output_path}")
-            
-            pdf = FPDF()
-            # CONFIGURACIÓN PARA CARACTERES ESPECIALES
-            pdf.set_auto_page_break(auto=True, margin=15)
-            
-            # Agregar soporte para caracteres extendidos
-            pdf.add_page()
-            
-            # Usar una fuente que soporte más caracteres
-            pdf.set_font('Arial', '', 12)
-            
-            # Portada - usar texto seguro
-            pdf.set_font('Arial', 'B', 24)
-            titulo_seguro = self.texto_seguro("ANALISIS FACIAL AVANZADO")
-            pdf.cell(0, 20, titulo_seguro, 0, 1, 'C')
-            pdf.ln(10)
-            
-            pdf.set_font('Arial', 'I', 12)
-            fecha_segura = self.texto_seguro(f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
-            pdf.cell(0, 10, fecha_segura, 0, 1, 'C')
-            pdf.ln(10)
-            
-            # Resultado principal
-            pdf.set_font('Arial', 'B', 16)
-            pdf.cell(0, 12, self.texto_seguro('RESULTADO PRINCIPAL'), 0, 1, 'L')
-            pdf.set_font('Arial', '', 12)
-            forma = analisis.get('forma', 'No detectada')
-            forma_seguro = self.texto_seguro(forma)
-            descripcion_seguro = self.texto_seguro(analisis.get('descripcion', 'No disponible'))
-            
-            pdf.multi_cell(0, 8, self.texto_seguro(f"Forma facial detectada: {forma_seguro}"))
-            pdf.multi_cell(0, 8, self.texto_seguro(f"Descripcion: {descripcion_seguro}"))
-            pdf.ln(8)
-            
-            # Figura
-            print("📊 PDF: Creando gráfico de análisis...")
-            temp_figura = self.crear_grafico_analisis(analisis)
-            
-            if temp_figura and os.path.exists(temp_figura):
-                file_size = os.path.getsize(temp_figura)
-                print(f"✅ PDF: Figura encontrada ({file_size} bytes)")
-                
-                if file_size > 0:
-                    # Calcular posición Y para centrar la imagen
-                    current_y = pdf.get_y()
-                    # Altura máxima disponible
-                    available_height = 297 - current_y - 20  # A4 height = 297mm, margen inferior 20mm
-                    image_height = 120  # Altura fija para la imagen
-                    
-                    if image_height < available_height:
-                        pdf.image(temp_figura, x=10, y=current_y, w=190, h=image_height)
-                        pdf.set_y(current_y + image_height + 10)  # Mover cursor después de la imagen
-                        print("✅ PDF: Figura agregada al PDF")
-                    else:
-                        # Si no hay espacio, agregar nueva página
-                        pdf.add_page()
-                        pdf.image(temp_figura, x=10, y=20, w=190, h=120)
-                        pdf.set_y(150)
-                else:
-                    pdf.multi_cell(0, 8, self.texto_seguro("Figura de analisis no disponible"))
-                
-                try:
-                    os.remove(temp_figura)
-                    print("🧹 PDF: Figura temporal limpiada")
-                except Exception as e:
-                    print(f"⚠️ PDF: Error limpiando figura: {e}")
-            else:
-                pdf.multi_cell(0, 8, self.texto_seguro("Figura de analisis no disponible"))
-            
-            # Página 2 - INFORME DETALLADO COMPLETO
-            pdf.add_page()
-            
-            # Generar sección detallada de medidas CON recomendaciones
-            self.generar_informe_detallado_medidas(
-                pdf,
-                analisis,  # Pasamos el análisis completo
-                analisis.get('recomendaciones', [])
-            )
-            
-            # Sección de tono de piel si está disponible
-            if 'tono_piel' in analisis:
-                self.generar_seccion_tono_piel(pdf, analisis['tono_piel'])
-            
-            # Página FINAL - MEDIDAS REALES (al final como solicitas)
-            pdf.add_page()
-            self.generar_seccion_medidas_reales(pdf, analisis)
-            
+            logger.debug("PDF: Iniciando generación de PDF: %s", output_path)
+            pdf = self.construir_pdf(analisis)
             pdf.output(output_path)
-            print(f"✅ PDF: Generado exitosamente: {output_path}")
+            logger.debug("PDF: Generado exitosamente: %s", output_path)
             return output_path
             
         except Exception as e:
-            print(f"❌ PDF: Error generando PDF: {e}")
-            print(f"🔍 PDF Traceback: {traceback.format_exc()}")
+            logger.exception("PDF: Error generando PDF: %s", e)
             return None
 
+    def generar_pdf_bytes(self, analisis):
+        """Generar el PDF completo en memoria y devolver sus bytes"""
+        try:
+            logger.debug("PDF: Iniciando generación de PDF en memoria")
+            pdf = self.construir_pdf(analisis)
+            with metricas_etapas.medir('pdf_output'):
+                pdf_bytes = pdf.output(dest='S').encode('latin-1')
+            logger.debug("PDF: Generado exitosamente en memoria (%s bytes)", len(pdf_bytes))
+            return pdf_bytes
+            
+        except Exception as e:
+            logger.exception("PDF: Error generando PDF: %s", e)
+            return None
+
+    @medir_etapa('pdf_maquetacion')
+    def construir_pdf(self, analisis):
+        """Construir el documento FPDF con todas las secciones del análisis"""
+        pdf = clase_fpdf_memoria()()
+        # CONFIGURACIÓN PARA CARACTERES ESPECIALES
+        pdf.set_auto_page_break(auto=True, margin=15)
+        
+        # Agregar soporte para caracteres extendidos
+        pdf.add_page()
+        
+        # Usar una fuente que soporte más caracteres
+        pdf.set_font('Arial', '', 12)
+        
+        # Portada - usar texto seguro
+        pdf.set_font('Arial', 'B', 24)
+        titulo_seguro = self.texto_seguro("ANALISIS FACIAL AVANZADO")
+        pdf.cell(0, 20, titulo_seguro, 0, 1, 'C')
+        pdf.ln(10)
+        
+        pdf.set_font('Arial', 'I', 12)
+        fecha_segura = self.texto_seguro(f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+        pdf.cell(0, 10, fecha_segura, 0, 1, 'C')
+        pdf.ln(10)
+        
+        # Resultado principal
+        pdf.set_font('Arial', 'B', 16)
+        pdf.cell(0, 12, self.texto_seguro('RESULTADO PRINCIPAL'), 0, 1, 'L')
+        pdf.set_font('Arial', '', 12)
+        forma = analisis.get('forma', 'No detectada')
+        forma_seguro = self.texto_seguro(forma)
+        descripcion_seguro = self.texto_seguro(analisis.get('descripcion', 'No disponible'))
+        
+        pdf.multi_cell(0, 8, self.texto_seguro(f"Forma facial detectada: {forma_seguro}"))
+        pdf.multi_cell(0, 8, self.texto_seguro(f"Descripcion: {descripcion_seguro}"))
+        pdf.ln(8)
+        
+        # Figura
+        logger.debug("PDF: Creando gráfico de análisis...")
+        figura_jpeg = self.crear_grafico_analisis(analisis)
+        
+        if figura_jpeg:
+            logger.debug("PDF: Figura encontrada (%s bytes)", len(figura_jpeg))
+            
+            # Calcular posición Y para centrar la imagen
+            current_y = pdf.get_y()
+            # Altura máxima disponible
+            available_height = 297 - current_y - 20  # A4 height = 297mm, margen inferior 20mm
+            image_height = 120  # Altura fija para la imagen
+            
+            if image_height < available_height:
+                pdf.imagen_jpeg(figura_jpeg, x=10, y=current_y, w=190, h=image_height)
+                pdf.set_y(current_y + image_height + 10)  # Mover cursor después de la imagen
+                logger.debug("PDF: Figura agregada al PDF")
+            else:
+                # Si no hay espacio, agregar nueva página
+                pdf.add_page()
+                pdf.imagen_jpeg(figura_jpeg, x=10, y=20, w=190, h=120)
+                pdf.set_y(150)
+        else:
+            pdf.multi_cell(0, 8, self.texto_seguro("Figura de analisis no disponible"))
+        
+        # Página 2 - INFORME DETALLADO COMPLETO
+        pdf.add_page()
+        
+        # Generar sección detallada de medidas CON recomendaciones
+        self.generar_informe_detallado_medidas(
+            pdf,
+            analisis,  # Pasamos el análisis completo
+            analisis.get('recomendaciones', [])
+        )
+        
+        # Sección de tono de piel si está disponible
+        if 'tono_piel' in analisis:
+            self.generar_seccion_tono_piel(pdf, analisis['tono_piel'])
+        
+        # Página FINAL - MEDIDAS REALES (al final como solicitas)
+        pdf.add_page()
+        self.generar_seccion_medidas_reales(pdf, analisis)
+        
+        return pdf
+
     def procesar_imagen_y_generar_pdf(self, analisis_result, output_pdf_path="analisis_facial.pdf"):
         """Proceso completo: generar PDF con el análisis"""
         try:
-            print("🔄 PDF: Iniciando procesamiento...")
+            logger.debug("PDF: Iniciando procesamiento...")
             pdf_path = self.generar_pdf(analisis_result, output_pdf_path)
             if pdf_path:
-                print(f"✅ PDF: Proceso completado: {pdf_path}")
+                logger.debug("PDF: Proceso completado: %s", pdf_path)
                 return pdf_path
             else:
-                print("❌ PDF: Error en el proceso")
+                logger.error("PDF: Error en el proceso")
                 return None
         except Exception as e:
-            print(f"❌ PDF: Error en procesamiento: {e}")
+            logger.error("PDF: Error en procesamiento: %s", e)
             return None
\ No newline at end of file
@@ -0,0 +1,260 @@
+# pipeline.py - Pipeline unificado: una sola decodificación y una sola pasada de FaceMesh
+# compartida por los análisis de forma, tono de piel y medidas reales
+import time
+
+import cv2
+import numpy as np
+
+from pool_facemesh import obtener_pool, landmarks_a_pixeles
+from entrada_imagen import (decodificar_imagen, decodificar_trabajo, bytes_imagen, huella_imagen,
+                            RESOLUCION_TRABAJO_POR_DEFECTO)
+from cache_analisis import obtener_cache
+from metricas import medir_etapa, metricas_etapas
+from main import AnalizadorFormaRostroAvanzado
+from tonos import AnalizadorTonoPielMejorado
+from mm import analizar_medidas_reales_imagen, detectar_referencia_imagen
+from registro import obtener_logger
+
+logger = obtener_logger('pipeline')
+
+# Versión de los algoritmos de análisis. Forma parte de las claves de caché:
+# incrementarla cuando un cambio altere los resultados
+VERSION_ANALISIS = 5
+
+# Motivos de fallo que analizar() deja en resultados['error'] cuando no hay ningún análisis
+ERROR_DECODIFICACION = 'No se pudo decodificar la imagen'
+ERROR_SIN_ROSTRO = 'No se detectaron rostros en la imagen'
+
+# Pares de landmarks simétricos (izquierda, derecha) de MediaPipe Face Mesh.
+# Al voltear la imagen horizontalmente, FaceMesh etiqueta cada punto con el índice
+# de su simétrico, por eso el análisis de forma (que trabaja en espejo) necesita
+# intercambiarlos además de reflejar la coordenada x.
+PARES_ESPEJO = [
+    # Contorno facial
+    (109, 338), (67, 297), (103, 332), (54, 284), (21, 251), (162, 389),
+    (127, 356), (234, 454), (93, 323), (132, 361), (58, 288), (172, 397),
+    (136, 365), (150, 379), (149, 378), (176, 400), (148, 377),
+    # Pómulos, cejas, boca e iris
+    (116, 345), (50, 280), (107, 336), (61, 291), (468, 473),
+]
+
+
+def construir_permutacion_espejo(num_puntos=478):
+    """Permutación de índices que convierte landmarks de la imagen original en los de la imagen espejo"""
+    permutacion = np.arange(num_puntos)
+    for izquierdo, derecho in PARES_ESPEJO:
+        permutacion[izquierdo] = derecho
+        permutacion[derecho] = izquierdo
+    return permutacion
+
+
+PERMUTACION_ESPEJO = construir_permutacion_espejo()
+
+
+class PipelineAnalisisCompleto:
+    """
+    Decodifica la imagen una vez, detecta landmarks una vez (sobre la imagen sin voltear)
+    y reparte el mismo resultado a las etapas de forma, tono y medidas reales.
+
+    FaceMesh, el volteo, el tono y las imágenes de la respuesta trabajan sobre una imagen
+    reducida (lado mayor >= resolucion_trabajo). Los landmarks son normalizados, así que
+    las medidas se calculan con las dimensiones originales y siguen en píxeles originales;
+    la resolución completa solo se decodifica para buscar el cuadrado de referencia.
+    """
+
+    def __init__(self, analizador_forma=None, analizador_tono=None, cache=None,
+                 resolucion_trabajo=RESOLUCION_TRABAJO_POR_DEFECTO):
+        self.analizador_forma = analizador_forma or AnalizadorFormaRostroAvanzado()
+        self.analizador_tono = analizador_tono or AnalizadorTonoPielMejorado()
+        # La pasada única usa los umbrales del analizador de forma; una solicitud solo de tono
+        # (/analyze-skin-tone) detecta con los del analizador de tono (más estrictos)
+        self.config_face_mesh = self.analizador_forma.config_face_mesh
+        self.config_face_mesh_tono = self.analizador_tono.config_face_mesh
+        # Resultados por contenido de imagen, compartidos entre pipelines y endpoints
+        self.cache = cache or obtener_cache()
+        self.resolucion_trabajo = resolucion_trabajo
+
+    def decodificar(self, imagen):
+        """Decodificar la imagen (base64, bytes crudos o ndarray BGR) a resolución completa"""
+        try:
+            return decodificar_imagen(imagen)
+        except Exception as e:
+            logger.warning("Error decodificando imagen: %s", e)
+            return None
+
+    def decodificar_trabajo(self, imagen):
+        """(imagen de trabajo, (alto, ancho) originales, imagen completa o None); (None, None, None) si falla"""
+        try:
+            return decodificar_trabajo(imagen, self.resolucion_trabajo)
+        except Exception as e:
+            logger.warning("Error decodificando imagen: %s", e)
+            return None, None, None
+
+    @medir_etapa('facemesh')
+    def detectar_landmarks(self, imagen_rgb, config_face_mesh=None):
+        """
+        Detectar landmarks normalizados (float32 (N, 3), x e y en [0, 1]) del primer rostro
+        con config_face_mesh (por defecto, la del analizador de forma)
+        """
+        return obtener_pool(**(config_face_mesh or self.config_face_mesh)).detectar(imagen_rgb)
+
+    def landmarks_a_pixeles(self, landmarks, imagen_shape, espejo=False):
+        """
+        Convertir landmarks normalizados a píxeles float32 (subpíxel) de una imagen de dimensiones
+        imagen_shape (las originales para las medidas, las de trabajo para muestrear píxeles).
+        Con espejo=True se aplica la transformación x -> 1 - x y el intercambio
+        de índices simétricos, equivalente a detectar sobre cv2.flip(imagen, 1).
+        """
+        if espejo:
+            # La indexación avanzada ya copia: los landmarks en caché no se modifican
+            landmarks = landmarks[PERMUTACION_ESPEJO[:len(landmarks)]]
+            landmarks[:, 0] = 1.0 - landmarks[:, 0]
+        return landmarks_a_pixeles(landmarks, imagen_shape)
+
+    def analizar(self, imagen, forma=True, tono=True, medidas_reales=True):
+        """
+        Ejecutar las etapas pedidas y devolver {'forma_rostro': ..., 'tono_piel': ...}
+        con el mismo formato que los análisis individuales.
+        Cada etapa se guarda en caché por hash de la imagen: si la misma captura
+        se vuelve a enviar (reintentos, análisis y luego PDF) no se repite el trabajo de visión.
+        Si no se puede analizar nada, resultados['error'] indica el motivo.
+        """
+        resultados = {}
+
+        try:
+            datos = bytes_imagen(imagen)
+            huella = huella_imagen(datos)
+        except Exception as e:
+            logger.warning("No se pudo leer la imagen: %s", e)
+            resultados['error'] = ERROR_DECODIFICACION
+            return resultados
+
+        # Las imágenes solo se decodifican si alguna etapa no está en caché
+        decodificada = {}
+
+        def obtener_imagen():
+            """Imagen de trabajo BGR y RGB (reducida) y dimensiones originales (alto, ancho)"""
+            if 'bgr' not in decodificada:
+                inicio = time.perf_counter()
+                imagen_bgr, dimensiones, completa = self.decodificar_trabajo(datos)
+                # decodificar_trabajo() no lanza excepciones: una imagen ilegible cuenta como error de la etapa
+                metricas_etapas.registrar('decodificacion', time.perf_counter() - inicio, error=imagen_bgr is None)
+                decodificada.update(bgr=imagen_bgr, dimensiones=dimensiones, completa=completa)
+                decodificada['rgb'] = None if imagen_bgr is None else cv2.cvtColor(imagen_bgr, cv2.COLOR_BGR2RGB)
+                if imagen_bgr is not None:
+                    logger.debug("Pipeline: imagen de trabajo %s (original %s)", imagen_bgr.shape, dimensiones)
+            return decodificada['bgr'], decodificada['rgb'], decodificada['dimensiones']
+
+        def obtener_imagen_completa():
+            """Imagen BGR a resolución original (solo para el cuadrado de referencia)"""
+            obtener_imagen()
+            if decodificada['completa'] is None:
+                with metricas_etapas.medir('decodificacion_completa'):
+                    decodificada['completa'] = self.decodificar(datos)
+            return decodificada['completa']
+
+        config_face_mesh = self.config_face_mesh if forma else self.config_face_mesh_tono
+        clave_config = tuple(sorted(config_face_mesh.items()))
+        clave_landmarks = ('landmarks', huella, clave_config, self.resolucion_trabajo, VERSION_ANALISIS)
+        encontrado, deteccion = self.cache.obtener(clave_landmarks)
+        if encontrado:
+            logger.debug("Pipeline: landmarks recuperados de caché")
+        else:
+            imagen_bgr, imagen_rgb, dimensiones = obtener_imagen()
+            if imagen_bgr is None:
+                logger.warning("No se pudo decodificar la imagen")
+                resultados['error'] = ERROR_DECODIFICACION
+                return resultados
+            deteccion = {
+                'landmarks': self.detectar_landmarks(imagen_rgb, config_face_mesh),
+                'dimensiones': dimensiones
+            }
+            self.cache.guardar(clave_landmarks, deteccion)
+
+        landmarks, dimensiones = deteccion['landmarks'], deteccion['dimensiones']
+        if landmarks is None:
+            logger.warning("No se detectaron rostros con MediaPipe")
+            resultados['error'] = ERROR_SIN_ROSTRO
+            return resultados
+
+        logger.debug("Pipeline: %s landmarks detectados (pasada única)", len(landmarks))
+
+        if forma:
+            # La parte de visión (puntos, medidas, imagen_base64, medidas reales) es la misma para
+            # cualquier analizador: /generate-pdf-report después de /analyze-complete no repite nada
+            clave_forma = ('forma', huella, medidas_reales, self.resolucion_trabajo, VERSION_ANALISIS)
+            forma_data = self.cache.obtener_o_calcular(
+                clave_forma, lambda: self._etapa_forma(obtener_imagen, obtener_imagen_completa, landmarks,
+                                                       dimensiones, huella, medidas_reales))
+            if forma_data:
+                # Solo las recomendaciones dependen del analizador (calibre o imágenes de los marcos)
+                resultados['forma_rostro'] = {
+                    **forma_data,
+                    'recomendaciones': self.analizador_forma.generar_recomendaciones_completas(
+                        forma_data['forma'], forma_data['medidas'])
+                }
+
+        if tono:
+            # Con la configuración de detección: un rostro admitido con los umbrales de forma no
+            # debe servir de caché a una solicitud solo de tono, que exige los del analizador de tono
+            clave_tono = ('tono', huella, type(self.analizador_tono).__name__, clave_config,
+                          self.resolucion_trabajo, VERSION_ANALISIS)
+            tono_data = self.cache.obtener_o_calcular(
+                clave_tono, lambda: self._etapa_tono(obtener_imagen, landmarks))
+            if tono_data:
+                resultados['tono_piel'] = tono_data
+
+        return resultados
+
+    @staticmethod
+    def escala_trabajo(imagen, dimensiones):
+        """Escala de la imagen de trabajo respecto a la original (1.0 = sin reducir)"""
+        return imagen.shape[1] / dimensiones[1]
+
+    def _etapa_forma(self, obtener_imagen, obtener_imagen_completa, landmarks, dimensiones, huella, medidas_reales):
+        """
+        Análisis de forma (sobre la imagen en espejo) más medidas reales, sin recomendaciones; None si falla.
+        Los puntos y las medidas están en píxeles originales; imagen_base64 es la imagen de trabajo
+        (escala_imagen indica cómo llevar los puntos a sus coordenadas)
+        """
+        try:
+            imagen, _, _ = obtener_imagen()
+            imagen_espejo = cv2.flip(imagen, 1)
+            puntos_espejo = self.landmarks_a_pixeles(landmarks, dimensiones, espejo=True)
+            forma_data = self.analizador_forma.analizar_puntos(imagen_espejo, puntos_espejo)
+            if not forma_data or forma_data.get('estado') != 'exitoso':
+                return None
+            # Se guardan en caché sin recomendaciones: analizar() añade las del analizador de cada solicitud
+            forma_data.pop('recomendaciones', None)
+            escala = self.escala_trabajo(imagen, dimensiones)
+            if escala != 1.0:
+                forma_data['escala_imagen'] = escala
+            if medidas_reales:
+                # La búsqueda del cuadrado de referencia no depende del analizador de forma y
+                # usa la resolución completa (la calibración px/cm necesita todos los píxeles)
+                deteccion_referencia = self.cache.obtener_o_calcular(
+                    ('referencia', huella, VERSION_ANALISIS),
+                    lambda: detectar_referencia_imagen(obtener_imagen_completa()))
+                forma_data = analizar_medidas_reales_imagen(None, forma_data, deteccion_referencia)
+            return forma_data
+        except Exception as e:
+            logger.error("Error en el análisis de forma: %s", e)
+            return None
+
+    def _etapa_tono(self, obtener_imagen, landmarks):
+        """
+        Análisis de tono de piel sobre la imagen de trabajo sin voltear; None si falla.
+        El área de piel se devuelve en píxeles originales
+        """
+        imagen_bgr, imagen_rgb, dimensiones = obtener_imagen()
+        if imagen_bgr is None:
+            return None
+        puntos = self.landmarks_a_pixeles(landmarks, imagen_bgr.shape)
+        escala = self.escala_trabajo(imagen_bgr, dimensiones)
+        tono_data = self.analizador_tono.analizar_tono_puntos(imagen_rgb, puntos, escala_imagen=escala)
+        if tono_data and tono_data.get('estado') == 'exitoso':
+            if escala != 1.0:
+                tono_data['area_piel_pixeles'] = int(round(tono_data['area_piel_pixeles'] / escala ** 2))
+                tono_data['escala_imagen'] = escala
+            return tono_data
+        return None
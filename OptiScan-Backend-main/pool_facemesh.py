@@ -0,0 +1,124 @@
+# pool_facemesh.py - Pool de instancias de MediaPipe FaceMesh compartido por todo el proceso
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from itertools import chain
+
+import numpy as np
+
+from registro import obtener_logger
+
+logger = obtener_logger('pool_facemesh')
+
+# Número de grafos FaceMesh precalentados por configuración (configurable por entorno)
+TAMANO_POOL_POR_DEFECTO = int(os.environ.get("FACEMESH_POOL_SIZE", 2))
+
+
+def extraer_landmarks(lista_landmarks):
+    """
+    Landmarks normalizados (x, y, z) de un NormalizedLandmarkList como array float32 (N, 3).
+    np.fromiter con count reserva el array una vez y lo llena en una sola pasada,
+    sin la lista intermedia de tuplas ni el truncado a enteros
+    """
+    landmarks = lista_landmarks.landmark
+    return np.fromiter(chain.from_iterable((lm.x, lm.y, lm.z) for lm in landmarks),
+                       dtype=np.float32, count=3 * len(landmarks)).reshape(-1, 3)
+
+
+def landmarks_a_pixeles(landmarks, imagen_shape):
+    """Coordenadas (x, y) en píxeles con precisión subpíxel (float32) en una imagen de dimensiones imagen_shape"""
+    h, w = imagen_shape[:2]
+    return landmarks[:, :2] * np.array((w, h), dtype=np.float32)
+
+
+def puntos_enteros(puntos):
+    """Copia redondeada a int32, solo para dibujar con OpenCV (máscaras, líneas) o serializar"""
+    return np.rint(puntos).astype(np.int32)
+
+
+def soluciones_mediapipe():
+    """Módulo mediapipe.solutions, importado al primer uso (mediapipe tarda ~0.4 s en importarse)"""
+    import mediapipe as mp
+    return mp.solutions
+
+
+class PoolFaceMesh:
+    """
+    Pool thread-safe de instancias FaceMesh ya inicializadas.
+    Cada solicitud toma una instancia, la usa en exclusiva y la devuelve al pool,
+    evitando reconstruir el grafo de MediaPipe en cada análisis.
+    """
+
+    def __init__(self, tamano=TAMANO_POOL_POR_DEFECTO, **config):
+        self.tamano = max(1, int(tamano))
+        self.config = config
+        self._disponibles = queue.LifoQueue()
+
+        for _ in range(self.tamano):
+            self._disponibles.put(self._crear_instancia())
+
+        logger.info("Pool FaceMesh inicializado (%s instancias, config: %s)", self.tamano, self.config)
+
+    def _crear_instancia(self):
+        """Crear una instancia FaceMesh y precalentarla con una imagen vacía"""
+        face_mesh = soluciones_mediapipe().face_mesh.FaceMesh(
+            static_image_mode=True,
+            max_num_faces=1,
+            refine_landmarks=True,
+            **self.config
+        )
+        # La primera llamada a process() inicializa el intérprete TFLite
+        face_mesh.process(np.zeros((64, 64, 3), dtype=np.uint8))
+        return face_mesh
+
+    @contextmanager
+    def obtener(self):
+        """Tomar una instancia del pool durante el bloque 'with'"""
+        face_mesh = self._disponibles.get()
+        try:
+            yield face_mesh
+        finally:
+            self._disponibles.put(face_mesh)
+
+    def detectar(self, imagen_rgb):
+        """Landmarks normalizados float32 (N, 3) del primer rostro, o None si no hay ninguno"""
+        with self.obtener() as face_mesh:
+            resultados = face_mesh.process(imagen_rgb)
+        if not resultados.multi_face_landmarks:
+            return None
+        return extraer_landmarks(resultados.multi_face_landmarks[0])
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def obtener_pool(min_detection_confidence=0.5, min_tracking_confidence=0.5):
+    """
+    Obtener (creándolo la primera vez) el pool del proceso para una configuración dada.
+    Los analizadores con los mismos umbrales comparten el mismo pool.
+    """
+    clave = (min_detection_confidence, min_tracking_confidence)
+    with _pools_lock:
+        pool = _pools.get(clave)
+        if pool is None:
+            pool = PoolFaceMesh(
+                min_detection_confidence=min_detection_confidence,
+                min_tracking_confidence=min_tracking_confidence
+            )
+            _pools[clave] = pool
+    return pool
+
+
+def _reiniciar_tras_fork():
+    """
+    En un proceso hijo creado con fork no se reutilizan los grafos FaceMesh del padre
+    (sus hilos internos no sobreviven al fork): cada worker crea los suyos al primer uso
+    """
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reiniciar_tras_fork)
@@ -0,0 +1,419 @@
+# recomendaciones.py - Recomendaciones de monturas por forma del rostro: plantillas estáticas
+# creadas una vez al importar y copiadas por solicitud, e imágenes de los marcos en caché del proceso
+import base64
+import os
+from functools import lru_cache
+from types import MappingProxyType
+
+from registro import obtener_logger
+
+logger = obtener_logger('recomendaciones')
+
+# Imágenes de los marcos (rutas relativas al directorio de trabajo, como el resto de recursos)
+DIRECTORIO_MARCOS = "venv/marcos"
+
+# Archivo de la imagen de cada recomendación, en el mismo orden que las plantillas
+ARCHIVOS_MARCOS = {
+    "Cuadrado": ("rectangularc.jpg", "aviador.jpg"),
+    "Ovalado": ("redondoc.png", "rectangulars.jpg"),
+    "Redondo": ("rectangulara.png", "mariposa.jpg"),
+    "Diamante": ("ovalados.png", "rectangulare.jpg"),
+    "Oblongo": ("cuadradoa.png", "monturas.png"),
+}
+
+# Boxing por defecto cuando no hay medidas
+BOXING_POR_DEFECTO = {"calibre_horizontal": 52, "calibre_vertical": 40, "puente": 18, "box_code": "52 ⎯ 18"}
+
+# Recomendaciones del análisis general: 'calibre' de optical_fit se rellena con el boxing de cada rostro
+PLANTILLAS_ANALISIS = {
+    "Cuadrado": (
+        {
+            "name": "Marco ejemplo 1",
+            "style": "Rectangular Clásico",
+            "reason": (
+                "Suaviza los ángulos de tu rostro cuadrado creando equilibrio visual perfecto. "
+                "Recomendado con monturas de calibre medio y puente pronunciado."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "8°–12° ideal para ampliar campo visual inferior",
+                "curvatura_base": "Base 4 o 6 (rostro plano con mandíbula fuerte)",
+                "altura_visual_recomendada": "b/2 + 2 mm (según altura pupilar promedio)"
+            },
+            "confidence": 95
+        },
+        {
+            "name": "Marco ejemplo 2",
+            "style": "Aviador Moderno",
+            "reason": (
+                "Las curvas orgánicas contrastan armoniosamente con tu estructura angular definida. "
+                "Ideal si preferís monturas metálicas ligeras."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "10° moderado",
+                "curvatura_base": "Base 6 para mejor ajuste lateral",
+                "altura_visual_recomendada": "Centro óptico alineado al eje pupilar"
+            },
+            "confidence": 88
+        }
+    ),
+    "Ovalado": (
+        {
+            "name": "Marco ejemplo 3",
+            "style": "Redondo Contemporáneo",
+            "reason": (
+                "Mantiene el balance natural de tu rostro ovalado perfectamente proporcionado. "
+                "Recomendado para quienes buscan armonía visual sin exceso de volumen."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "8°–10°",
+                "curvatura_base": "Base 4 o 5",
+                "altura_visual_recomendada": "b/2 exacto (alineación natural del eje visual)"
+            },
+            "confidence": 92
+        },
+        {
+            "name": "Marco ejemplo 4",
+            "style": "Rectangular Suave",
+            "reason": (
+                "Añade definición sutil sin romper la armonía de tus facciones balanceadas. "
+                "Funciona con lentes de cualquier potencia óptica sin distorsión perceptible."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "10° estándar",
+                "curvatura_base": "Base 4",
+                "altura_visual_recomendada": "b/2 + 1 mm"
+            },
+            "confidence": 85
+        }
+    ),
+    "Redondo": (
+        {
+            "name": "Marco ejemplo 5",
+            "style": "Rectangular Anguloso",
+            "reason": (
+                "Crea contraste visual y define la estructura de tu rostro redondeado. "
+                "El diseño anguloso mejora la percepción de simetría facial."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "12° recomendado",
+                "curvatura_base": "Base 4 o menor para evitar sobrecorrección óptica",
+                "altura_visual_recomendada": "b/2 + 2 mm"
+            },
+            "confidence": 90
+        },
+        {
+            "name": "Marco ejemplo 6",
+            "style": "Mariposa con lift",
+            "reason": (
+                "Alarga visualmente y añade un toque de sofisticación femenina. "
+                "Ideal para rostros con mejillas llenas y estructura suave."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "10°–14° (efecto de elevación visual)",
+                "curvatura_base": "Base 6 recomendada",
+                "altura_visual_recomendada": "b/2 + 3 mm (realza mirada superior)"
+            },
+            "confidence": 82
+        }
+    ),
+    "Diamante": (
+        {
+            "name": "Marco ejemplo 7",
+            "style": "Ovalado Suave",
+            "reason": (
+                "Suaviza los pómulos prominentes y equilibra las proporciones faciales. "
+                "Las líneas redondeadas neutralizan los ángulos laterales."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "9°–11°",
+                "curvatura_base": "Base 5",
+                "altura_visual_recomendada": "b/2 + 1 mm"
+            },
+            "confidence": 89
+        },
+        {
+            "name": "Marco ejemplo 8",
+            "style": "Rectangular Estrecho",
+            "reason": (
+                "Complementa la estructura angular sin exagerar las líneas definidas. "
+                "Ideal para mantener proporciones y reducir volumen lateral."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "10° estándar",
+                "curvatura_base": "Base 4 o 5",
+                "altura_visual_recomendada": "b/2 + 2 mm"
+            },
+            "confidence": 84
+        }
+    ),
+    "Oblongo": (
+        {
+            "name": "Marco ejemplo 9",
+            "style": "Cuadrado Ancho",
+            "reason": (
+                "Añade volumen horizontal para acortar visualmente el rostro alargado. "
+                "Recomendado con lentes planas o base reducida."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "6°–8° para minimizar inclinación vertical",
+                "curvatura_base": "Base 4",
+                "altura_visual_recomendada": "b/2 - 1 mm"
+            },
+            "confidence": 87
+        },
+        {
+            "name": "Marco ejemplo 10",
+            "style": "Montura superior acentuada",
+            "reason": (
+                "Rompe la longitud facial con diseño estratégico en la parte superior. "
+                "Ideal para mantener la proporción entre frente y mandíbula."
+            ),
+            "optical_fit": {
+                "calibre": None,  # boxing estimado de cada rostro
+                "angulo_pantoscopico": "8°–10°",
+                "curvatura_base": "Base 5",
+                "altura_visual_recomendada": "b/2"
+            },
+            "confidence": 83
+        }
+    ),
+}
+
+# Recomendaciones del análisis para PDF (calibres fijos por montura; las imágenes se añaden por solicitud)
+PLANTILLAS_PDF = {
+    "Cuadrado": (
+        {
+            "name": "Marco Ejecutivo Premium",
+            "style": "Rectangular Clásico",
+            "reason": "Suaviza los ángulos de tu rostro cuadrado creando equilibrio visual perfecto",
+            "confidence": 95,
+            "optical_fit": {
+                "calibre": "54-18-140",
+                "angulo_pantoscopico": "8-12°",
+                "curvatura_base": "4-6 base",
+                "altura_visual_recomendada": "28-32mm"
+            }
+        },
+        {
+            "name": "Aviador Titanium Elite",
+            "style": "Aviador Moderno",
+            "reason": "Las curvas orgánicas contrastan armoniosamente con tu estructura angular definida",
+            "confidence": 88,
+            "optical_fit": {
+                "calibre": "58-16-135",
+                "angulo_pantoscopico": "10-15°",
+                "curvatura_base": "6-8 base",
+                "altura_visual_recomendada": "30-34mm"
+            }
+        }
+    ),
+    "Ovalado": (
+        {
+            "name": "Redondo Vintage Luxe",
+            "style": "Redondo Contemporáneo",
+            "reason": "Mantiene el balance natural de tu rostro ovalado perfectamente proporcionado",
+            "confidence": 92,
+            "optical_fit": {
+                "calibre": "52-18-145",
+                "angulo_pantoscopico": "6-10°",
+                "curvatura_base": "2-4 base",
+                "altura_visual_recomendada": "26-30mm"
+            }
+        },
+        {
+            "name": "Wayfarer Clásico",
+            "style": "Rectangular Suave",
+            "reason": "Añade definición sutil sin romper la armonía de tus facciones balanceadas",
+            "confidence": 85,
+            "optical_fit": {
+                "calibre": "56-20-140",
+                "angulo_pantoscopico": "8-12°",
+                "curvatura_base": "4-6 base",
+                "altura_visual_recomendada": "28-32mm"
+            }
+        }
+    ),
+    "Redondo": (
+        {
+            "name": "Rectangular Arquitectónico",
+            "style": "Rectangular Anguloso",
+            "reason": "Crea contraste visual y define la estructura de tu rostro redondeado",
+            "confidence": 90,
+            "optical_fit": {
+                "calibre": "58-16-135",
+                "angulo_pantoscopico": "10-14°",
+                "curvatura_base": "6-8 base",
+                "altura_visual_recomendada": "30-34mm"
+            }
+        },
+        {
+            "name": "Cat Eye Elegante",
+            "style": "Mariposa con lift",
+            "reason": "Alarga visualmente y añade un toque de sofisticación femenina",
+            "confidence": 82,
+            "optical_fit": {
+                "calibre": "54-18-140",
+                "angulo_pantoscopico": "8-12°",
+                "curvatura_base": "4-6 base",
+                "altura_visual_recomendada": "26-30mm"
+            }
+        }
+    ),
+    "Diamante": (
+        {
+            "name": "Ovalado Sophistique",
+            "style": "Ovalado Suave",
+            "reason": "Suaviza los pómulos prominentes y equilibra las proporciones faciales",
+            "confidence": 89,
+            "optical_fit": {
+                "calibre": "52-16-145",
+                "angulo_pantoscopico": "6-10°",
+                "curvatura_base": "2-4 base",
+                "altura_visual_recomendada": "24-28mm"
+            }
+        },
+        {
+            "name": "Rectangular Precision",
+            "style": "Rectangular Estrecho",
+            "reason": "Complementa la estructura angular sin exagerar las líneas definidas",
+            "confidence": 84,
+            "optical_fit": {
+                "calibre": "54-14-140",
+                "angulo_pantoscopico": "8-12°",
+                "curvatura_base": "4-6 base",
+                "altura_visual_recomendada": "26-30mm"
+            }
+        }
+    ),
+    "Oblongo": (
+        {
+            "name": "Cuadrado Statement",
+            "style": "Cuadrado Ancho",
+            "reason": "Añade volumen horizontal para acortar visualmente el rostro alargado",
+            "confidence": 87,
+            "optical_fit": {
+                "calibre": "60-18-140",
+                "angulo_pantoscopico": "12-16°",
+                "curvatura_base": "6-8 base",
+                "altura_visual_recomendada": "32-36mm"
+            }
+        },
+        {
+            "name": "Browline Master",
+            "style": "Montura superior acentuada",
+            "reason": "Rompe la longitud facial con diseño estratégico en la parte superior",
+            "confidence": 83,
+            "optical_fit": {
+                "calibre": "56-16-145",
+                "angulo_pantoscopico": "8-12°",
+                "curvatura_base": "4-6 base",
+                "altura_visual_recomendada": "28-32mm"
+            }
+        }
+    ),
+}
+
+
+def estimar_boxing(medidas):
+    """Boxing estimado (mm) a partir de las medidas faciales: calibres, puente y código 'a ⎯ d'"""
+    if not medidas:
+        return dict(BOXING_POR_DEFECTO)
+
+    a = round(medidas['B'] / 10, 1)   # Calibre horizontal estimado (mm)
+    b = round(medidas['A'] / 15, 1)   # Calibre vertical estimado (mm)
+    d = round(medidas['F'] / 10, 1)   # Puente o distancia entre lentes (mm)
+    return {
+        "calibre_horizontal": a,
+        "calibre_vertical": b,
+        "puente": d,
+        "box_code": f"{a} ⎯ {d}"
+    }
+
+
+def _copiar(plantilla, ajuste_optico=None, **campos):
+    """Copia de una plantilla para una respuesta: los dicts anidados tampoco se comparten"""
+    optical_fit = dict(plantilla["optical_fit"], **(ajuste_optico or {}))
+    return dict(plantilla, optical_fit=optical_fit, **campos)
+
+
+def recomendaciones_analisis(forma_rostro, medidas=None):
+    """Recomendaciones del análisis general con el calibre estimado de las medidas del rostro"""
+    calibre = estimar_boxing(medidas)["box_code"]
+    return [_copiar(plantilla, {"calibre": calibre}) for plantilla in PLANTILLAS_ANALISIS.get(forma_rostro, ())]
+
+
+def ruta_marco(archivo):
+    """Ruta local de la imagen de un marco (la 'local_image' de las recomendaciones para PDF)"""
+    return f"{DIRECTORIO_MARCOS}/{archivo}"
+
+
+def _leer_imagen(ruta_imagen):
+    """Bytes de una imagen de marco, o None si no existe o no se puede leer"""
+    if not os.path.exists(ruta_imagen):
+        logger.debug("%s: NO EXISTE", ruta_imagen)
+        return None
+    try:
+        with open(ruta_imagen, "rb") as image_file:
+            return image_file.read()
+    except Exception as e:
+        logger.error("%s: Error al leer: %s", ruta_imagen, e)
+        return None
+
+
+def _data_url(ruta_imagen, datos):
+    """data URL de los bytes de una imagen de marco (None si no se pudo leer)"""
+    if datos is None:
+        return None
+    # Tipo MIME según la extensión
+    mime_type = 'image/png' if ruta_imagen.lower().endswith('.png') else 'image/jpeg'
+    return f"data:{mime_type};base64,{base64.b64encode(datos).decode('utf-8')}"
+
+
+@lru_cache(maxsize=None)
+def bytes_marcos():
+    """
+    Bytes de las imágenes de los marcos (JPEG o PNG), leídos una vez por proceso: {ruta local: bytes | None}.
+    El PDF los inserta desde memoria y imagenes_marcos() los codifica en base64 sin volver a leer el disco
+    """
+    rutas = dict.fromkeys(ruta_marco(archivo) for archivos in ARCHIVOS_MARCOS.values() for archivo in archivos)
+    return MappingProxyType({ruta: _leer_imagen(ruta) for ruta in rutas})
+
+
+@lru_cache(maxsize=None)
+def imagenes_marcos():
+    """
+    Imágenes de los marcos en base64 por forma, leídas una vez por proceso: {forma: (data URL | None, ...)}.
+    Mapeo de solo lectura compartido por todas las solicitudes (y entre workers si se precarga antes del fork)
+    """
+    datos = bytes_marcos()
+    imagenes = {forma: tuple(_data_url(ruta_marco(archivo), datos[ruta_marco(archivo)]) for archivo in archivos)
+                for forma, archivos in ARCHIVOS_MARCOS.items()}
+    logger.debug("Imágenes de marcos cargadas: %s",
+                 {forma: [bool(imagen) for imagen in lista] for forma, lista in imagenes.items()})
+    return MappingProxyType(imagenes)
+
+
+def recomendaciones_pdf(forma_rostro):
+    """Recomendaciones del análisis para PDF con la imagen de cada marco (base64, URL y ruta local)"""
+    imagenes = imagenes_marcos().get(forma_rostro, ())
+    archivos = ARCHIVOS_MARCOS.get(forma_rostro, ())
+    recomendaciones = []
+    for i, plantilla in enumerate(PLANTILLAS_PDF.get(forma_rostro, ())):
+        campos = {}
+        if i < len(imagenes):
+            campos = {
+                "image_data": imagenes[i],
+                "image_url": f"/marcos/{archivos[i]}",
+                "local_image": ruta_marco(archivos[i]),
+            }
+        recomendaciones.append(_copiar(plantilla, **campos))
+    return recomendaciones
@@ -0,0 +1,155 @@
+# registro.py - Registro (logging) con niveles, id de solicitud y escritura en segundo plano,
+# para que los mensajes de diagnóstico no escriban en stdout desde el hilo de la solicitud
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+
+# Nivel mínimo: WARNING por defecto (silencioso en producción); INFO o DEBUG para diagnosticar
+NIVEL_POR_DEFECTO = os.environ.get("LOG_LEVEL", "WARNING").upper()
+# 'texto' (una línea legible) o 'json' (un objeto por línea para el agregador de logs)
+FORMATO_POR_DEFECTO = os.environ.get("LOG_FORMATO", "texto").lower()
+
+RAIZ = 'optiscan'
+SIN_SOLICITUD = '-'
+
+# Cabecera con la que el cliente o el proxy pueden fijar el id de correlación
+CABECERA_ID_SOLICITUD = 'X-Request-ID'
+_ID_VALIDO = re.compile(r'[\w.\-]{1,64}')
+
+# Id de la solicitud en curso; cada hilo (y cada tarea de contextvars) ve el suyo
+_id_solicitud = contextvars.ContextVar('id_solicitud', default=SIN_SOLICITUD)
+
+
+def id_solicitud_actual():
+    return _id_solicitud.get()
+
+
+def normalizar_id_solicitud(valor):
+    """Usar el id recibido si es seguro para los logs; si no, generar uno nuevo"""
+    if isinstance(valor, str) and _ID_VALIDO.fullmatch(valor):
+        return valor
+    return uuid.uuid4().hex
+
+
+def establecer_id_solicitud(valor):
+    """Fijar el id de la solicitud actual; devuelve el token para restablecer_id_solicitud"""
+    return _id_solicitud.set(valor or SIN_SOLICITUD)
+
+
+def restablecer_id_solicitud(token):
+    _id_solicitud.reset(token)
+
+
+@contextmanager
+def contexto_solicitud(valor):
+    """Registrar el bloque con el id indicado (p. ej. en un proceso del pool de análisis)"""
+    token = establecer_id_solicitud(valor)
+    try:
+        yield
+    finally:
+        restablecer_id_solicitud(token)
+
+
+class FiltroIdSolicitud(logging.Filter):
+    """Añadir el id de la solicitud al registro en el hilo que lo emite (antes de encolarlo)"""
+
+    def filter(self, registro):
+        registro.id_solicitud = _id_solicitud.get()
+        return True
+
+
+class FormatoJSON(logging.Formatter):
+    """Un objeto JSON por línea"""
+
+    def format(self, registro):
+        datos = {
+            'tiempo': self.formatTime(registro),
+            'nivel': registro.levelname,
+            'logger': registro.name,
+            'id_solicitud': getattr(registro, 'id_solicitud', SIN_SOLICITUD),
+            'proceso': registro.process,
+            'mensaje': registro.getMessage(),
+        }
+        return json.dumps(datos, ensure_ascii=False)
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    QueueHandler cuyo hilo escritor (QueueListener) arranca con el primer registro de cada
+    proceso: el hilo de la solicitud solo encola y la escritura en stdout ocurre aparte.
+    Tras un fork (workers de gunicorn con preload) el hijo descarta la cola heredada.
+    """
+
+    def __init__(self, destino):
+        super().__init__(queue.SimpleQueue())
+        self.destino = destino
+        self._escritor = None
+        self._lock_escritor = threading.Lock()
+        os.register_at_fork(after_in_child=self._reiniciar_tras_fork)
+
+    def _reiniciar_tras_fork(self):
+        self.queue = queue.SimpleQueue()
+        self._escritor = None
+        self._lock_escritor = threading.Lock()
+
+    def enqueue(self, registro):
+        if self._escritor is None:
+            self.iniciar()
+        self.queue.put_nowait(registro)
+
+    def iniciar(self):
+        with self._lock_escritor:
+            if self._escritor is None:
+                self._escritor = logging.handlers.QueueListener(self.queue, self.destino)
+                self._escritor.start()
+                atexit.register(self.detener)
+
+    def detener(self):
+        """Escribir los registros pendientes y parar el hilo escritor"""
+        with self._lock_escritor:
+            escritor, self._escritor = self._escritor, None
+        if escritor is not None:
+            escritor.stop()
+
+
+_configurado = False
+_lock_configuracion = threading.Lock()
+
+
+def configurar_registro(nivel=NIVEL_POR_DEFECTO, formato=FORMATO_POR_DEFECTO):
+    """Configurar el logger raíz 'optiscan' (idempotente; obtener_logger lo llama)"""
+    global _configurado
+    with _lock_configuracion:
+        if _configurado:
+            return
+        salida = logging.StreamHandler(sys.stdout)
+        if formato == 'json':
+            salida.setFormatter(FormatoJSON())
+        else:
+            salida.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)s [%(id_solicitud)s] %(name)s: %(message)s'))
+
+        manejador = ManejadorCola(salida)
+        manejador.addFilter(FiltroIdSolicitud())
+
+        nivel_numerico = logging.getLevelName(nivel)  # nombre desconocido -> cadena, no entero
+        raiz = logging.getLogger(RAIZ)
+        raiz.setLevel(nivel_numerico if isinstance(nivel_numerico, int) else logging.WARNING)
+        raiz.handlers = [manejador]
+        raiz.propagate = False
+        _configurado = True
+
+
+def obtener_logger(nombre):
+    """Logger 'optiscan.<nombre>' ya configurado"""
+    configurar_registro()
+    return logging.getLogger(f"{RAIZ}.{nombre}")
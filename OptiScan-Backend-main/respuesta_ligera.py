@@ -0,0 +1,55 @@
+# respuesta_ligera.py - Modo de respuesta ligera: sin imágenes base64 ni landmarks densos,
+# que se sirven por referencia desde el análisis guardado (analysis_id)
+import base64
+
+# Campos pesados que el modo ligero omite, estén donde estén dentro del análisis
+CAMPOS_PESADOS = frozenset({
+    'imagen_base64',     # JPEG del rostro (forma) o de la máscara de piel (tono)
+    'imagen_debug',      # JPEG de la detección del cuadrado verde
+    'puntos_faciales',   # 478 landmarks como listas anidadas
+    'image_data',        # imagen de cada montura recomendada (ya tiene image_url)
+})
+
+# Recursos que se pueden pedir por referencia: nombre -> ruta dentro del análisis guardado
+# (el análisis de forma con el de tono anidado en 'tono_piel', ver registrar_analisis en app.py)
+RECURSOS = {
+    'imagen': ('imagen_base64',),
+    'imagen_tono': ('tono_piel', 'imagen_base64'),
+    'imagen_referencia': ('deteccion_referencia', 'deteccion', 'imagen_debug'),
+    'puntos_faciales': ('puntos_faciales',),
+}
+
+# Recursos que son imágenes JPEG en base64 (el resto se devuelve como JSON)
+RECURSOS_IMAGEN = frozenset({'imagen', 'imagen_tono', 'imagen_referencia'})
+
+
+def aligerar(valor):
+    """Copia del análisis sin CAMPOS_PESADOS (no modifica el original, que puede estar en caché)"""
+    if isinstance(valor, dict):
+        return {clave: aligerar(v) for clave, v in valor.items() if clave not in CAMPOS_PESADOS}
+    if isinstance(valor, list):
+        return [aligerar(v) for v in valor]
+    return valor
+
+
+def obtener_recurso(analisis, nombre):
+    """Valor del recurso en el análisis guardado, o None si no existe"""
+    valor = analisis
+    for clave in RECURSOS.get(nombre, ()):
+        if not isinstance(valor, dict):
+            return None
+        valor = valor.get(clave)
+    return valor if nombre in RECURSOS else None
+
+
+def referencias_recursos(analisis, analysis_id, ruta_base='/analysis'):
+    """{nombre: url} de los recursos omitidos que el análisis guardado sí contiene"""
+    if not analysis_id:
+        return {}
+    return {nombre: f"{ruta_base}/{analysis_id}/{nombre}"
+            for nombre in RECURSOS if obtener_recurso(analisis, nombre)}
+
+
+def bytes_recurso_imagen(valor):
+    """Bytes JPEG de una imagen guardada en base64 (con o sin prefijo data:image/...;base64,)"""
+    return base64.b64decode(valor.split(',')[-1])
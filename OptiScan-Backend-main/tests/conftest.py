@@ -0,0 +1,28 @@
+# conftest.py - Fixtures comunes: una foto de rostro real y su análisis de forma para PDF
+import os
+import sys
+
+import pytest
+
+# Los módulos del backend están en la raíz del proyecto (sin paquete instalable)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def imagen_rostro():
+    """Bytes JPEG de un retrato (datos de ejemplo de matplotlib, ya en requirements.txt)"""
+    from matplotlib import cbook
+    with cbook.get_sample_data('grace_hopper.jpg') as archivo:
+        return archivo.read()
+
+
+@pytest.fixture(scope='session')
+def analisis_pdf(imagen_rostro):
+    """Análisis de forma del analizador para PDF (con imagen_base64, puntos y rectángulo del rostro)"""
+    from main_pdf import AnalizadorFormaRostroPDF
+    from pipeline import PipelineAnalisisCompleto
+
+    pipeline = PipelineAnalisisCompleto(analizador_forma=AnalizadorFormaRostroPDF())
+    resultados = pipeline.analizar(imagen_rostro, tono=False, medidas_reales=False)
+    assert 'forma_rostro' in resultados, resultados.get('error')
+    return resultados['forma_rostro']
@@ -0,0 +1,48 @@
+# test_cache_pipeline.py - La caché de la forma es común a los analizadores de /analyze-complete
+# y del PDF: el PDF de una imagen ya analizada no repite el trabajo de visión
+import pytest
+
+from cache_analisis import CacheAnalisis
+from main import AnalizadorFormaRostroAvanzado
+from main_pdf import AnalizadorFormaRostroPDF
+from pipeline import PipelineAnalisisCompleto
+
+
+@pytest.fixture
+def pipelines():
+    """Pipelines general y de PDF con una caché propia compartida (como los de app.py)"""
+    cache = CacheAnalisis()
+    return (PipelineAnalisisCompleto(analizador_forma=AnalizadorFormaRostroAvanzado(), cache=cache),
+            PipelineAnalisisCompleto(analizador_forma=AnalizadorFormaRostroPDF(), cache=cache))
+
+
+def test_pdf_despues_de_analisis_no_decodifica(pipelines, imagen_rostro, monkeypatch):
+    completo, pdf = pipelines
+    analisis = completo.analizar(imagen_rostro)
+    assert 'forma_rostro' in analisis, analisis.get('error')
+
+    def sin_decodificar(*args, **kwargs):
+        raise AssertionError("el pipeline del PDF ha decodificado la imagen")
+
+    monkeypatch.setattr(pdf, 'decodificar_trabajo', sin_decodificar)
+    monkeypatch.setattr(pdf, 'decodificar', sin_decodificar)
+    monkeypatch.setattr(pdf.analizador_forma, 'analizar_puntos', sin_decodificar)
+    reporte = pdf.analizar(imagen_rostro)
+
+    forma, forma_pdf = analisis['forma_rostro'], reporte['forma_rostro']
+    assert forma_pdf['imagen_base64'] == forma['imagen_base64']
+    assert forma_pdf['medidas'] == forma['medidas']
+    assert forma_pdf['medidas_convertidas'] == forma['medidas_convertidas']
+
+
+def test_recomendaciones_son_las_de_cada_analizador(pipelines, imagen_rostro):
+    completo, pdf = pipelines
+    forma = completo.analizar(imagen_rostro, tono=False)['forma_rostro']
+    forma_pdf = pdf.analizar(imagen_rostro, tono=False)['forma_rostro']
+
+    # El general estima el calibre; el del PDF lleva la imagen de cada marco
+    assert forma['recomendaciones'] and all(rec['optical_fit']['calibre'] for rec in forma['recomendaciones'])
+    assert 'image_url' not in forma['recomendaciones'][0]
+    assert forma_pdf['recomendaciones'] and all('image_url' in rec for rec in forma_pdf['recomendaciones'])
+    # Y no se mezclan a través de la caché
+    assert completo.analizar(imagen_rostro, tono=False)['forma_rostro']['recomendaciones'] == forma['recomendaciones']
@@ -0,0 +1,72 @@
+# test_color_dominante.py - Concordancia del k-means de NumPy con el KMeans de scikit-learn:
+# el tono principal de la piel debe ser el mismo color a efectos prácticos (ΔE76 pequeño)
+import cv2
+import numpy as np
+import pytest
+
+from color_dominante import color_dominante
+from pool_facemesh import landmarks_a_pixeles, obtener_pool, puntos_enteros
+from tonos import AnalizadorTonoPielMejorado
+
+pytest.importorskip('sklearn')
+
+# Diferencia máxima admitida entre los dos tonos principales (CIE76, Lab). ~2.3 es la diferencia
+# apenas perceptible; en el retrato de ejemplo se mide un máximo de ~0.7
+DELTA_E_MAXIMA = 2.0
+
+# Variantes de iluminación del recorte de piel: ganancia y tinte por canal (R, G, B)
+GANANCIAS = (0.45, 0.6, 0.8, 1.0, 1.15)
+TINTES = ((1.0, 1.0, 1.0), (1.1, 1.0, 0.85), (0.9, 1.0, 1.1))
+MUESTRAS = (500, 1500, 4000)
+
+
+def delta_e(rgb_a, rgb_b):
+    """ΔE CIE76 entre dos colores RGB 0-255"""
+    lab = cv2.cvtColor(np.float32([[rgb_a, rgb_b]]) / 255, cv2.COLOR_RGB2Lab)[0]
+    return float(np.linalg.norm(lab[0] - lab[1]))
+
+
+@pytest.fixture(scope='module')
+def retrato(imagen_rostro):
+    """Retrato RGB y sus landmarks normalizados (umbrales del analizador de tono)"""
+    imagen = cv2.cvtColor(cv2.imdecode(np.frombuffer(imagen_rostro, np.uint8), cv2.IMREAD_COLOR),
+                          cv2.COLOR_BGR2RGB)
+    analizador = AnalizadorTonoPielMejorado()
+    landmarks = obtener_pool(**analizador.config_face_mesh).detectar(imagen)
+    assert landmarks is not None
+    return imagen, landmarks
+
+
+@pytest.mark.parametrize('tinte', TINTES)
+@pytest.mark.parametrize('ganancia', GANANCIAS)
+def test_tono_principal_coincide_con_sklearn(retrato, ganancia, tinte):
+    imagen, landmarks = retrato
+    variante = np.clip(imagen * ganancia * np.array(tinte), 0, 255).astype(np.uint8)
+
+    analizador = AnalizadorTonoPielMejorado()
+    puntos = puntos_enteros(landmarks_a_pixeles(landmarks, variante.shape))
+    recorte, puntos_recorte, _ = analizador.recortar_region_rostro(variante, puntos)
+    mascara = analizador.crear_mascara_piel_precisa(recorte, puntos_recorte)
+
+    for max_muestras in MUESTRAS:
+        tonos = {}
+        for estimador in ('kmeans', 'sklearn'):
+            analizador.estimador_color = estimador
+            tonos[estimador] = analizador.extraer_color_piel_mejorado(recorte, mascara, max_muestras=max_muestras)
+        assert tonos['kmeans'] is not None and tonos['sklearn'] is not None
+        assert delta_e(tonos['kmeans'], tonos['sklearn']) < DELTA_E_MAXIMA, (max_muestras, tonos)
+
+
+@pytest.mark.parametrize('semilla', range(8))
+def test_cluster_principal_coincide_con_sklearn(semilla):
+    # Mezcla sintética de tres tonos de piel con tamaños distintos: ambos eligen el mismo cluster
+    rng = np.random.default_rng(semilla)
+    centros = rng.uniform((90, 50, 35), (240, 190, 160), size=(3, 3))
+    tamanos = rng.permutation([700, 450, 250])
+    colores = np.clip(np.concatenate([rng.normal(c, 12, size=(n, 3)) for c, n in zip(centros, tamanos)]),
+                      0, 255).astype(np.uint8)
+
+    tono_numpy, cluster_numpy = color_dominante(colores, estimador='kmeans')
+    tono_sklearn, cluster_sklearn = color_dominante(colores, estimador='sklearn')
+    assert delta_e(tono_numpy, tono_sklearn) < DELTA_E_MAXIMA
+    assert abs(len(cluster_numpy) - len(cluster_sklearn)) <= 0.02 * len(colores)
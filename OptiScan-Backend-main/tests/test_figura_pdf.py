@@ -0,0 +1,112 @@
+# test_figura_pdf.py - Paridad visual de la figura del PDF compuesta con OpenCV (componer_figura)
+# frente al render anterior con matplotlib, sobre la misma imagen anotada
+import base64
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+from pdf import ALTO_TITULO_PX, PDFReportGenerator, componer_figura, rectangulo_imagen
+
+# Umbrales sobre la región de la foto (0-255 / SSIM en [0, 1]). Con el retrato de ejemplo se mide
+# MAD ~3.4 en toda la foto, ~14 en las anotaciones y SSIM ~0.96; sin anotaciones, SSIM ~0.3
+MAD_MAXIMA_FOTO = 8.0
+MAD_MAXIMA_ANOTACIONES = 30.0
+SSIM_MINIMA_ANOTACIONES = 0.85
+
+
+def render_matplotlib(imagen, titulo):
+    """Render anterior de la figura (Figure 14x10 in a 150 dpi, recorte 'tight'), como referencia"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(14, 10))
+    ax = fig.add_subplot()
+    ax.imshow(cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB))
+    ax.set_title(titulo, fontsize=16, weight='bold')
+    ax.axis('off')
+    buffer = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buffer, format='jpeg', dpi=150, bbox_inches='tight', facecolor='white')
+    return decodificar(buffer.getvalue())
+
+
+def decodificar(datos):
+    return cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_COLOR)
+
+
+def region_foto_matplotlib(figura):
+    """Recorte de la foto en el render de matplotlib: las filas y columnas densas en píxeles no blancos"""
+    no_blanco = (figura < 245).any(axis=2)
+    densidad_filas = no_blanco.mean(axis=1)
+    filas = np.flatnonzero(densidad_filas > 0.5 * densidad_filas.max())
+    bloque = no_blanco[filas[0]:filas[-1] + 1]
+    densidad_columnas = bloque.mean(axis=0)
+    columnas = np.flatnonzero(densidad_columnas > 0.5 * densidad_columnas.max())
+    return figura[filas[0]:filas[-1] + 1, columnas[0]:columnas[-1] + 1]
+
+
+def ssim(a, b):
+    """Mapa SSIM (ventana gaussiana 11x11, sigma 1.5) de dos imágenes BGR en gris"""
+    a = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY).astype(np.float64)
+    b = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY).astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    def media(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+
+    media_a, media_b = media(a), media(b)
+    var_a = media(a * a) - media_a ** 2
+    var_b = media(b * b) - media_b ** 2
+    cov = media(a * b) - media_a * media_b
+    return ((2 * media_a * media_b + c1) * (2 * cov + c2)) / ((media_a ** 2 + media_b ** 2 + c1) * (var_a + var_b + c2))
+
+
+@pytest.fixture(scope='module')
+def figuras(analisis_pdf):
+    """Foto de la figura OpenCV, la misma región del render matplotlib y la máscara de anotaciones"""
+    from main_pdf import AnalizadorFormaRostroPDF
+
+    generador = PDFReportGenerator(AnalizadorFormaRostroPDF())
+    anotada = generador.imagen_anotada(analisis_pdf)
+    original = decodificar(base64.b64decode(analisis_pdf['imagen_base64']))
+    titulo = f"ANALISIS DE FORMA FACIAL - {analisis_pdf['forma']}"
+
+    figura = decodificar(generador.crear_figura_directamente(analisis_pdf))
+    x, y, ancho, alto = rectangulo_imagen(anotada.shape)
+    foto = figura[y:y + alto, x:x + ancho]
+
+    referencia = cv2.resize(region_foto_matplotlib(render_matplotlib(anotada, titulo)), (ancho, alto),
+                            interpolation=cv2.INTER_AREA)
+    anotaciones = np.abs(anotada.astype(np.int16) - original).max(axis=2) > 40
+    anotaciones = cv2.resize(anotaciones.astype(np.uint8), (ancho, alto), interpolation=cv2.INTER_NEAREST) > 0
+    sin_anotar = componer_figura(original, titulo)[y:y + alto, x:x + ancho]
+    return {'figura': figura, 'foto': foto, 'referencia': referencia,
+            'anotaciones': anotaciones, 'sin_anotar': sin_anotar}
+
+
+def test_figura_tiene_tamano_del_pdf_y_titulo(figuras):
+    figura = figuras['figura']
+    assert figura.shape == (720, 1140, 3)
+    # Texto oscuro en la franja del título
+    assert (figura[:ALTO_TITULO_PX] < 100).all(axis=2).sum() > 200
+
+
+def test_foto_equivale_al_render_matplotlib(figuras):
+    diferencia = np.abs(figuras['foto'].astype(np.float64) - figuras['referencia']).mean(axis=2)
+    assert diferencia.mean() < MAD_MAXIMA_FOTO
+
+
+def test_anotaciones_equivalen_al_render_matplotlib(figuras):
+    anotaciones = figuras['anotaciones']
+    assert anotaciones.mean() > 0.01  # hay contorno, puntos y líneas que comparar
+
+    diferencia = np.abs(figuras['foto'].astype(np.float64) - figuras['referencia']).mean(axis=2)
+    assert diferencia[anotaciones].mean() < MAD_MAXIMA_ANOTACIONES
+    assert ssim(figuras['foto'], figuras['referencia'])[anotaciones].mean() > SSIM_MINIMA_ANOTACIONES
+
+
+def test_umbral_detecta_anotaciones_ausentes(figuras):
+    # Control: la misma foto sin anotar no debe pasar el umbral de las anotaciones
+    anotaciones = figuras['anotaciones']
+    assert ssim(figuras['sin_anotar'], figuras['referencia'])[anotaciones].mean() < SSIM_MINIMA_ANOTACIONES
@@ -0,0 +1,58 @@
+# test_imagenes_memoria.py - Inserción en el PDF de imágenes JPEG y PNG desde bytes (FPDFMemoria),
+# como las de los marcos en caché, sin pasar por archivos
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+
+from entrada_imagen import info_png
+from pdf import clase_fpdf_memoria
+
+
+def png(imagen):
+    return cv2.imencode('.png', imagen)[1].tobytes()
+
+
+def pixeles(flujo, alto, ancho, canales):
+    """Pixeles de un flujo FlateDecode con Predictor 15 y filtro 'None' en cada fila"""
+    filas = np.frombuffer(zlib.decompress(flujo), np.uint8).reshape(alto, 1 + ancho * canales)
+    assert not filas[:, 0].any()
+    return filas[:, 1:].reshape(alto, ancho, canales).squeeze()
+
+
+@pytest.fixture
+def imagen():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, size=(30, 40, 3), dtype=np.uint8)
+
+
+def test_png_rgb(imagen):
+    info = info_png(png(imagen))
+    assert (info['w'], info['h'], info['cs']) == (40, 30, 'DeviceRGB')
+    assert 'smask' not in info
+    assert np.array_equal(pixeles(info['data'], 30, 40, 3), cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB))
+
+
+def test_png_transparente_y_gris(imagen):
+    alfa = np.tile(np.arange(40, dtype=np.uint8) * 6, (30, 1))
+    info = info_png(png(np.dstack([imagen, alfa])))
+    assert np.array_equal(pixeles(info['data'], 30, 40, 3), cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB))
+    assert np.array_equal(pixeles(info['smask'], 30, 40, 1), alfa)
+
+    gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+    info = info_png(png(gris))
+    assert info['cs'] == 'DeviceGray'
+    assert np.array_equal(pixeles(info['data'], 30, 40, 1), gris)
+
+
+def test_pdf_con_imagenes_en_memoria(imagen):
+    alfa = np.full(imagen.shape[:2], 128, np.uint8)
+    pdf = clase_fpdf_memoria()()
+    pdf.add_page()
+    pdf.imagen_memoria(cv2.imencode('.jpg', imagen)[1].tobytes(), x=10, y=10, w=60, h=45)
+    pdf.imagen_memoria(png(np.dstack([imagen, alfa])), x=80, y=10, w=60, h=45)
+    salida = pdf.output(dest='S').encode('latin-1')
+
+    assert salida.startswith(b'%PDF-1.4')  # la máscara suave exige PDF 1.4
+    assert b'/Filter /DCTDecode' in salida and b'/SMask' in salida
@@ -0,0 +1,44 @@
+# test_tiempo_importacion.py - Presupuesto de `python -X importtime -c "import app"`: app.py no debe
+# cargar los módulos pesados al importarse (cada etapa los importa al primer uso)
+import os
+import subprocess
+import sys
+
+RAIZ_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tiempo acumulado máximo de `import app` (µs). Se mide ~0.25-0.4 s; antes de diferir las importaciones, ~1.3 s
+PRESUPUESTO_US = 500_000
+# Mejor de varias ejecuciones: la primera puede pagar la compilación a .pyc o una caché de disco fría
+EJECUCIONES = 3
+
+# Paquetes que solo se cargan al usarse (FaceMesh, figura de depuración, PDF, estimador sklearn)
+MODULOS_DIFERIDOS = ('mediapipe', 'matplotlib', 'sklearn', 'fpdf')
+
+
+def medir_importacion():
+    """{módulo: µs acumulados} de una importación de app en un proceso nuevo"""
+    proceso = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=RAIZ_PROYECTO,
+                             capture_output=True, text=True, timeout=120)
+    assert proceso.returncode == 0, proceso.stderr[-2000:]
+
+    tiempos = {}
+    for linea in proceso.stderr.splitlines():
+        # "import time:  self [us] | cumulative | nombre" (la cabecera no tiene números)
+        if not linea.startswith('import time:'):
+            continue
+        _, acumulado, nombre = linea[len('import time:'):].split('|')
+        if acumulado.strip().isdigit():
+            tiempos[nombre.strip()] = int(acumulado)
+    return tiempos
+
+
+def test_importar_app_dentro_del_presupuesto():
+    mediciones = [medir_importacion() for _ in range(EJECUCIONES)]
+    assert all('app' in tiempos for tiempos in mediciones)
+    mejor = min(tiempos['app'] for tiempos in mediciones)
+    assert mejor < PRESUPUESTO_US, f"import app: {mejor / 1e6:.2f} s (presupuesto {PRESUPUESTO_US / 1e6:.2f} s)"
+
+
+def test_importar_app_no_carga_modulos_pesados():
+    cargados = {nombre.split('.')[0] for nombre in medir_importacion()}
+    assert not cargados & set(MODULOS_DIFERIDOS), sorted(cargados & set(MODULOS_DIFERIDOS))
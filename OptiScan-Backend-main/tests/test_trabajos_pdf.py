@@ -0,0 +1,20 @@
+# test_trabajos_pdf.py - Retención acotada de los trabajos de PDF terminados: por encima de
+# terminados_max se descartan los más antiguos aunque su TTL no haya vencido
+from trabajos_pdf import COMPLETADO, ColaTrabajosPDF
+
+
+def test_descarta_los_terminados_mas_antiguos():
+    cola = ColaTrabajosPDF(trabajadores=1, terminados_max=3)
+    trabajos = []
+    for i in range(5):
+        trabajo = cola.enviar(lambda i=i: b'%PDF' + bytes([i]))
+        assert trabajo.esperar(5)
+        trabajos.append(trabajo)
+
+    # Los dos primeros se descartan; los tres últimos siguen descargables
+    assert [cola.obtener(t.id) for t in trabajos[:2]] == [None, None]
+    assert all(cola.obtener(t.id).estado == COMPLETADO for t in trabajos[2:])
+
+    metricas = cola.estadisticas()
+    assert metricas['descartados'] == 2
+    assert metricas['trabajos_retenidos'] == 3
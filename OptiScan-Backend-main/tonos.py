@@ -1,36 +1,64 @@
 import cv2
 import numpy as np
-import mediapipe as mp
 import os
 import json
 import sys
 import base64
-from collections import Counter
-from sklearn.cluster import KMeans
+
+from pool_facemesh import obtener_pool, soluciones_mediapipe, landmarks_a_pixeles, puntos_enteros
+from entrada_imagen import decodificar_imagen
+from color_dominante import color_dominante, ESTIMADOR_POR_DEFECTO
+from metricas import medir_etapa, metricas_etapas
+from registro import obtener_logger
+
+logger = obtener_logger('tonos')
 
 # Configurar la codificación para Windows
 if sys.platform == "win32":
     sys.stdout.reconfigure(encoding='utf-8')
 
+# Máximo de píxeles de piel muestreados para estimar el color (configurable por entorno)
+MAX_MUESTRAS_PIEL = int(os.environ.get("TONO_MAX_MUESTRAS", 1500))
+
+# Margen (px) alrededor de los landmarks al recortar el rostro, para que la
+# morfología y el desenfoque no lleguen al borde del recorte
+MARGEN_ROI_ROSTRO = 16
+
+# Área mínima de la máscara de piel (píxeles de la imagen original) antes de recurrir a la máscara
+# facial completa. Sobre una imagen reducida se escala por escala_imagen²
+AREA_PIEL_MINIMA = 1000
+
 class AnalizadorTonoPielMejorado:
     def __init__(self):
-        # Inicializar MediaPipe Face Mesh con configuraciones mejoradas
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            static_image_mode=True,
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.7,  # Aumentado para mejor precisión
-            min_tracking_confidence=0.7
-        )
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.mp_drawing_styles = mp.solutions.drawing_styles
-        print(">>> Analizador de Tono de Piel Mejorado inicializado")
+        # MediaPipe Face Mesh (pool compartido) con configuraciones mejoradas
+        self.config_face_mesh = {
+            'min_detection_confidence': 0.7,  # Aumentado para mejor precisión
+            'min_tracking_confidence': 0.7
+        }
+        self.max_muestras_piel = MAX_MUESTRAS_PIEL
+        self.estimador_color = ESTIMADOR_POR_DEFECTO
+        logger.info("Analizador de Tono de Piel Mejorado inicializado")
+
+    # Soluciones de MediaPipe, resueltas al acceder (mediapipe no se importa con el módulo)
+    @property
+    def mp_face_mesh(self):
+        return soluciones_mediapipe().face_mesh
+
+    @property
+    def mp_drawing(self):
+        return soluciones_mediapipe().drawing_utils
+
+    @property
+    def mp_drawing_styles(self):
+        return soluciones_mediapipe().drawing_styles
     
     def cargar_imagen(self, ruta_imagen):
-        """Cargar y preparar imagen"""
+        """Cargar y preparar imagen (ruta de archivo, bytes crudos o ndarray BGR ya decodificado)"""
         try:
-            imagen = cv2.imread(ruta_imagen)
+            if isinstance(ruta_imagen, str):
+                imagen = cv2.imread(ruta_imagen)
+            else:
+                imagen = decodificar_imagen(ruta_imagen)
             if imagen is None:
                 return None, None
             
@@ -39,28 +67,36 @@ class AnalizadorTonoPielMejorado:
             imagen_rgb = cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB)
             return imagen, imagen_rgb
         except Exception as e:
-            print(f"Error cargando imagen: {e}")
+            logger.error("Error cargando imagen: %s", e)
             return None, None
     
     def detectar_puntos_faciales(self, imagen_rgb):
-        """Detectar puntos faciales con MediaPipe"""
-        resultados = self.face_mesh.process(imagen_rgb)
-        
-        if not resultados.multi_face_landmarks:
-            print("No se detectaron rostros en la imagen")
+        """Detectar puntos faciales con MediaPipe (píxeles float32 con precisión subpíxel)"""
+        landmarks = obtener_pool(**self.config_face_mesh).detectar(imagen_rgb)
+        if landmarks is None:
+            logger.debug("No se detectaron rostros en la imagen")
             return None
         
-        landmarks = resultados.multi_face_landmarks[0]
-        h, w, _ = imagen_rgb.shape
-        puntos = []
+        logger.debug("Detectados %s puntos faciales", len(landmarks))
+        return landmarks_a_pixeles(landmarks, imagen_rgb.shape)
+    
+    def recortar_region_rostro(self, imagen, puntos_faciales, margen=MARGEN_ROI_ROSTRO):
+        """
+        Recortar la imagen al rectángulo de los landmarks (más un margen) y trasladar
+        los puntos a coordenadas del recorte. Devuelve (recorte, puntos_recorte, (x0, y0)).
+        """
+        h, w = imagen.shape[:2]
+        puntos = np.asarray(puntos_faciales)
+        x0 = int(np.clip(puntos[:, 0].min() - margen, 0, w))
+        y0 = int(np.clip(puntos[:, 1].min() - margen, 0, h))
+        x1 = int(np.clip(puntos[:, 0].max() + margen + 1, 0, w))
+        y1 = int(np.clip(puntos[:, 1].max() + margen + 1, 0, h))
         
-        for landmark in landmarks.landmark:
-            x = int(landmark.x * w)
-            y = int(landmark.y * h)
-            puntos.append((x, y))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            # Rostro fuera del encuadre: trabajar sobre la imagen completa
+            return imagen, puntos, (0, 0)
         
-        print(f"Detectados {len(puntos)} puntos faciales")
-        return np.array(puntos)
+        return imagen[y0:y1, x0:x1], puntos - np.array([x0, y0]), (x0, y0)
     
     def obtener_mascara_facial_completa(self, imagen, puntos_faciales):
         """Crear máscara completa del rostro usando convex hull"""
@@ -139,6 +175,7 @@ class AnalizadorTonoPielMejorado:
         
         return regiones
     
+    @medir_etapa('mascara_piel')
     def crear_mascara_piel_precisa(self, imagen, puntos_faciales):
         """Crear máscara precisa de la piel del rostro"""
         h, w = imagen.shape[:2]
@@ -173,7 +210,7 @@ class AnalizadorTonoPielMejorado:
         
         return mascara_piel
     
-    def aplicar_correccion_iluminacion(self, imagen, mascara):
+    def aplicar_correccion_iluminacion(self, imagen, mascara, rejilla_clahe=(8, 8)):
         """Aplicar corrección de iluminación para normalizar el color"""
         # Obtener región de piel
         piel_region = cv2.bitwise_and(imagen, imagen, mask=mascara)
@@ -182,7 +219,7 @@ class AnalizadorTonoPielMejorado:
         lab = cv2.cvtColor(piel_region, cv2.COLOR_RGB2LAB)
         
         # Aplicar CLAHE para normalizar iluminación
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=rejilla_clahe)
         lab[:, :, 0] = clahe.apply(lab[:, :, 0])
         
         # Convertir de vuelta a RGB
@@ -190,87 +227,81 @@ class AnalizadorTonoPielMejorado:
         
         return imagen_corregida, mascara
     
-    def extraer_color_piel_mejorado(self, imagen, mascara):
-        """Extraer el color principal de la piel con muestreo mejorado"""
-        # Aplicar corrección de iluminación
-        imagen_corregida, mascara_corregida = self.aplicar_correccion_iluminacion(imagen, mascara)
-        
-        # Obtener coordenadas donde hay piel
-        coords = np.column_stack(np.where(mascara_corregida > 200))  # Usar umbral alto
-        
-        if len(coords) == 0:
-            print("No se encontraron coordenadas de piel en la máscara")
+    def muestrear_pixeles_piel(self, imagen, mascara, max_muestras):
+        """
+        Tomar muestras estratégicas (no aleatorias) de los píxeles de piel:
+        5 lotes contiguos repartidos uniformemente a lo largo de la máscara
+        """
+        # Índices planos donde hay piel (mismo orden fila-columna que np.where)
+        indices = np.flatnonzero(mascara > 200)  # Usar umbral alto
+        
+        if len(indices) == 0:
             return None
         
-        # Tomar muestras estratégicas (no aleatorias)
-        # Priorizar áreas centrales de las mejillas y frente
-        muestras_por_lote = min(1500, len(coords))
-        
         # Dividir en lotes para muestreo más representativo
         num_lotes = 5
-        muestras_por_lote = muestras_por_lote // num_lotes
+        muestras_por_lote = min(max_muestras, len(indices)) // num_lotes
+        inicios = np.arange(num_lotes) * (len(indices) // num_lotes)
+        seleccion = (inicios[:, None] + np.arange(muestras_por_lote)).ravel()
         
-        colores = []
+        return imagen.reshape(-1, imagen.shape[2])[indices[seleccion]]
+    
+    def mascara_colores_piel_validos(self, colores):
+        """
+        Máscara de colores válidos para piel humana en un array (N, 3) RGB uint8.
+        Las comparaciones con constantes son con signo y las diferencias entre
+        canales se calculan en uint8 (módulo 256), como en la regla original por píxel.
+        """
+        colores = np.asarray(colores, dtype=np.uint8)
+        r, g, b = colores[:, 0], colores[:, 1], colores[:, 2]
+        r16, g16, b16 = (c.astype(np.int16) for c in (r, g, b))
+        
+        # Excluir colores extremos: muy oscuros (pelo/sombra) o muy blancos (dientes/ojos)
+        validos = (r >= 20) & (g >= 20) & (b >= 20)
+        validos &= ~((r > 250) & (g > 250) & (b > 250))
+        
+        # Relación típica de colores de piel (R > G > B o R ≈ G > B)
+        validos &= (r16 >= g16 - 30) & (g16 >= b16 - 30)
+        
+        # Excluir colores no naturales (muy saturados)
+        max_diff = np.maximum(np.maximum(r - g, g - b), r - b)
+        validos &= max_diff <= 150
+        
+        return validos
+    
+    def extraer_color_piel_mejorado(self, imagen, mascara, max_muestras=None, rejilla_clahe=(8, 8)):
+        """Extraer el color principal de la piel con muestreo mejorado"""
+        if max_muestras is None:
+            max_muestras = self.max_muestras_piel
         
-        for i in range(num_lotes):
-            inicio = i * (len(coords) // num_lotes)
-            fin = inicio + muestras_por_lote
-            
-            if fin <= len(coords):
-                batch_coords = coords[inicio:fin]
-                
-                for y, x in batch_coords:
-                    color = imagen_corregida[y, x]
-                    # Filtrar colores extremos (posiblemente no piel)
-                    if self.es_color_piel_valido(color):
-                        colores.append(color)
-        
-        if len(colores) < 10:
-            print("Muy pocos colores de piel válidos encontrados")
+        # Aplicar corrección de iluminación
+        imagen_corregida, mascara_corregida = self.aplicar_correccion_iluminacion(imagen, mascara, rejilla_clahe)
+        
+        # Priorizar áreas centrales de las mejillas y frente
+        muestras = self.muestrear_pixeles_piel(imagen_corregida, mascara_corregida, max_muestras)
+        
+        if muestras is None:
+            logger.debug("No se encontraron coordenadas de piel en la máscara")
             return None
         
-        colores_array = np.array(colores)
+        # Filtrar colores extremos (posiblemente no piel)
+        colores_array = muestras[self.mascara_colores_piel_validos(muestras)]
         
-        # Usar K-Means para encontrar colores principales
-        n_clusters = min(3, len(colores_array))
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        labels = kmeans.fit_predict(colores_array)
+        if len(colores_array) < 10:
+            logger.debug("Muy pocos colores de piel válidos encontrados")
+            return None
         
-        # Encontrar el cluster más grande y más representativo
-        cluster_counts = Counter(labels)
-        cluster_principal = max(cluster_counts, key=cluster_counts.get)
-        tono_principal = kmeans.cluster_centers_[cluster_principal]
+        # Usar K-Means para encontrar colores principales y quedarse
+        # con el cluster más grande y más representativo
+        tono_principal, cluster_colors = color_dominante(colores_array, n_clusters=3, estimador=self.estimador_color)
         
         # Calcular desviación estándar para verificar consistencia
-        cluster_colors = colores_array[labels == cluster_principal]
         std_dev = np.std(cluster_colors, axis=0)
         
-        print(f"Color piel extraído: {tono_principal.astype(int)}, Desviación: {std_dev}")
+        logger.debug("Color piel extraído: %s, Desviación: %s", tono_principal.astype(int), std_dev)
         
         return tono_principal.astype(int).tolist()
     
-    def es_color_piel_valido(self, color_rgb):
-        """Verificar si un color es válido para piel humana"""
-        r, g, b = color_rgb
-        
-        # Excluir colores extremos
-        if r < 20 or g < 20 or b < 20:  # Muy oscuro (probablemente pelo/sombra)
-            return False
-        if r > 250 and g > 250 and b > 250:  # Muy blanco (probablemente dientes/ojos)
-            return False
-        
-        # Verificar relación típica de colores de piel
-        # En piel, generalmente R > G > B o R ≈ G > B
-        if not (r >= g - 30 and g >= b - 30):
-            return False
-        
-        # Excluir colores no naturales
-        max_diff = max(abs(r - g), abs(g - b), abs(r - b))
-        if max_diff > 150:  # Colores muy saturados
-            return False
-        
-        return True
-    
     def clasificar_tono_piel(self, color_rgb):
         """Clasificar el tono de piel en categorías mejoradas"""
         r, g, b = color_rgb
@@ -448,7 +479,7 @@ class AnalizadorTonoPielMejorado:
     def analizar_tono_piel(self, ruta_imagen):
         """Analizar tono de piel completo con método mejorado"""
         try:
-            print(f">>> Iniciando análisis de: {ruta_imagen}")
+            logger.debug("Iniciando análisis de: %s", ruta_imagen if isinstance(ruta_imagen, str) else 'imagen en memoria')
             
             # Cargar imagen
             imagen, imagen_rgb = self.cargar_imagen(ruta_imagen)
@@ -458,7 +489,7 @@ class AnalizadorTonoPielMejorado:
                     'error': 'No se pudo cargar la imagen'
                 }
             
-            print(">>> Imagen cargada correctamente")
+            logger.debug("Imagen cargada correctamente")
             
             # Detectar puntos faciales
             puntos_faciales = self.detectar_puntos_faciales(imagen_rgb)
@@ -468,52 +499,81 @@ class AnalizadorTonoPielMejorado:
                     'error': 'No se detectaron rostros en la imagen'
                 }
             
-            print(">>> Puntos faciales detectados")
+            logger.debug("Puntos faciales detectados")
+            
+            return self.analizar_tono_puntos(imagen_rgb, puntos_faciales)
+            
+        except Exception as e:
+            logger.error("Error en análisis: %s", e)
+            return {
+                'estado': 'error',
+                'error': f'Error en análisis: {str(e)}'
+            }
+    
+    def analizar_tono_puntos(self, imagen_rgb, puntos_faciales, escala_imagen=1.0):
+        """
+        Analizar tono de piel a partir de puntos ya detectados sobre la imagen sin voltear.
+        escala_imagen: tamaño de imagen_rgb respecto a la original (imagen de trabajo reducida)
+        """
+        try:
+            # Las máscaras se dibujan con OpenCV: puntos enteros redondeados
+            puntos_faciales = puntos_enteros(puntos_faciales)
+            # Todo el trabajo de máscaras e iluminación se hace sobre el recorte del rostro
+            h, w = imagen_rgb.shape[:2]
+            recorte, puntos_recorte, (x0, y0) = self.recortar_region_rostro(imagen_rgb, puntos_faciales)
+            alto_recorte, ancho_recorte = recorte.shape[:2]
             
             # Crear máscara de piel precisa
-            mascara = self.crear_mascara_piel_precisa(imagen_rgb, puntos_faciales)
+            mascara = self.crear_mascara_piel_precisa(recorte, puntos_recorte)
             
-            # Verificar que la máscara tenga suficiente área
+            # Verificar que la máscara tenga suficiente área (respecto a la imagen completa)
             area_piel = cv2.countNonZero(mascara)
-            area_total = mascara.shape[0] * mascara.shape[1]
+            area_total = h * w
             porcentaje_piel = (area_piel / area_total) * 100
             
-            print(f">>> Área de piel detectada: {area_piel} pixeles ({porcentaje_piel:.1f}%)")
+            logger.debug("Área de piel detectada: %s pixeles (%.1f%%)", area_piel, porcentaje_piel)
             
-            if area_piel < 1000:  # Mínimo de 1000 píxeles de piel
-                print(f">>> Advertencia: Área de piel insuficiente")
+            # Mínimo de AREA_PIEL_MINIMA píxeles de piel a resolución original
+            if area_piel < AREA_PIEL_MINIMA * escala_imagen ** 2:
+                logger.warning("Área de piel insuficiente")
                 # Intentar con máscara facial completa como respaldo
-                mascara = self.obtener_mascara_facial_completa(imagen_rgb, puntos_faciales)
+                mascara = self.obtener_mascara_facial_completa(recorte, puntos_recorte)
+            
+            # CLAHE con teselas del mismo tamaño en píxeles que sobre la imagen completa
+            rejilla_clahe = (max(1, round(8 * ancho_recorte / w)), max(1, round(8 * alto_recorte / h)))
             
             # Extraer color principal mejorado
-            color_piel = self.extraer_color_piel_mejorado(imagen_rgb, mascara)
+            color_piel = self.extraer_color_piel_mejorado(recorte, mascara, rejilla_clahe=rejilla_clahe)
             if color_piel is None:
                 return {
                     'estado': 'error',
                     'error': 'No se pudo extraer color de piel válido'
                 }
             
-            print(f">>> Color de piel extraído: {color_piel}")
+            logger.debug("Color de piel extraído: %s", color_piel)
             
             # Clasificar tono
             clasificacion = self.clasificar_tono_piel(color_piel)
-            print(f">>> Clasificación: {clasificacion['categoria']} - {clasificacion['subcategoria']}")
+            logger.debug("Clasificación: %s - %s", clasificacion['categoria'], clasificacion['subcategoria'])
             
             # Generar recomendaciones
             recomendaciones = self.generar_recomendaciones_colores(clasificacion)
             
             # Convertir imagen a base64 para visualización
             try:
-                # Crear imagen de visualización con máscara
-                imagen_visualizacion = imagen_rgb.copy()
-                imagen_visualizacion[mascara == 0] = [0, 0, 0]  # Hacer negro el fondo no piel
+                # Crear imagen de visualización con máscara (fondo no piel en negro);
+                # solo el recorte del rostro tiene contenido
+                imagen_visualizacion = np.zeros_like(imagen_rgb)
+                piel = mascara != 0
+                imagen_visualizacion[y0:y0 + alto_recorte, x0:x0 + ancho_recorte][piel] = recorte[piel]
                 
                 # Convertir a BGR para JPEG
-                imagen_visualizacion_bgr = cv2.cvtColor(imagen_visualizacion, cv2.COLOR_RGB2BGR)
-                _, buffer = cv2.imencode('.jpg', imagen_visualizacion_bgr)
-                imagen_base64 = base64.b64encode(buffer).decode('utf-8')
+                with metricas_etapas.medir('jpeg_base64_tono'):
+                    imagen_visualizacion_bgr = cv2.cvtColor(imagen_visualizacion, cv2.COLOR_RGB2BGR)
+                    _, buffer = cv2.imencode('.jpg', imagen_visualizacion_bgr)
+                    imagen_base64 = base64.b64encode(buffer).decode('utf-8')
             except Exception as e:
-                print(f">>> Error generando imagen base64: {e}")
+                logger.error("Error generando imagen base64: %s", e)
                 imagen_base64 = None
             
             return {
@@ -527,7 +587,7 @@ class AnalizadorTonoPielMejorado:
             }
             
         except Exception as e:
-            print(f">>> Error en análisis: {str(e)}")
+            logger.error("Error en análisis: %s", e)
             return {
                 'estado': 'error',
                 'error': f'Error en análisis: {str(e)}'
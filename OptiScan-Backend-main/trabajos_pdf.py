@@ -0,0 +1,243 @@
+# trabajos_pdf.py - Cola de trabajos en segundo plano para generar PDFs sin bloquear los workers de Flask.
+# Los trabajos y sus PDFs viven en la memoria del worker que los encoló: los job_id solo son válidos
+# en ese worker (un único worker de gunicorn). Un id de otro worker se reconoce por su prefijo
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from identificadores import nuevo_id
+from registro import obtener_logger
+
+logger = obtener_logger('trabajos_pdf')
+
+# Hilos que generan PDFs, trabajos en espera admitidos, segundos que se conserva un resultado
+# y trabajos terminados retenidos como máximo (con sus PDFs en memoria) aunque no hayan caducado
+TRABAJADORES_POR_DEFECTO = int(os.environ.get("PDF_TRABAJADORES", 2))
+COLA_MAX_POR_DEFECTO = int(os.environ.get("PDF_COLA_MAX", 16))
+TTL_TRABAJOS_POR_DEFECTO = float(os.environ.get("PDF_TRABAJOS_TTL", 600))
+TERMINADOS_MAX_POR_DEFECTO = int(os.environ.get("PDF_TERMINADOS_MAX", 64))
+
+# Duraciones recientes usadas para los percentiles de las métricas
+MUESTRAS_DURACION = 200
+
+PENDIENTE = 'pendiente'
+EN_PROCESO = 'en_proceso'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+
+class ColaLlena(Exception):
+    """La cola de trabajos alcanzó su capacidad máxima"""
+
+
+class TrabajoPDF:
+    """Estado de un trabajo: la función a ejecutar, su resultado (bytes del PDF) o el error"""
+
+    def __init__(self, funcion, descripcion=''):
+        self.id = nuevo_id()
+        self.funcion = funcion
+        self.descripcion = descripcion
+        self.estado = PENDIENTE
+        self.resultado = None
+        self.error = None
+        self.creado = time.time()
+        self.iniciado = None
+        self.terminado = None
+        self._listo = threading.Event()
+        # Contexto de la solicitud que lo encola: los logs del trabajo conservan su id de solicitud
+        self.contexto = contextvars.copy_context()
+
+    @property
+    def finalizado(self):
+        return self.estado in (COMPLETADO, ERROR)
+
+    def esperar(self, timeout):
+        """Bloquear hasta que el trabajo termine o pase el timeout; devuelve si terminó"""
+        return self._listo.wait(timeout)
+
+    def a_dict(self):
+        """Estado serializable para el endpoint de consulta (sin los bytes del PDF)"""
+        datos = {
+            'job_id': self.id,
+            'estado': self.estado,
+            'creado': self.creado,
+        }
+        if self.iniciado is not None:
+            datos['espera_segundos'] = round(self.iniciado - self.creado, 3)
+        if self.terminado is not None:
+            datos['duracion_segundos'] = round(self.terminado - self.iniciado, 3)
+        if self.estado == COMPLETADO:
+            datos['tamano_bytes'] = len(self.resultado)
+        if self.error:
+            datos['error'] = self.error
+        return datos
+
+
+class ColaTrabajosPDF:
+    """
+    Pool de hilos locales que consume una cola acotada de trabajos de PDF.
+    enviar() devuelve el trabajo al instante; el cliente consulta su estado
+    (con espera larga opcional) y descarga el resultado cuando está completado.
+    """
+
+    def __init__(self, trabajadores=TRABAJADORES_POR_DEFECTO, cola_max=COLA_MAX_POR_DEFECTO,
+                 ttl_segundos=TTL_TRABAJOS_POR_DEFECTO, terminados_max=TERMINADOS_MAX_POR_DEFECTO):
+        self.num_trabajadores = max(1, int(trabajadores))
+        self.cola_max = max(1, int(cola_max))
+        self.ttl_segundos = ttl_segundos
+        self.terminados_max = max(1, int(terminados_max))
+        self._cola = queue.Queue(maxsize=self.cola_max)
+        self._trabajos = {}
+        self._lock = threading.Lock()
+        self._hilos = []
+
+        # Métricas para dimensionar el número de trabajadores
+        self.enviados = 0
+        self.completados = 0
+        self.fallidos = 0
+        self.rechazados = 0
+        self.descartados = 0  # terminados eliminados antes de caducar por superar terminados_max
+        self.en_proceso = 0
+        self._duraciones = deque(maxlen=MUESTRAS_DURACION)
+        self._esperas = deque(maxlen=MUESTRAS_DURACION)
+        # Los hilos no sobreviven al fork: cada worker arranca los suyos con su primer trabajo
+        os.register_at_fork(after_in_child=self._reiniciar_tras_fork)
+
+    def _reiniciar_tras_fork(self):
+        self._cola = queue.Queue(maxsize=self.cola_max)
+        self._trabajos = {}
+        self._lock = threading.Lock()
+        self._hilos = []
+        self.en_proceso = 0
+
+    def iniciar(self):
+        """Arrancar los hilos trabajadores (idempotente)"""
+        with self._lock:
+            if self._hilos:
+                return
+            for i in range(self.num_trabajadores):
+                hilo = threading.Thread(target=self._bucle_trabajador, name=f"pdf-trabajador-{i}", daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+        logger.info("Cola de PDFs iniciada (%s trabajadores, capacidad %s)", self.num_trabajadores, self.cola_max)
+
+    def enviar(self, funcion, descripcion=''):
+        """Encolar funcion() (debe devolver los bytes del PDF). Lanza ColaLlena si no hay hueco"""
+        self.iniciar()
+        self._purgar_caducados()
+        trabajo = TrabajoPDF(funcion, descripcion)
+        with self._lock:
+            try:
+                self._cola.put_nowait(trabajo)
+            except queue.Full:
+                self.rechazados += 1
+                raise ColaLlena(f"Cola de PDFs llena ({self.cola_max} trabajos en espera)")
+            self._trabajos[trabajo.id] = trabajo
+            self.enviados += 1
+        return trabajo
+
+    def obtener(self, job_id):
+        """Devolver el trabajo o None si no existe o ya caducó"""
+        self._purgar_caducados()
+        with self._lock:
+            return self._trabajos.get(job_id)
+
+    def _bucle_trabajador(self):
+        while True:
+            trabajo = self._cola.get()
+            try:
+                trabajo.contexto.run(self._ejecutar, trabajo)
+            finally:
+                self._cola.task_done()
+
+    def _ejecutar(self, trabajo):
+        trabajo.iniciado = time.time()
+        trabajo.estado = EN_PROCESO
+        with self._lock:
+            self.en_proceso += 1
+            self._esperas.append(trabajo.iniciado - trabajo.creado)
+
+        try:
+            resultado = trabajo.funcion()
+            if not resultado:
+                raise RuntimeError('PDF vacío generado')
+            trabajo.resultado = resultado
+            trabajo.estado = COMPLETADO
+        except Exception as e:
+            logger.error("Trabajo PDF %s fallido: %s", trabajo.id, e)
+            trabajo.error = str(e)
+            trabajo.estado = ERROR
+        finally:
+            trabajo.terminado = time.time()
+            trabajo.funcion = None  # liberar la imagen o el análisis capturados
+            with self._lock:
+                self.en_proceso -= 1
+                if trabajo.estado == COMPLETADO:
+                    self.completados += 1
+                else:
+                    self.fallidos += 1
+                self._duraciones.append(trabajo.terminado - trabajo.iniciado)
+                self._limitar_terminados()
+            trabajo._listo.set()
+
+        logger.debug("Trabajo PDF %s %s en %.2fs", trabajo.id, trabajo.estado, trabajo.terminado - trabajo.iniciado)
+
+    def _purgar_caducados(self):
+        """Eliminar los trabajos terminados hace más de ttl_segundos (y sus PDFs)"""
+        limite = time.time() - self.ttl_segundos
+        with self._lock:
+            caducados = [job_id for job_id, trabajo in self._trabajos.items()
+                         if trabajo.finalizado and trabajo.terminado < limite]
+            for job_id in caducados:
+                del self._trabajos[job_id]
+
+    def _limitar_terminados(self):
+        """Descartar los trabajos terminados más antiguos por encima de terminados_max (con el lock tomado)"""
+        terminados = [trabajo for trabajo in self._trabajos.values() if trabajo.finalizado]
+        exceso = len(terminados) - self.terminados_max
+        if exceso <= 0:
+            return
+        for trabajo in sorted(terminados, key=lambda t: t.terminado)[:exceso]:
+            del self._trabajos[trabajo.id]
+        self.descartados += exceso
+        logger.debug("Descartados %s trabajos PDF terminados (máximo %s retenidos)", exceso, self.terminados_max)
+
+    @staticmethod
+    def _resumen(valores):
+        """Media, p50, p95 y máximo (en segundos) de una serie de duraciones"""
+        if not valores:
+            return {'muestras': 0}
+        ordenados = sorted(valores)
+
+        def percentil(p):
+            return round(ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))], 3)
+
+        return {
+            'muestras': len(ordenados),
+            'media': round(sum(ordenados) / len(ordenados), 3),
+            'p50': percentil(0.5),
+            'p95': percentil(0.95),
+            'max': round(ordenados[-1], 3),
+        }
+
+    def estadisticas(self):
+        """Profundidad de cola, contadores y duraciones recientes para /health y /pdf-jobs/metrics"""
+        with self._lock:
+            return {
+                'trabajadores': self.num_trabajadores,
+                'profundidad_cola': self._cola.qsize(),
+                'capacidad_cola': self.cola_max,
+                'en_proceso': self.en_proceso,
+                'enviados': self.enviados,
+                'completados': self.completados,
+                'fallidos': self.fallidos,
+                'rechazados': self.rechazados,
+                'descartados': self.descartados,
+                'trabajos_retenidos': len(self._trabajos),
+                'terminados_max': self.terminados_max,
+                'duracion_segundos': self._resumen(self._duraciones),
+                'espera_segundos': self._resumen(self._esperas),
+            }